@@ -0,0 +1,77 @@
+"""
+Benchmark: multi-commit file-history block assembly.
+
+Compares the previous scaffold + per-commit str.replace approach (quadratic in total
+patch size) with the single-pass build_multi_commit_diff_block(..., patches).
+
+    python -m benchmarks.bench_multi_commit_block [--commits 500] [--patch-kb 50]
+"""
+import argparse
+import json
+import random
+import string
+import time
+
+from pr_reviewer.file_history_tab import build_multi_commit_diff_block
+
+
+def synth_commits(n_commits: int, patch_kb: int, seed: int = 7):
+    rnd = random.Random(seed)
+    line = "+" + "".join(rnd.choice(string.ascii_letters) for _ in range(79)) + "\n"
+    patch = "@@ -1,1 +1,1 @@\n" + line * max(1, (patch_kb * 1024) // len(line))
+    commits, patches = [], {}
+    for i in range(n_commits):
+        sha = f"{i:040x}"
+        commits.append({
+            "sha": sha,
+            "commit": {"author": {"name": f"dev{i % 7}", "date": "2025-06-26T13:24:23Z"},
+                       "message": f"Change {i}\n\nbody"},
+        })
+        patches[sha] = (patch, [f"src/other_{i}_{k}.py" for k in range(i % 4)])
+    return commits, patches
+
+
+def legacy_build(commits, file_path, patches):
+    combined = build_multi_commit_diff_block(commits, file_path)
+    for c in commits:
+        sha_full = c["sha"][:40]
+        patch, others = patches[sha_full]
+        combined = combined.replace(f"[[PATCH::{sha_full}]]", patch or "(No patch for this file in this commit)")
+        if others:
+            others_block = "Other files modified:\n" + "\n".join(f"- {o}" for o in others)
+            combined = combined.replace(f"[[OTHERS::{sha_full}]]", others_block)
+        else:
+            combined = combined.replace(f"[[OTHERS::{sha_full}]]", "")
+    return combined
+
+
+def run(n_commits: int = 500, patch_kb: int = 50) -> dict:
+    commits, patches = synth_commits(n_commits, patch_kb)
+    path = "src/module/file.py"
+
+    t0 = time.perf_counter()
+    fast = build_multi_commit_diff_block(commits, path, patches)
+    t_fast = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    slow = legacy_build(commits, path, patches)
+    t_slow = time.perf_counter() - t0
+
+    assert fast == slow, "single-pass output differs from legacy scaffold output"
+    return {
+        "benchmark": "multi_commit_block",
+        "commits": n_commits,
+        "patch_kb": patch_kb,
+        "output_mb": round(len(fast) / (1024 * 1024), 2),
+        "single_pass_s": round(t_fast, 4),
+        "legacy_replace_s": round(t_slow, 4),
+        "speedup": round(t_slow / t_fast, 1) if t_fast else None,
+    }
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--commits", type=int, default=500)
+    ap.add_argument("--patch-kb", type=int, default=50)
+    args = ap.parse_args()
+    print(json.dumps(run(args.commits, args.patch_kb), indent=2))
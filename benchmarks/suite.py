@@ -0,0 +1,328 @@
+"""
+Benchmark suite for the review pipeline hot paths, on synthetic diffs.
+
+    python -m benchmarks.suite [--profile quick|default|full] [--out results.json]
+                               [--baseline benchmarks/baseline.json] [--save-baseline]
+                               [--tolerance 0.25] [--fail-on-regression] [--only NAME ...]
+
+Profiles: quick (1 KB-1 MB, up to 1k files), default (up to 10 MB / 10k files), full (adds 100 MB).
+Every case reports wall time (best of N), throughput (MB/s or ops/s) and peak Python memory
+(tracemalloc). Results are printed as JSON; with a baseline they are compared case by case, and a
+case regresses when its throughput drops or its peak memory grows by more than the tolerance.
+The full-review cases run the ensemble against the in-process mock gateway (see
+pr_reviewer.mock_gateway), so no network access or credentials are needed.
+"""
+import os
+import sys
+import json
+import time
+import random
+import platform
+import argparse
+import tempfile
+import tracemalloc
+from contextlib import contextmanager
+
+from pr_reviewer.config import DEFAULT_CONFIG
+from pr_reviewer.github_api import filter_out_generated_diffs
+from pr_reviewer.diff_utils import chunk_text, extract_changed_files
+from pr_reviewer.report import markdown_to_html_light, normalize_model_html, wrap_full_report
+from pr_reviewer.file_history_tab import normalize_model_fragment
+from pr_reviewer import storage
+
+from benchmarks import bench_multi_commit_block
+
+KB, MB = 1024, 1024 * 1024
+
+PROFILES = {
+    "quick": {"diff_sizes": [1 * KB, 1 * MB], "file_counts": [1, 100, 1000],
+              "review_sizes": [1 * KB, 64 * KB], "index_entries": [100, 1000], "repeat": 3},
+    "default": {"diff_sizes": [1 * KB, 1 * MB, 10 * MB], "file_counts": [1, 100, 1000, 10000],
+                "review_sizes": [1 * KB, 64 * KB, 512 * KB], "index_entries": [100, 1000, 10000], "repeat": 3},
+    "full": {"diff_sizes": [1 * KB, 1 * MB, 10 * MB, 100 * MB], "file_counts": [1, 100, 1000, 10000],
+             "review_sizes": [1 * KB, 64 * KB, 512 * KB, 2 * MB], "index_entries": [100, 1000, 10000], "repeat": 2},
+}
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+
+# ---------------------------- Synthetic inputs ----------------------------
+def synth_diff(total_bytes: int, n_files: int, generated_every: int = 10, seed: int = 7) -> str:
+    """Unified diff of roughly `total_bytes` over `n_files`; every `generated_every`-th file looks generated."""
+    rnd = random.Random(seed)
+    per_file = max(200, total_bytes // max(1, n_files))
+    blocks, size = [], 0
+    for i in range(n_files):
+        if generated_every and i % generated_every == generated_every - 1:
+            path = f"src/gen/api_{i}_pb2.py"
+            body = ["# Code generated by protoc. DO NOT EDIT."]
+        else:
+            path = f"src/pkg{i % 50}/module_{i}.py"
+            body = []
+        header = (f"diff --git a/{path} b/{path}\nindex 1111111..2222222 100644\n"
+                  f"--- a/{path}\n+++ b/{path}\n@@ -1,40 +1,42 @@\n")
+        lines, n = [], len(header)
+        for line in body:
+            lines.append("+" + line + "\n")
+        while n < per_file:
+            sign = rnd.choice(" +-")
+            ln = f"{sign}    value_{rnd.randrange(10**6)} = compute(arg_{rnd.randrange(100)}, flag=True)\n"
+            lines.append(ln)
+            n += len(ln)
+        block = header + "".join(lines)
+        blocks.append(block)
+        size += len(block)
+        if size >= total_bytes and i + 1 >= n_files:
+            break
+    return "".join(blocks)
+
+
+def synth_markdown_review(total_bytes: int, seed: int = 7) -> str:
+    rnd = random.Random(seed)
+    parts, n = [], 0
+    while n < total_bytes:
+        k = rnd.randrange(1000)
+        section = (
+            f"## Change Summary by File\n- `src/module_{k}.py`: refactors the loader\n"
+            f"1. Adds retry around fetch_{k}\n2. Removes dead code\n\n"
+            f"### Review Table\nThe handler for item {k} ignores the timeout.\n\n"
+            f"    code_sample_{k}()\n\n"
+        )
+        parts.append(section)
+        n += len(section)
+    return "".join(parts)
+
+
+# ---------------------------- Measurement ----------------------------
+def measure(fn, repeat: int) -> dict:
+    """Best wall time over `repeat` runs, then one extra run under tracemalloc for peak memory."""
+    best = float("inf")
+    for _ in range(max(1, repeat)):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"seconds": best, "peak_mb": peak / MB}
+
+
+def _result(name: str, params: dict, m: dict, nbytes: int | None = None, ops: int | None = None) -> dict:
+    out = {"name": name, "params": params, "seconds": round(m["seconds"], 6), "peak_mb": round(m["peak_mb"], 3)}
+    if nbytes is not None:
+        out["mb_per_s"] = round(nbytes / MB / m["seconds"], 3) if m["seconds"] else None
+    if ops is not None:
+        out["ops_per_s"] = round(ops / m["seconds"], 3) if m["seconds"] else None
+    return out
+
+
+# ---------------------------- Cases ----------------------------
+def bench_diff_paths(profile: dict) -> list[dict]:
+    cfg = dict(DEFAULT_CONFIG)
+    results = []
+    for size in profile["diff_sizes"]:
+        for n_files in profile["file_counts"]:
+            if size // n_files < 200:
+                continue  # not a meaningful diff (less than a header per file)
+            diff = synth_diff(size, n_files)
+            params = {"diff_bytes": size, "files": n_files}
+            results.append(_result("filter_out_generated_diffs", params,
+                                   measure(lambda d=diff: filter_out_generated_diffs(d, cfg), profile["repeat"]),
+                                   nbytes=len(diff)))
+            results.append(_result("chunk_text", params,
+                                   measure(lambda d=diff: chunk_text(d, max_chars=12000), profile["repeat"]),
+                                   nbytes=len(diff)))
+            results.append(_result("extract_changed_files", params,
+                                   measure(lambda d=diff: extract_changed_files(d), profile["repeat"]),
+                                   nbytes=len(diff)))
+            diff = None  # free the largest diff before the next size is generated
+    return results
+
+
+def bench_rendering(profile: dict) -> list[dict]:
+    results = []
+    for size in profile["review_sizes"]:
+        md = synth_markdown_review(size)
+        params = {"review_bytes": size}
+        results.append(_result("markdown_to_html_light", params,
+                               measure(lambda: markdown_to_html_light(md), profile["repeat"]), nbytes=len(md)))
+        results.append(_result("normalize_model_html", params,
+                               measure(lambda: normalize_model_html(md), profile["repeat"]), nbytes=len(md)))
+        results.append(_result("normalize_model_fragment", params,
+                               measure(lambda: normalize_model_fragment(md), profile["repeat"]), nbytes=len(md)))
+
+        fragment = normalize_model_html(md)
+        sections = [(f"model-{k}", fragment) for k in range(6)] + [("failed-model", "")]
+        total = len(fragment) * 6
+        results.append(_result("wrap_full_report", {"review_bytes": size, "models": 6},
+                               measure(lambda: wrap_full_report(
+                                   "Bench", "https://github.com/o/r/pull/1", "o", "r", 1,
+                                   sections, {"failed-model": "boom"}, None), profile["repeat"]),
+                               nbytes=total))
+    return results
+
+
+def bench_index(profile: dict) -> list[dict]:
+    """storage.load_index / save_index on a throwaway store directory."""
+    results = []
+    saved = (storage.STORE_DIR, storage.INDEX_PATH)
+    with tempfile.TemporaryDirectory() as tmp:
+        storage.STORE_DIR, storage.INDEX_PATH = tmp, os.path.join(tmp, "index.json")
+        try:
+            for n in profile["index_entries"]:
+                index = {"items": [
+                    {"id": f"{k:08x}", "pr_url": f"https://github.com/o/r/pull/{k}", "title": f"PR {k}",
+                     "owner": "o", "repo": "r", "number": k, "models": ["a", "b", "c"],
+                     "html_path": f"/tmp/r-{k}.html", "created_at": "2025-01-01 00:00:00"}
+                    for k in range(n)
+                ]}
+                storage.save_index(index)
+                results.append(_result("index_save", {"entries": n},
+                                       measure(lambda: storage.save_index(index), profile["repeat"]), ops=1))
+                results.append(_result("index_load", {"entries": n},
+                                       measure(storage.load_index, profile["repeat"]), ops=1))
+        finally:
+            storage.STORE_DIR, storage.INDEX_PATH = saved
+    return results
+
+
+@contextmanager
+def isolated_store(tmp: str):
+    """Points the store paths the review pipeline writes to (reports, index, traces, model health) at `tmp`."""
+    from pr_reviewer import pipeline, report
+    from pr_reviewer.model_health import HEALTH
+
+    patches = [(storage, "STORE_DIR", tmp), (storage, "INDEX_PATH", os.path.join(tmp, "index.json")),
+               (pipeline, "STORE_DIR", tmp), (pipeline, "TRACE_DIR", os.path.join(tmp, "traces")),
+               (report, "STORE_DIR", tmp), (HEALTH, "path", os.path.join(tmp, "model_health.json")),
+               (HEALTH, "_models", {})]
+    saved = [(obj, name, getattr(obj, name)) for obj, name, _ in patches]
+    for obj, name, value in patches:
+        setattr(obj, name, value)
+    try:
+        yield
+    finally:
+        for obj, name, value in saved:
+            setattr(obj, name, value)
+
+
+def bench_full_review(profile: dict) -> list[dict]:
+    """
+    pipeline.run_review (4 models in parallel + pipelined base synthesis, report, index entry)
+    against the in-process mock gateway, with the PR served by the replay SCM provider and
+    everything written to a throwaway store directory.
+    """
+    from pr_reviewer.mock_gateway import start_mock_gateway
+    from pr_reviewer.pipeline import run_review
+
+    server, base = start_mock_gateway(profile={"time_scale": 0.001, "seed": 7})
+    models = ["mixtral-8x7b-instruct-v01", "mistral-7b-instruct-v03", "phi-3-5-moe-instruct", "codellama-13b-instruct"]
+    results = []
+    try:
+        with tempfile.TemporaryDirectory() as tmp, isolated_store(tmp):
+            for size in profile["review_sizes"]:
+                pr_url = f"https://github.com/bench/repo/pull/{size}"
+                fixtures = os.path.join(tmp, f"scm-{size}.json")
+                with open(fixtures, "w", encoding="utf-8") as f:
+                    json.dump({"get_pr_diff": {pr_url: synth_diff(size, max(1, size // (4 * KB)), generated_every=0)},
+                               "get_pr_meta": {pr_url: {"title": "Benchmark PR", "user": {"login": "bench"},
+                                                        "head": {"sha": "0" * 40}}}}, f)
+                cfg = dict(DEFAULT_CONFIG, gateway_base=base, token_mode="preissued", aia_access_token="mock",
+                           enable_pki_zip_patch=False, circuit_breaker=False, hedge_requests=False,
+                           scm_provider="replay", scm_fixtures=fixtures, selected_models=models,
+                           parallel_models=True, synthesis=True, synthesis_model="llama-3-3-70b-instruct",
+                           github_review_publish=False, profile_reviews=False)
+                results.append(_result("full_review_mock_gateway", {"diff_bytes": size, "models": len(models)},
+                                       measure(lambda c=cfg, u=pr_url: run_review(c, u), 1), nbytes=size, ops=1))
+    finally:
+        server.shutdown()
+    return results
+
+
+def bench_file_history(profile: dict) -> list[dict]:
+    n = {"quick": 100, "default": 500, "full": 2000}.get(profile["name"], 500)
+    r = bench_multi_commit_block.run(n, 20)
+    return [{"name": "multi_commit_block", "params": {"commits": n, "patch_kb": 20},
+             "seconds": r["single_pass_s"], "peak_mb": None,
+             "mb_per_s": round(r["output_mb"] / r["single_pass_s"], 3) if r["single_pass_s"] else None}]
+
+
+CASES = {
+    "diff": bench_diff_paths,
+    "render": bench_rendering,
+    "index": bench_index,
+    "review": bench_full_review,
+    "filehistory": bench_file_history,
+}
+
+
+# ---------------------------- Baseline comparison ----------------------------
+def _case_key(r: dict) -> str:
+    return r["name"] + json.dumps(r["params"], sort_keys=True)
+
+
+def compare(results: list[dict], baseline: list[dict], tolerance: float) -> list[dict]:
+    base = {_case_key(r): r for r in baseline}
+    regressions = []
+    for r in results:
+        b = base.get(_case_key(r))
+        if not b:
+            continue
+        for metric in ("mb_per_s", "ops_per_s"):
+            if r.get(metric) and b.get(metric) and r[metric] < b[metric] * (1 - tolerance):
+                regressions.append({"case": _case_key(r), "metric": metric, "baseline": b[metric], "now": r[metric]})
+        if r.get("peak_mb") and b.get("peak_mb") and r["peak_mb"] > b["peak_mb"] * (1 + tolerance) + 0.5:
+            regressions.append({"case": _case_key(r), "metric": "peak_mb", "baseline": b["peak_mb"], "now": r["peak_mb"]})
+    return regressions
+
+
+def run(profile_name: str = "quick", only: list[str] | None = None) -> dict:
+    profile = dict(PROFILES[profile_name], name=profile_name)
+    results = []
+    for name, fn in CASES.items():
+        if only and name not in only:
+            continue
+        results.extend(fn(profile))
+    return {
+        "meta": {
+            "profile": profile_name,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        },
+        "results": results,
+    }
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--profile", choices=sorted(PROFILES), default="quick")
+    ap.add_argument("--only", nargs="*", choices=sorted(CASES), help="run only these case groups")
+    ap.add_argument("--out", help="write the JSON report here as well")
+    ap.add_argument("--baseline", default=DEFAULT_BASELINE)
+    ap.add_argument("--save-baseline", action="store_true", help="store this run as the baseline")
+    ap.add_argument("--tolerance", type=float, default=0.25)
+    ap.add_argument("--fail-on-regression", action="store_true")
+    args = ap.parse_args()
+
+    report = run(args.profile, args.only)
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            report["regressions"] = compare(report["results"], json.load(f).get("results") or [], args.tolerance)
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(text)
+    return 1 if args.fail_on_regression and report.get("regressions") else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,6 +1,14 @@
+import argparse
 
 from pr_reviewer.ui import App
+from pr_reviewer.profiling import enable_profiling
 
 if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="PR Reviewer")
+    ap.add_argument("--profile", action="store_true",
+                    help="capture cProfile + tracemalloc for every review (saved next to the report)")
+    args = ap.parse_args()
+    if args.profile:
+        enable_profiling()
     app = App()
     app.mainloop()
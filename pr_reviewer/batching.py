@@ -0,0 +1,79 @@
+import threading
+import contextvars
+from concurrent.futures import Future
+
+from .tracing import TRACER
+
+
+class MicroBatcher:
+    """
+    Groups small requests that share a key (e.g. the model name) for a short time window
+    and hands them to `flush_fn(key, payloads, contexts)` as one batch. `flush_fn` returns one
+    result per payload, in order; an Exception instance in that list fails only its own request.
+
+    A batch is flushed when the window elapses or as soon as it reaches `max_items` or `max_chars`.
+    Each request's context (trace span, usage ledger) is captured at submit time and passed in
+    `contexts`, so per-request work can run in it with `contexts[i].run(...)`. The flush itself runs
+    in a copy of the first submitter's context, in a "micro_batch.flush" span linked to every
+    submitter's span.
+    """
+
+    def __init__(self, flush_fn, window_s: float = 0.25, max_items: int = 8, max_chars: int = 24000):
+        self._flush_fn = flush_fn
+        self.window_s = window_s
+        self.max_items = max_items
+        self.max_chars = max_chars
+        self._lock = threading.Lock()
+        self._buckets: dict = {}  # key -> {"items": [(payload, future)], "chars": int}
+
+    def submit(self, key, payload, size: int) -> Future:
+        fut: Future = Future()
+        full = None
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = {"items": [], "chars": 0}
+                self._buckets[key] = bucket
+                timer = threading.Timer(self.window_s, self._flush_window, args=(key, bucket))
+                timer.daemon = True
+                timer.start()
+            bucket["items"].append((payload, fut, contextvars.copy_context()))
+            bucket["chars"] += size
+            if len(bucket["items"]) >= self.max_items or bucket["chars"] >= self.max_chars:
+                full = self._buckets.pop(key)
+        if full is not None:
+            threading.Thread(target=self._run, args=(key, full["items"]), daemon=True).start()
+        return fut
+
+    def pending(self) -> int:
+        """Requests waiting for their batch to flush."""
+        with self._lock:
+            return sum(len(b["items"]) for b in self._buckets.values())
+
+    def _flush_window(self, key, bucket):
+        with self._lock:
+            # The bucket may already have been flushed because it filled up
+            if self._buckets.get(key) is not bucket:
+                return
+            self._buckets.pop(key)
+        self._run(key, bucket["items"])
+
+    def _run(self, key, items):
+        payloads, contexts = [p for p, _, _ in items], [c for _, _, c in items]
+        submitters = [c.run(TRACER.current) for c in contexts]
+        try:
+            results = contexts[0].copy().run(self._flush_traced, key, payloads, contexts, submitters)
+        except Exception as e:
+            results = [e] * len(items)
+        for (_, fut, _), res in zip(items, results):
+            if isinstance(res, Exception):
+                fut.set_exception(res)
+            else:
+                fut.set_result(res)
+
+    def _flush_traced(self, key, payloads, contexts, submitters):
+        with TRACER.span("micro_batch.flush", links=submitters, batch_size=len(payloads)) as sp:
+            if sp:
+                for s in submitters:  # back-links from the other requests' traces to the shared flush
+                    s.set(batch_trace_id=sp.trace_id, batch_span_id=sp.span_id)
+            return self._flush_fn(key, payloads, contexts)
@@ -0,0 +1,126 @@
+import os
+import re
+import gzip
+import json
+import threading
+
+from .storage import STORE_DIR
+
+COMMIT_STORE_DIR = os.path.join(STORE_DIR, "commit_store")
+
+_FULL_SHA_RE = re.compile(r"^[0-9a-f]{40}$")
+
+
+def is_full_sha(sha: str) -> bool:
+    return bool(_FULL_SHA_RE.match(sha or ""))
+
+
+class CommitStore:
+    """
+    Content-addressed store of commit detail JSON (GET /repos/{o}/{r}/commits/{sha}).
+    Commits are immutable, so entries never go stale; each is kept gzip-compressed as
+    <root>/<sha[:2]>/<sha>.json.gz. The total size is capped and the least recently read
+    entries are evicted first (recency is tracked through the file mtime, which every hit bumps).
+    """
+
+    def __init__(self, root: str = COMMIT_STORE_DIR, max_bytes: int = 256 * 1024 * 1024):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._index: dict[str, list] | None = None  # sha -> [size, last_used]
+        self._total = 0
+
+    def _path(self, sha: str) -> str:
+        return os.path.join(self.root, sha[:2], sha + ".json.gz")
+
+    def _ensure_index(self):
+        if self._index is not None:
+            return
+        self._index, self._total = {}, 0
+        if not os.path.isdir(self.root):
+            return
+        for sub in os.listdir(self.root):
+            d = os.path.join(self.root, sub)
+            if not os.path.isdir(d):
+                continue
+            for name in os.listdir(d):
+                if not name.endswith(".json.gz"):
+                    continue
+                try:
+                    st = os.stat(os.path.join(d, name))
+                except OSError:
+                    continue
+                self._index[name[:-len(".json.gz")]] = [st.st_size, st.st_mtime]
+                self._total += st.st_size
+
+    def get(self, sha: str) -> dict | None:
+        if not is_full_sha(sha):
+            return None
+        path = self._path(sha)
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        with self._lock:
+            self._ensure_index()
+            try:
+                os.utime(path)
+                if sha in self._index:
+                    self._index[sha][1] = os.stat(path).st_mtime
+            except OSError:
+                pass
+        return data
+
+    def put(self, sha: str, obj: dict):
+        if not is_full_sha(sha):
+            return  # only immutable, fully-qualified SHAs are stored
+        path = self._path(sha)
+        payload = gzip.compress(json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+        with self._lock:
+            self._ensure_index()
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp = f"{path}.{threading.get_ident()}.tmp"
+                with open(tmp, "wb") as f:
+                    f.write(payload)
+                os.replace(tmp, path)
+            except OSError as e:
+                print(f"[WARN] Could not store commit {sha[:7]}: {e}")
+                return
+            old = self._index.get(sha)
+            if old:
+                self._total -= old[0]
+            self._index[sha] = [len(payload), os.stat(path).st_mtime]
+            self._total += len(payload)
+            self._evict(keep=sha)
+
+    def _evict(self, keep: str):
+        if self._total <= self.max_bytes:
+            return
+        for sha, (size, _) in sorted(self._index.items(), key=lambda kv: kv[1][1]):
+            if self._total <= self.max_bytes:
+                break
+            if sha == keep:
+                continue
+            try:
+                os.remove(self._path(sha))
+            except OSError:
+                pass
+            self._total -= size
+            del self._index[sha]
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._ensure_index()
+            return {"entries": len(self._index), "bytes": self._total, "max_bytes": self.max_bytes}
+
+
+COMMIT_STORE = CommitStore()
+
+
+def configure_commit_store(cfg: dict):
+    """Applies cfg["commit_store_max_mb"] to the shared store."""
+    mb = cfg.get("commit_store_max_mb")
+    if mb:
+        COMMIT_STORE.max_bytes = int(float(mb) * 1024 * 1024)
@@ -15,6 +15,15 @@ DEFAULT_CONFIG = {
     "scope": "",
     # GitHub
     "github_token": "",
+    # SCM provider: "github", "record" (github + write answers to scm_fixtures) or "replay" (offline, from scm_fixtures)
+    "scm_provider": "github",
+    "scm_fixtures": "",
+    "github_max_workers": 8,  # concurrent GitHub requests (e.g. per-commit patch fetches)
+    "commit_store_max_mb": 256,  # local store of immutable commit JSON (LRU-evicted above this)
+    # Local git mirror backend: serve PR diffs, file history and commit patches from a bare mirror
+    "git_mirror": False,
+    "git_mirror_remote": "",  # clone URL template; blank = https://{host}/{owner}/{repo}.git (a local path works too)
+    "git_mirror_fetch_interval_s": 60,  # incremental `git fetch` at most this often per repo
     # TLS / PKI
     "enable_pki_zip_patch": "true",
     "pki_zip_url": "https://pki.dell.com//Dell%20Technologies%20PKI%202018%20B64_PEM.zip",
@@ -27,10 +36,77 @@ DEFAULT_CONFIG = {
     "model": "llama-3-3-70b-instruct",  # default single-model fallback / base synthesizer
     "correlation_id": "pr-review-ui",
     # Output
-    "output_format": "html",  # "html" or "markdown"
+    "output_format": "html",  # "html", "markdown" or "json" (structured findings, rendered to HTML)
     # Ensemble persistence
     "selected_models": [],  # filled from UI if empty
     "parallel_models": True,  # run selected models in parallel
+    # Adaptive routing: pick the model set per diff chunk (see model_registry.ModelRouter)
+    "adaptive_routing": False,
+    "routing_small_chunk_chars": 1500,  # chunks at or below this size go to the small models
+    "routing_small_chunk_models": ["llama-3-2-3b-instruct"],
+    "routing_long_context_models": ["phi-3-mini-128k-instruct"],  # used when no selected model fits
+    "routing_max_models_per_chunk": 0,  # 0 = every eligible selected model
+    "routing_latency_budget_s": 0,  # drop models whose observed p95 exceeds this (0 = off)
+    # Deadlines (seconds; 0 = no limit). Late models are reported as timed out instead of blocking the report.
+    "model_call_timeout_s": 180,  # single gateway call
+    "model_timeout_s": 600,  # one model's whole review (all chunks + consolidation)
+    "review_timeout_s": 900,  # whole ensemble
+    # Hedged requests: resend after the model's observed p95 latency; first answer wins
+    "hedge_requests": False,
+    "hedge_min_delay_s": 5,
+    # Micro-batching for bulk runs: small same-model reviews arriving within the window are packed
+    # into one prompt and split back per PR (0 = off; the desktop app reviews one PR at a time)
+    "micro_batch_window_ms": 0,
+    "micro_batch_max_chars": 4000,  # only diffs up to this size are batched
+    "micro_batch_max_items": 8,
+    # Circuit breaker per gateway model (state persisted in STORE_DIR/model_health.json)
+    "circuit_breaker": True,
+    "breaker_window_s": 600,  # rolling window of calls considered
+    "breaker_min_calls": 4,  # calls in the window before the error rate can open the circuit
+    "breaker_error_rate": 0.5,
+    "breaker_cooldown_s": 300,  # open -> half-open (one probe call) after this long
+    # File history: commits are summarised in groups of at most this many tokens (map), then merged (reduce)
+    # with every reduce prompt held to the same budget (grouped by commit, narratives tree-merged)
+    "filehist_group_tokens": 6000,
+    "filehist_follow_renames": True,  # continue a file's history under its previous names
+    # Cost per 1K tokens, e.g. {"gpt-oss-120b": {"input": 0.15, "output": 0.6}}; models not listed are
+    # costed by the registry's relative cost (base synthesizer = 1.0 per 1K tokens)
+    "token_prices": {},
+    # Prometheus text-format metrics on http://metrics_host:metrics_port/metrics (0 = off)
+    "metrics_port": 0,
+    "metrics_host": "127.0.0.1",
+    # cProfile + tracemalloc per review / file-history summary, saved next to the report (also: main.py --profile)
+    "profile_reviews": False,
+    "profile_top_n": 40,
+    # Webhook auto-review service (python -m pr_reviewer.webhook_service)
+    "webhook_host": "127.0.0.1",
+    "webhook_port": 8787,
+    "webhook_path": "/webhook",
+    "webhook_secret": "",  # or $GITHUB_WEBHOOK_SECRET; required unless --allow-unsigned
+    "webhook_actions": ["opened", "synchronize", "reopened", "ready_for_review"],
+    "webhook_skip_drafts": True,
+    "webhook_repos": [],  # "owner/repo" allowlist; empty = every repo that sends events
+    "webhook_workers": 2,  # concurrent reviews
+    "webhook_queue_size": 20,  # waiting reviews in memory; overflow goes to the on-disk spool
+    "webhook_spool_size": 1000,  # spooled reviews before answering 503 (GitHub does not redeliver on its own)
+    "webhook_retry_after_s": 60,
+    # Cross-model consensus table in the report (local MinHash clustering of findings, no gateway call)
+    "consensus": True,
+    "consensus_similarity": 0.3,  # estimated Jaccard of word shingles for two findings to merge
+    "consensus_line_window": 3,  # findings this many lines apart (same file) may merge
+    # Base-model synthesis into the report's Consensus section, pipelined with the ensemble: starts once
+    # synthesis_after_k models have answered and folds later answers in with short update calls
+    "synthesis": False,
+    "synthesis_model": "llama-3-3-70b-instruct",
+    "synthesis_after_k": 2,
+    # Publish each review to GitHub as one PR review with inline comments from the Review Tables
+    "github_review_publish": False,
+    "github_review_dry_run": False,  # print the review payload instead of posting it
+    "github_review_event": "COMMENT",  # COMMENT | REQUEST_CHANGES | APPROVE
+    "github_review_max_comments": 30,  # inline comments per review (highest severity first); the rest go in the body
+    "github_review_line_slack": 2,  # cited lines this far from a changed line still anchor to it
+    # Tracing: per-stage spans for each review, timing table in the report, OTLP JSON in STORE_DIR/traces
+    "tracing": True,
     # Generated code filtering
     "skip_generated": True,  # turn off to include generated files
     "generated_path_globs": [
@@ -0,0 +1,199 @@
+# consensus.py
+"""
+Local cross-model merge of review findings: no gateway call, a few milliseconds per review.
+
+Findings from every model (structured JSON reviews, or the Review Table rows of HTML/markdown
+answers) are clustered when they are on the same file, within `consensus_line_window` lines of
+each other and textually similar: the (bottom-k) MinHash estimate of the Jaccard similarity of
+their word shingles is at least `consensus_similarity`. A finding without a line number joins only
+the single most similar cluster in its file. Hashing is deterministic (blake2b), so the
+same findings always give the same clusters. Each cluster becomes one consensus finding with the
+number of models that reported it:
+
+    cons = build_consensus(cfg, findings_by_model(results, structured))
+    html = consensus_html(cons)             # the report's Consensus section
+"""
+import re
+import time
+import hashlib
+import html as _html
+from collections import Counter
+
+from .findings import SEVERITIES, normalize_finding
+from .github_review import parse_review_table
+
+NUM_PERM = 64  # sketch size
+_WORD_RE = re.compile(r"[a-z0-9_]+")
+
+
+# ---------------------------- Inputs ----------------------------
+def findings_by_model(results: dict[str, str], structured: dict[str, dict] | None = None) -> dict[str, list[dict]]:
+    """
+    {model: [finding]} from validated JSON reviews where available, else from each answer's Review Table.
+    Models that answered without findings stay in (they count towards the agreement denominator).
+    """
+    out: dict[str, list[dict]] = {}
+    for model, text in results.items():
+        if structured and model in structured:
+            out[model] = list(structured[model]["findings"])
+        elif text:
+            out[model] = [f for f in (normalize_finding(r) for r in parse_review_table(text)) if f]
+    return out
+
+
+# ---------------------------- MinHash ----------------------------
+_STOP = frozenset(
+    "a an the and or of to in on for with from by at as is are be been this that these those it its "
+    "which when if then than there here should could would may might can will not no use using".split()
+)
+
+
+def shingles(text: str) -> set[str]:
+    """Content words (crude plural folding) and their bigrams; word order matters only a little."""
+    words = [w[:-1] if len(w) > 3 and w.endswith("s") else w
+             for w in _WORD_RE.findall((text or "").lower()) if w not in _STOP and len(w) > 1]
+    return set(words) | {f"{a} {b}" for a, b in zip(words, words[1:])}
+
+
+def minhash(sh: set[str]) -> frozenset[int]:
+    """Bottom-k MinHash sketch: the NUM_PERM smallest 64-bit shingle hashes (the whole set when smaller)."""
+    hashed = sorted({int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "big") for s in sh})
+    return frozenset(hashed[:NUM_PERM])
+
+
+def similarity(sig_a: frozenset, sig_b: frozenset) -> float:
+    """Estimated Jaccard similarity of the shingle sets behind two sketches (exact for short texts)."""
+    if not sig_a or not sig_b:
+        return 0.0
+    union = sorted(sig_a | sig_b)[:NUM_PERM]
+    both = sig_a & sig_b
+    return sum(1 for h in union if h in both) / len(union)
+
+
+# ---------------------------- Clustering ----------------------------
+def _canonical_paths(paths) -> dict[str, str]:
+    """Maps "app.py" to "src/app.py" when another model cited the longer path, so both land in one block."""
+    norm = {p: re.sub(r"^(?:[ab]/|\./)", "", p.strip().strip("`")) for p in paths}
+    full = sorted(set(norm.values()), key=len, reverse=True)
+    out = {}
+    for p, n in norm.items():
+        out[p] = next((f for f in full if f == n or f.endswith("/" + n)), n) if n else ""
+    return out
+
+
+def _near(a: dict, b: dict, window: int) -> bool:
+    if not a["line"] or not b["line"]:
+        return not a["line"] and not b["line"]  # file-level findings attach later, to one cluster only
+    a_lo, a_hi = a["line"], a.get("end_line") or a["line"]
+    b_lo, b_hi = b["line"], b.get("end_line") or b["line"]
+    return a_lo - window <= b_hi and b_lo - window <= a_hi
+
+
+def build_consensus(cfg: dict, by_model: dict[str, list[dict]]) -> dict:
+    """
+    {"models": [...], "clusters": [{file, line, end_line, severity, category, observation,
+    recommendation, models, agreement, members, severities}], "elapsed_ms"} — clusters sorted by
+    agreement, then severity.
+    """
+    t0 = time.perf_counter()
+    threshold = float(cfg.get("consensus_similarity", 0.3))
+    window = int(cfg.get("consensus_line_window", 3))
+
+    items = [dict(f, model=m) for m, fs in by_model.items() for f in fs]
+    canon = _canonical_paths({f["file"] for f in items})
+    sigs = [minhash(shingles(f"{f['observation']} {f['recommendation']}")) for f in items]
+
+    parent = list(range(len(items)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    blocks: dict[str, list[int]] = {}
+    for i, f in enumerate(items):
+        blocks.setdefault(canon[f["file"]], []).append(i)
+    sim: dict[tuple[int, int], float] = {}
+    for idx in blocks.values():  # pairwise only inside a file: findings per file are few
+        for x, i in enumerate(idx):
+            for j in idx[x + 1:]:
+                if not _near(items[i], items[j], window):
+                    continue
+                s = similarity(sigs[i], sigs[j])
+                sim[(i, j)] = s
+                same_spot = items[i]["line"] and items[i]["line"] == items[j]["line"] and \
+                    items[i]["category"].lower() == items[j]["category"].lower()
+                if s >= threshold or (same_spot and s >= threshold / 2):
+                    parent[find(j)] = find(i)
+
+    # A finding without a line (and the line-less findings clustered with it) joins at most one
+    # line-level cluster in its file, the most similar one above the threshold, so it never bridges two.
+    for idx in blocks.values():
+        loose: dict[int, list[int]] = {}
+        for i in idx:
+            if not items[i]["line"]:
+                loose.setdefault(find(i), []).append(i)
+        for group in loose.values():
+            scores = [(sim.setdefault((min(i, j), max(i, j)), similarity(sigs[i], sigs[j])), j)
+                      for i in group for j in idx if items[j]["line"]]
+            s, best = max(scores, key=lambda x: x[0], default=(0.0, None))
+            if best is not None and s >= threshold:
+                parent[find(group[0])] = find(best)
+
+    groups: dict[int, list[int]] = {}
+    for i in range(len(items)):
+        groups.setdefault(find(i), []).append(i)
+
+    clusters = []
+    for members in groups.values():
+        # Representative: the member most similar to the rest (first model wins ties)
+        rep = max(members, key=lambda i: (sum(sim.get((min(i, j), max(i, j)), 0) for j in members if j != i), -i))
+        f = items[rep]
+        sev = Counter(items[i]["severity"] for i in members)
+        lines = sorted(items[i]["line"] for i in members if items[i]["line"])
+        ends = [items[i].get("end_line") or items[i]["line"] for i in members if items[i]["line"]]
+        models = list(dict.fromkeys(items[i]["model"] for i in members))
+        cats = Counter(items[i]["category"] for i in members if items[i]["category"])
+        clusters.append({
+            "file": canon[f["file"]],
+            "line": lines[0] if lines else None,
+            "end_line": max(ends) if ends and max(ends) > lines[0] else None,
+            # majority vote, ties go to the more severe rating
+            "severity": min(sev, key=lambda s: (-sev[s], SEVERITIES.index(s))),
+            "severities": dict(sev),
+            "category": cats.most_common(1)[0][0] if cats else f["category"],
+            "observation": f["observation"],
+            "recommendation": f["recommendation"],
+            "models": models,
+            "agreement": len(models),
+            "members": len(members),
+        })
+    clusters.sort(key=lambda c: (-c["agreement"], SEVERITIES.index(c["severity"]), c["file"], c["line"] or 0))
+    return {"models": list(by_model), "clusters": clusters, "elapsed_ms": round((time.perf_counter() - t0) * 1000, 2)}
+
+
+# ---------------------------- HTML ----------------------------
+def consensus_html(cons: dict) -> str:
+    """Consensus table: one row per cluster, agreement as "k/n models"."""
+    esc = _html.escape
+    n = len(cons["models"])
+    agreed = sum(1 for c in cons["clusters"] if c["agreement"] > 1)
+    p = [f"<p class='meta'>{len(cons['clusters'])} distinct finding(s) from {n} model(s); "
+         f"{agreed} reported by more than one model. Merged locally in {cons['elapsed_ms']} ms.</p>"]
+    if not cons["clusters"]:
+        return p[0]
+    p.append("<table><thead><tr><th>Agreement</th><th>File</th><th>Line No.</th><th>Category</th>"
+             "<th>Code Change Risk (LOW/MEDIUM/HIGH)</th><th>Observation</th><th>Recommendation</th>"
+             "<th>Models</th></tr></thead><tbody>")
+    for c in cons["clusters"]:
+        line = f"L{c['line']}" + (f"–L{c['end_line']}" if c["end_line"] else "") if c["line"] else "-"
+        spread = "" if len(c["severities"]) == 1 else " (" + ", ".join(
+            f"{k} ×{v}" for k, v in sorted(c["severities"].items(), key=lambda kv: SEVERITIES.index(kv[0]))) + ")"
+        p.append(
+            f"<tr><td>{c['agreement']}/{n}</td><td>{esc(c['file'] or '-')}</td><td>{line}</td>"
+            f"<td>{esc(c['category'])}</td><td>{c['severity']}{spread}</td><td>{esc(c['observation'])}</td>"
+            f"<td>{esc(c['recommendation'])}</td><td>{esc(', '.join(c['models']))}</td></tr>"
+        )
+    p.append("</tbody></table>")
+    return "".join(p)
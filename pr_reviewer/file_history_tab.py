@@ -1,7 +1,10 @@
 # file_history_tab.py
+import io
 import os
 import re
 import json
+import hashlib
+import threading
 import certifi
 import requests
 import datetime
@@ -10,6 +13,8 @@ import tkinter as tk
 from tkinter import ttk, messagebox
 from html import escape as _html_escape
 
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
 from openai import OpenAI
 import httpx
 
@@ -17,6 +22,14 @@ from .storage import STORE_DIR
 from .html_utils import wrap_fragment_as_full_html
 from .tls import patch_certifi_with_pki_zip
 from .model_registry import MODEL_REGISTRY  # kept for consistency
+from .github_api import fetch_commit, fetch_file_history_graphql
+from .commit_store import is_full_sha
+from .git_mirror import mirror_file_history, mirror_commit_patch_for_file
+from .scm import get_provider
+from .model_client import create_chat_completion
+from .metrics import observe_github_response, cache_lookup
+from .profiling import profile_session, profile_thread
+from .tracing import TRACER
 
 
 # ---------------- Persistence for file-history summaries ----------------
@@ -43,6 +56,33 @@ def _save_hist_index(obj):
         json.dump(obj, f, ensure_ascii=False, indent=2)
 
 
+# Commit lists per (repo, ref, path), newest first; reloads only fetch commits above the stored head.
+FILE_HISTORY_STORE_DIR = os.path.join(STORE_DIR, "file_history")
+
+def _history_store_path(host: str, owner: str, repo: str, ref: str, path: str) -> str:
+    key = hashlib.sha256(f"{host}/{owner}/{repo}@{ref}:{path}".encode("utf-8")).hexdigest()
+    return os.path.join(FILE_HISTORY_STORE_DIR, key + ".json")
+
+def _load_stored_history(host, owner, repo, ref, path) -> list:
+    try:
+        with open(_history_store_path(host, owner, repo, ref, path), "r", encoding="utf-8") as f:
+            return (json.load(f) or {}).get("commits") or []
+    except Exception:
+        return []
+
+def _save_stored_history(host, owner, repo, ref, path, commits: list):
+    target = _history_store_path(host, owner, repo, ref, path)
+    try:
+        os.makedirs(FILE_HISTORY_STORE_DIR, exist_ok=True)
+        tmp = target + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"host": host, "owner": owner, "repo": repo, "ref": ref, "path": path,
+                       "head": commits[0]["sha"] if commits else "", "commits": commits}, f, ensure_ascii=False)
+        os.replace(tmp, target)
+    except Exception as e:
+        print(f"[WARN] Could not store file history: {e}")
+
+
 # ---------------- Date formatting helper ----------------
 
 def _fmt_iso_date(iso_str: str) -> str:
@@ -86,12 +126,123 @@ def parse_file_blob_url(file_url: str):
 def _github_api_base_from_host(host: str) -> str:
     return "https://api.github.com" if host.lower() == "github.com" else f"https://{host}/api/v3"
 
-def fetch_file_commit_history(cfg: dict, file_url: str, max_commits: int = 300):
-    token = (cfg.get("github_token") or "").strip()
-    if not token:
-        raise RuntimeError("Missing GitHub token in settings (Configuration tab).")
-
+def fetch_file_commit_history(cfg: dict, file_url: str, max_commits: int | None = None,
+                              follow_renames: bool | None = None):
+    """
+    Commit history of a file, newest first. Uses GraphQL (no 300-commit cap) and the local
+    per-(repo, ref, path) store, so a reload only fetches commits newer than the stored head.
+    Falls back to REST paging when GraphQL is unavailable. `max_commits` (None = all) trims the result.
+    With `follow_renames` (default cfg["filehist_follow_renames"]) the history continues across
+    renames; commits from before a rename carry the file's old name in "path".
+    With cfg["git_mirror"] the history comes from `git log` in the local mirror instead.
+    """
     host, owner, repo, ref, path = parse_file_blob_url(file_url)
+    meta = {"host": host, "owner": owner, "repo": repo, "ref": ref, "path": path}
+    if follow_renames is None:
+        follow_renames = bool(cfg.get("filehist_follow_renames", True))
+
+    items = None
+    if cfg.get("git_mirror"):
+        try:
+            items = mirror_file_history(cfg, host, owner, repo, ref, path, follow_renames)
+        except Exception as e:
+            print(f"[WARN] Local git mirror unavailable, using the GitHub API: {e}")
+
+    if items is None:
+        token = (cfg.get("github_token") or "").strip()
+        if not token:
+            raise RuntimeError("Missing GitHub token in settings (Configuration tab).")
+        items = _fetch_path_history(cfg, host, owner, repo, ref, path)
+        if follow_renames:
+            items = items + _follow_renames(cfg, host, owner, repo, path, items)
+    if follow_renames:
+        meta["renames"] = sorted({c["path"] for c in items if c.get("path")})
+
+    return (items[:max_commits] if max_commits else items), meta
+
+def _fetch_path_history(cfg: dict, host: str, owner: str, repo: str, ref: str, path: str) -> list:
+    stored = _load_stored_history(host, owner, repo, ref, path)
+    if stored and is_full_sha(ref):
+        return stored  # history below a fixed commit never changes
+    head = stored[0]["sha"] if stored else None
+    try:
+        newer, reached_head = fetch_file_history_graphql(cfg, host, owner, repo, ref, path, stop_at=head)
+    except Exception as e:
+        print(f"[WARN] GraphQL file history unavailable, using REST paging: {e}")
+        return _fetch_file_commit_history_rest(cfg, host, owner, repo, ref, path)
+    # Head not found again (e.g. branch was force-pushed): the fresh walk is the whole history
+    items = newer + stored if reached_head else newer
+    if newer or not reached_head:
+        _save_stored_history(host, owner, repo, ref, path, items)
+    return items
+
+
+# Rename links keyed by (repo, commit, path): the commit that created `path` and, when it was a
+# rename, the old name and the parent to continue from. Commits are immutable, so links never expire
+# and a followed history costs one history walk per rename, with no per-commit requests.
+RENAME_LINKS_PATH = os.path.join(FILE_HISTORY_STORE_DIR, "rename_links.json")
+MAX_RENAMES = 50
+
+def _load_rename_links() -> dict:
+    try:
+        with open(RENAME_LINKS_PATH, "r", encoding="utf-8") as f:
+            return json.load(f) or {}
+    except Exception:
+        return {}
+
+def _save_rename_links(links: dict):
+    try:
+        os.makedirs(os.path.dirname(RENAME_LINKS_PATH), exist_ok=True)
+        tmp = RENAME_LINKS_PATH + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(links, f, ensure_ascii=False)
+        os.replace(tmp, RENAME_LINKS_PATH)
+    except Exception as e:
+        print(f"[WARN] Could not store rename links: {e}")
+
+def _rename_link(cfg, host, owner, repo, sha, path, links: dict) -> dict:
+    """{"previous": old_path, "parent": sha} when `sha` renamed old_path -> path, else {}."""
+    key = f"{host}/{owner}/{repo}:{sha}:{path}"
+    if key in links:
+        return links[key]
+    data = fetch_commit(cfg, host, owner, repo, sha)  # served from the commit store when cached
+    link = {}
+    for f in (data.get("files") or []):
+        if f.get("filename") == path and f.get("status") == "renamed" and f.get("previous_filename"):
+            parents = data.get("parents") or []
+            if parents:
+                link = {"previous": f["previous_filename"], "parent": parents[0].get("sha") or ""}
+            break
+    links[key] = link
+    return link
+
+def _follow_renames(cfg: dict, host: str, owner: str, repo: str, path: str, items: list) -> list:
+    """Older history of the file under its previous names, oldest rename last."""
+    links = _load_rename_links()
+    known = len(links)
+    older, seen = [], set()
+    oldest, cur_path = (items[-1]["sha"] if items else ""), path
+    try:
+        while oldest and len(seen) < MAX_RENAMES:
+            link = _rename_link(cfg, host, owner, repo, oldest, cur_path, links)
+            if not link or not link.get("parent") or (oldest, cur_path) in seen:
+                break
+            seen.add((oldest, cur_path))
+            cur_path = link["previous"]
+            segment = [dict(c, path=cur_path) for c in
+                       _fetch_path_history(cfg, host, owner, repo, link["parent"], cur_path)]
+            older.extend(segment)
+            oldest = segment[-1]["sha"] if segment else ""
+    except Exception as e:
+        print(f"[WARN] Stopped following renames of {path}: {e}")
+    if len(links) != known:
+        _save_rename_links(links)
+    return older
+
+def _fetch_file_commit_history_rest(cfg: dict, host: str, owner: str, repo: str, ref: str, path: str,
+                                    max_commits: int = 300):
+    """REST /commits?path= paging; GitHub stops serving this endpoint's pages for long histories."""
+    token = (cfg.get("github_token") or "").strip()
     api_base = _github_api_base_from_host(host)
 
     headers = {
@@ -105,6 +256,7 @@ def fetch_file_commit_history(cfg: dict, file_url: str, max_commits: int = 300):
     while len(items) < max_commits:
         url = f"{api_base}/repos/{owner}/{repo}/commits?path={quoted_path}&sha={ref}&per_page={per_page}&page={page}"
         r = requests.get(url, headers=headers, verify=certifi.where(), timeout=60)
+        observe_github_response(r, "commits.list")
         if not r.ok:
             raise RuntimeError(f"Failed to fetch commit history for file: {r.status_code} {r.text}")
         batch = r.json() or []
@@ -115,28 +267,18 @@ def fetch_file_commit_history(cfg: dict, file_url: str, max_commits: int = 300):
             break
         page += 1
 
-    meta = {"host": host, "owner": owner, "repo": repo, "ref": ref, "path": path}
-    return items[:max_commits], meta
+    return items[:max_commits]
 
 def fetch_commit_patch_for_file(cfg: dict, host: str, owner: str, repo: str, sha: str, file_path: str):
     """
     Returns a tuple: (patch for the target file, list of other modified files)
     """
-    token = (cfg.get("github_token") or "").strip()
-    if not token:
-        raise RuntimeError("Missing GitHub token in settings (Configuration tab).")
-
-    api_base = _github_api_base_from_host(host)
-    url = f"{api_base}/repos/{owner}/{repo}/commits/{sha}"
-    headers = {
-        "Authorization": f"Bearer {token}",
-        "Accept": "application/vnd.github+json",
-        "User-Agent": "pr-reviewer-ui-filehistory",
-    }
-    r = requests.get(url, headers=headers, verify=certifi.where(), timeout=60)
-    if not r.ok:
-        raise RuntimeError(f"Failed to fetch commit detail: {r.status_code} {r.text}")
-    data = r.json()
+    if cfg.get("git_mirror"):
+        try:
+            return mirror_commit_patch_for_file(cfg, host, owner, repo, sha, file_path)
+        except Exception as e:
+            print(f"[WARN] Local git mirror unavailable, using the GitHub API: {e}")
+    data = fetch_commit(cfg, host, owner, repo, sha)  # served from the commit store when cached
 
     patch_for_target = ""
     others = []
@@ -152,6 +294,143 @@ def fetch_commit_patch_for_file(cfg: dict, host: str, owner: str, repo: str, sha
     return patch_for_target, others
 
 
+# Commit content never changes, so per-file results are cached on disk by (repo, sha, path).
+PATCH_CACHE_DIR = os.path.join(STORE_DIR, "commit_patch_cache")
+
+def _patch_cache_path(host: str, owner: str, repo: str, sha: str, file_path: str) -> str:
+    key = hashlib.sha256(f"{host}/{owner}/{repo}@{sha}:{file_path}".encode("utf-8")).hexdigest()
+    return os.path.join(PATCH_CACHE_DIR, key[:2], key + ".json")
+
+def _load_cached_patch(host, owner, repo, sha, file_path):
+    try:
+        with open(_patch_cache_path(host, owner, repo, sha, file_path), "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return data.get("patch") or "", list(data.get("others") or [])
+    except Exception:
+        return None
+
+def _store_cached_patch(host, owner, repo, sha, file_path, patch, others):
+    if not is_full_sha(sha):
+        return  # only immutable, fully-qualified SHAs are cacheable
+    path = _patch_cache_path(host, owner, repo, sha, file_path)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"  # fetch workers may write the same entry
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"patch": patch, "others": others}, f, ensure_ascii=False)
+        os.replace(tmp, path)  # readers see the old entry or the complete new one, never a partial file
+    except Exception as e:
+        print(f"[WARN] Could not cache patch for {sha[:7]}: {e}")
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+
+def fetch_commit_patches_for_file(cfg: dict, host: str, owner: str, repo: str, shas: list, file_path: str,
+                                  max_workers: int = 8, on_progress=None, paths: dict | None = None):
+    """
+    Concurrent version of fetch_commit_patch_for_file for many commits.
+    Returns {sha: (patch, others)}. Duplicate SHAs are fetched once, cached results are
+    served from disk, and at most `max_workers` requests run at a time.
+    `paths` ({sha: path}) overrides `file_path` for commits made before a rename.
+    `on_progress()` is called in the caller's thread after each commit resolves.
+    Patches come from the configured SCM provider (see scm.get_provider).
+    """
+    scm = get_provider(cfg)
+    paths = paths or {}
+    results = {}
+    todo = []
+    for sha in dict.fromkeys(s for s in shas if s):
+        cached = _load_cached_patch(host, owner, repo, sha, paths.get(sha, file_path)) if scm.cacheable else None
+        cache_lookup("commit_patch", cached is not None)
+        if cached is not None:
+            results[sha] = cached
+            if on_progress:
+                on_progress()
+        else:
+            todo.append(sha)
+
+    if todo:
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(todo)))) as ex:
+            futs = {
+                ex.submit(scm.get_commit_patch, host, owner, repo, sha, paths.get(sha, file_path)): sha
+                for sha in todo
+            }
+            for f in as_completed(futs):
+                sha = futs[f]
+                patch, others = f.result()
+                if scm.cacheable:
+                    _store_cached_patch(host, owner, repo, sha, paths.get(sha, file_path), patch, others)
+                results[sha] = (patch, others)
+                if on_progress:
+                    on_progress()
+        scm.flush()
+    return results
+
+
+# ---------------- Per-commit summary cache ----------------
+
+# One entry per (repo, file path, sha, model, prompt version, output format); commits never change,
+# so a cached table stays valid until the prompts are revised (FILEHIST_PROMPT_VERSION).
+SUMMARY_CACHE_DIR = os.path.join(STORE_DIR, "filehist_summary_cache")
+
+def _filehist_format(cfg: dict) -> str:
+    """File history is descriptive, not findings: structured (json) PR reviews still summarise history as HTML."""
+    fmt = (cfg.get("output_format") or "html").lower().strip()
+    return "html" if fmt == "json" else fmt
+
+def _summary_cache_path(cfg: dict, host: str, owner: str, repo: str, file_path: str, sha: str, model: str) -> str:
+    fmt = _filehist_format(cfg)
+    raw = f"{host}/{owner}/{repo}:{file_path}@{sha}|{model}|v{FILEHIST_PROMPT_VERSION}|{fmt}"
+    key = hashlib.sha256(raw.encode("utf-8")).hexdigest()
+    return os.path.join(SUMMARY_CACHE_DIR, key[:2], key + ".json")
+
+def load_cached_commit_summary(cfg, host, owner, repo, file_path, sha, model):
+    try:
+        with open(_summary_cache_path(cfg, host, owner, repo, file_path, sha, model), "r", encoding="utf-8") as f:
+            return (json.load(f) or {}).get("table") or None
+    except Exception:
+        return None
+
+def store_commit_summary(cfg, host, owner, repo, file_path, sha, model, table: str):
+    if not is_full_sha(sha) or not (table or "").strip():
+        return
+    path = _summary_cache_path(cfg, host, owner, repo, file_path, sha, model)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"model": model, "sha": sha, "path": file_path, "table": table}, f, ensure_ascii=False)
+    except Exception as e:
+        print(f"[WARN] Could not cache summary for {sha[:7]}: {e}")
+
+_NARRATIVE_RE = re.compile(r"(<h[1-6][^>]*>|#{1,6}\s*)\s*Overall Narrative", re.IGNORECASE)
+
+def split_commit_tables(text: str, shas: list) -> dict:
+    """
+    Split a group summary on its <!-- COMMIT sha --> markers.
+    Returns {full_sha: table_text} for markers that match one of `shas` (short or full form).
+    """
+    by_prefix = {}
+    for sha in shas:
+        by_prefix.setdefault(sha[:7].lower(), sha)
+    marks = list(COMMIT_MARKER_RE.finditer(text or ""))
+    out = {}
+    for i, m in enumerate(marks):
+        full = by_prefix.get(m.group("sha")[:7].lower())
+        if not full:
+            continue
+        end = marks[i + 1].start() if i + 1 < len(marks) else len(text)
+        seg = text[m.start():end]
+        narrative = _NARRATIVE_RE.search(seg)
+        if narrative:
+            seg = seg[:narrative.start()]
+        out[full] = seg.strip()
+    return out
+
+def _strip_commit_markers(text: str) -> str:
+    return COMMIT_MARKER_RE.sub("", text or "")
+
+
 # ---------------- Model helpers (OpenAI-compatible Gateway) ----------------
 
 def _get_gateway_token(cfg: dict) -> str:
@@ -369,16 +648,22 @@ def normalize_model_fragment(raw: str) -> str:
 
 # ---------------- Prompt builders (HTML-first with per-commit TABLES) ----------------
 
+# Bump whenever the file-history prompts change; it is part of the per-commit summary cache key.
+FILEHIST_PROMPT_VERSION = "2"
+
+COMMIT_MARKER_RE = re.compile(r"<!--\s*COMMIT\s+(?P<sha>[0-9a-fA-F]{7,40})\s*-->")
+
 def build_file_history_prompts(cfg: dict):
     """
     HTML-first: ask model for curated code changes + likely reasons (bullets),
     rendered as a TABLE PER COMMIT (each commit its own block). Include “Other Files Modified” if present.
     """
-    output_format = (cfg.get("output_format") or "html").lower().strip()
+    output_format = _filehist_format(cfg)
     if output_format == "html":
         system = (
             "You are a senior software engineer summarizing changes to ONE file across multiple commits. "
-            "Return only valid HTML (no markdown). For EACH commit, render a bordered table block:\n"
+            "Return only valid HTML (no markdown). For EACH commit, first write the marker comment "
+            "<!-- COMMIT <shortsha> --> on its own line, then render a bordered table block:\n"
             "  - Table header with: Commit <shortsha> — <date> — <author>\n"
             "  - Two columns:\n"
             "      * Left: <strong>Change Summary</strong> as an ordered list (precise, code-aware, concise). "
@@ -391,7 +676,8 @@ def build_file_history_prompts(cfg: dict):
 <section>
   <h2 style="color:#004c99">Per-Commit Code Change Summary</h2>
 
-  <!-- Repeat this TABLE per commit -->
+  <!-- Repeat the marker + TABLE per commit -->
+  &lt;!-- COMMIT &lt;shortsha> -->
   <table style="border-collapse:collapse; width:100%; margin:14px 0; border:1px solid #ddd;">
     <thead>
       <tr>
@@ -442,11 +728,13 @@ def build_file_history_prompts(cfg: dict):
     else:
         system = (
             "You are a senior software engineer summarizing changes to a single file across multiple commits. "
-            "Return structured Markdown with a table-like layout per commit. Change Summary as numbered bullets; "
+            "Return structured Markdown with a table-like layout per commit, each commit preceded by the line "
+            "<!-- COMMIT <shortsha> -->. Change Summary as numbered bullets; "
             "Likely Reasons as bullet points. If other files are provided, include an 'Other Files Modified' bulleted list. "
             "Conclude with 'Overall Narrative' bullets."
         )
         template = (
+            "<!-- COMMIT <shortsha> -->\n"
             "## Commit <shortsha> — <date> — <author>\n"
             "### Change Summary\n"
             "1. Step 1\n2. Step 2\n"
@@ -463,10 +751,13 @@ def build_file_history_prompts(cfg: dict):
 
 # ---------------- Model exec: single-model + synthesis ----------------
 
-def _single_model_file_history_summary(cfg: dict, model_name: str, multi_commit_diff_text: str, header_meta: dict) -> str:
+def _single_model_file_history_summary(cfg: dict, model_name: str, multi_commit_diff_text: str, header_meta: dict,
+                                       part: tuple | None = None) -> str:
     """
     Run a single model over the combined multi-commit diff text.
     header_meta keys: owner, repo, path, selected_shas (list), selected_count, filtered_count
+    `part` = (k, n) marks one commit group of a map-reduce run: the model then returns only the
+    per-commit tables (each behind its COMMIT marker) and leaves the Overall Narrative to the synthesis step.
     """
     client = _make_client(cfg)
     system, template, hint = build_file_history_prompts(cfg)
@@ -477,43 +768,31 @@ def _single_model_file_history_summary(cfg: dict, model_name: str, multi_commit_
     header.append(f"Selected commits: {', '.join([s[:7] for s in header_meta.get('selected_shas', [])])}")
     header.append(f"Selected count: {int(header_meta.get('selected_count') or 0)}")
     header.append(f"Filtered list size: {int(header_meta.get('filtered_count') or 0)}")
+    if part:
+        header.append(
+            f"This is commit group {part[0]} of {part[1]}. Produce the per-commit tables for the commits below only, "
+            "each preceded by its <!-- COMMIT <shortsha> --> marker; do NOT write an Overall Narrative "
+            "(it is written later across all groups)."
+        )
     header.append(hint)
 
     user_content = "\n".join(header) + "\n\n" + "```diff\n" + multi_commit_diff_text + "\n```"
 
-    completion = client.chat.completions.create(
-        extra_headers={"x-correlation-id": (cfg.get("correlation_id") or "pr-review-ui-filehistory")},
-        model=model_name,
-        messages=[
+    completion = create_chat_completion(
+        cfg, client, model_name,
+        [
             {"role": "system", "content": system},
             {"role": "user", "content": [{"type": "text", "text": template}]},
             {"role": "user", "content": [{"type": "text", "text": user_content}]},
         ],
-        stream=False,
-        temperature=0.2,
+        default_correlation_id="pr-review-ui-filehistory",
+        prefix_len=2,
     )
     return completion.choices[0].message.content
 
-def synthesize_file_history_with_base(cfg: dict, base_model: str, summaries_by_model: dict, header_meta: dict) -> str:
-    """
-    Synthesize multiple model outputs into one final (HTML/Markdown) preserving per-commit sections.
-    """
-    client = _make_client(cfg)
+def _file_history_synthesis_call(cfg: dict, client, base_model: str, instruction: str, header_meta: dict,
+                                 sources_text: str) -> str:
     system, template, hint = build_file_history_prompts(cfg)
-
-    srcs = []
-    for m, content in summaries_by_model.items():
-        if content:
-            srcs.append(f"### Model: {m}\n{content}")
-
-    synth_user = (
-        "You are given multiple per-commit summaries for the SAME file. "
-        "Produce a SINGLE best summary that follows the requested template, preserving distinct TABLE blocks per commit. "
-        "Merge overlapping points, keep concrete descriptions, include 'Other Files Modified' sections only when present, "
-        "and ensure 'Likely Reasons' are concise bullet points. "
-        "Conclude with a single 'Overall Narrative' expressed as bullet points."
-    )
-
     header = []
     header.append(f"Repository: {header_meta.get('owner','')}/{header_meta.get('repo','')}")
     header.append(f"File: {header_meta.get('path','')}")
@@ -522,30 +801,130 @@ def synthesize_file_history_with_base(cfg: dict, base_model: str, summaries_by_m
     header.append(f"Filtered list size: {int(header_meta.get('filtered_count') or 0)}")
     header.append(hint)
 
-    completion = client.chat.completions.create(
-        extra_headers={"x-correlation-id": (cfg.get("correlation_id") or "pr-review-ui-filehistory")},
-        model=base_model,
-        messages=[
+    completion = create_chat_completion(
+        cfg, client, base_model,
+        [
             {"role": "system", "content": system},
             {"role": "user", "content": [{"type": "text", "text": template}]},
             {"role": "user", "content": [{"type": "text", "text": "\n".join(header)}]},
-            {"role": "user", "content": [{"type": "text", "text": synth_user}]},
-            {"role": "user", "content": [{"type": "text", "text": "\n\n".join(srcs) if srcs else "No sources."}]},
+            {"role": "user", "content": [{"type": "text", "text": instruction}]},
+            {"role": "user", "content": [{"type": "text", "text": sources_text or "No sources."}]},
         ],
-        stream=False,
-        temperature=0.2,
+        default_correlation_id="pr-review-ui-filehistory",
+        prefix_len=2,
     )
-    return completion.choices[0].message.content
+    return completion.choices[0].message.content or ""
+
+
+_SYNTH_INSTRUCTION = (
+    "You are given multiple per-commit summaries for the SAME file. "
+    "Produce a SINGLE best summary that follows the requested template, preserving distinct TABLE blocks per commit. "
+    "Merge overlapping points, keep concrete descriptions, include 'Other Files Modified' sections only when present, "
+    "and ensure 'Likely Reasons' are concise bullet points. "
+)
+_NARRATIVE_MERGE_INSTRUCTION = (
+    "You are given partial 'Overall Narrative' bullet lists, each covering consecutive commits of the SAME file "
+    "(in order). Merge them into ONE 'Overall Narrative' section (heading plus concise bullet points) in the requested "
+    "format. Output only that section."
+)
+
+
+def _clip(text: str, max_chars: int) -> str:
+    return text if len(text) <= max_chars else text[:max_chars] + "\n... (truncated)"
+
+
+def synthesize_file_history_with_base(cfg: dict, base_model: str, summaries_by_model: dict, header_meta: dict) -> str:
+    """
+    Synthesize multiple model outputs into one final (HTML/Markdown) preserving per-commit sections.
+    The reduce input is held to the map step's budget (cfg["filehist_group_tokens"]): when all
+    sources do not fit one prompt, commits are synthesized in groups (per-commit tables for the
+    group from every model, plus a group narrative) and the group narratives are merged in a tree
+    of budget-sized calls into the single Overall Narrative.
+    """
+    client = _make_client(cfg)
+    budget_chars = max(1, int(cfg.get("filehist_group_tokens") or 6000)) * 4
+
+    srcs = []
+    for m, content in summaries_by_model.items():
+        if content:
+            srcs.append(f"### Model: {m}\n{content}")
+    if sum(len(x) + 2 for x in srcs) <= budget_chars:
+        return _file_history_synthesis_call(
+            cfg, client, base_model, _SYNTH_INSTRUCTION + "Conclude with a single 'Overall Narrative' expressed as bullet points.",
+            header_meta, "\n\n".join(srcs))
+
+    # Map: per-commit tables of every model, grouped by commit within the budget
+    shas = list(dict.fromkeys(header_meta.get("selected_shas") or []))
+    per_commit = {sha: [] for sha in shas}
+    for m, content in summaries_by_model.items():
+        tables = split_commit_tables(content or "", shas)
+        for sha, table in tables.items():
+            per_commit[sha].append(f"### Model: {m}\n{table}")
+        if content and not tables:  # output without COMMIT markers: synthesized as its own source
+            per_commit.setdefault(f"model:{m}", []).append(f"### Model: {m}\n{content}")
+
+    groups, cur, cur_len = [], [], 0
+    for key, blocks in per_commit.items():
+        if not blocks:
+            continue
+        text = _clip("\n\n".join(blocks), budget_chars)  # one oversized commit still fits one call
+        if cur and cur_len + len(text) + 2 > budget_chars:
+            groups.append(cur)
+            cur, cur_len = [], 0
+        cur.append((key, text))
+        cur_len += len(text) + 2
+    if cur:
+        groups.append(cur)
+
+    def synth_group(k, group):
+        meta = dict(header_meta, selected_shas=[key for key, _ in group if not key.startswith("model:")])
+        instruction = (_SYNTH_INSTRUCTION +
+                       f"This is commit group {k + 1} of {len(groups)}: keep each commit's <!-- COMMIT <shortsha> --> "
+                       "marker before its table, then end with an 'Overall Narrative' (bullets) for these commits only.")
+        return _file_history_synthesis_call(cfg, client, base_model, instruction, meta,
+                                            "\n\n".join(text for _, text in group))
+
+    with ThreadPoolExecutor(max_workers=max(1, min(len(groups), 4))) as ex:
+        parts = list(ex.map(TRACER.bind(synth_group), range(len(groups)), groups))
+    if len(parts) == 1:
+        return parts[0]
+
+    tables, narratives = [], []
+    for out in parts:
+        m = _NARRATIVE_RE.search(out)
+        tables.append(out[:m.start()].rstrip() if m else out)
+        if m:
+            narratives.append(out[m.start():].strip())
+
+    # Reduce: merge narratives in budget-sized batches until one is left (each clipped to half the
+    # budget, so every round at least halves the count)
+    while len(narratives) > 1:
+        narratives = [_clip(n, budget_chars // 2 - 32) for n in narratives]
+        batches, cur, cur_len = [], [], 0
+        for n in narratives:
+            if cur and cur_len + len(n) + 2 > budget_chars:
+                batches.append(cur)
+                cur, cur_len = [], 0
+            cur.append(n)
+            cur_len += len(n) + 2
+        batches.append(cur)
+        narratives = [
+            _file_history_synthesis_call(cfg, client, base_model, _NARRATIVE_MERGE_INSTRUCTION, header_meta, "\n\n".join(b))
+            if len(b) > 1 else b[0]
+            for b in batches
+        ]
+    return "\n\n".join(tables + narratives)
 
 
 # ---------------- Diff block builder ----------------
 
-def build_multi_commit_diff_block(commits_meta: list, file_path: str) -> str:
+def build_multi_commit_diff_block(commits_meta: list, file_path: str, patches: dict | None = None) -> str:
     """
-    Assemble text with separate sections per commit in provided order (display order).
-    Inserts markers for per-commit PATCH and OTHER FILES lists. Dates are formatted.
+    Assemble text with separate sections per commit in provided order (display order). Dates are formatted.
+    With `patches` ({sha: (patch, other_files)}) the per-commit patch and "Other files modified" list are
+    written inline in a single pass; without it, [[PATCH::sha]] / [[OTHERS::sha]] markers are emitted instead.
     """
-    lines = []
+    out = io.StringIO()
     for meta in commits_meta:
         sha_full = (meta.get("sha") or "")[:40]
         short = sha_full[:7]
@@ -553,19 +932,60 @@ def build_multi_commit_diff_block(commits_meta: list, file_path: str) -> str:
         author_line = ((commit.get("author") or {}).get("name") or (meta.get("author") or {}).get("login") or "-")
         raw_date = (commit.get("author") or {}).get("date") or "-"
         date_line = _fmt_iso_date(raw_date)
-        msg = (commit.get("message") or "").splitlines()[0][:220]
+        msg = (commit.get("message") or "").splitlines()[0][:220] if commit.get("message") else ""
 
-        lines.append(f"=== Commit {short} — {date_line} — {author_line} ===")
+        out.write(f"=== Commit {short} — {date_line} — {author_line} ===\n")
         if msg:
-            lines.append(f"Message: {msg}")
-        lines.append(f"File: {file_path}")
+            out.write(f"Message: {msg}\n")
+        old_path = meta.get("path")
+        out.write(f"File: {old_path} (later renamed to {file_path})\n" if old_path and old_path != file_path
+                  else f"File: {file_path}\n")
+
+        if patches is None:
+            # markers to be replaced by the caller
+            out.write(f"[[PATCH::{sha_full}]]\n[[OTHERS::{sha_full}]]\n")
+        else:
+            patch, others = patches.get(sha_full) or ("", [])
+            out.write(patch or "(No patch for this file in this commit)")
+            out.write("\n")
+            if others:
+                out.write("Other files modified:\n")
+                for o in others:
+                    out.write(f"- {o}\n")
+            else:
+                out.write("\n")
 
-        # markers to be replaced later
-        lines.append(f"[[PATCH::{sha_full}]]")
-        lines.append(f"[[OTHERS::{sha_full}]]")
+        out.write("\n")  # spacer
+    # Same shape as the old "\n".join(lines): no trailing newline after the last spacer
+    text = out.getvalue()
+    return text[:-1] if text.endswith("\n") else text
 
-        lines.append("")  # spacer
-    return "\n".join(lines)
+
+def build_commit_groups(commits_meta: list, file_path: str, patches: dict, max_tokens: int) -> list:
+    """
+    Split commits (display order kept) into groups whose diff block fits `max_tokens`.
+    Returns [(group_commits, group_text)]. A single commit larger than the budget gets its
+    own group with the patch truncated, so no request exceeds the budget.
+    """
+    max_chars = max(1, int(max_tokens)) * 4
+    groups, cur, cur_texts, cur_len = [], [], [], 0
+    for c in commits_meta:
+        block = build_multi_commit_diff_block([c], file_path, patches)
+        if len(block) > max_chars:
+            sha_full = (c.get("sha") or "")[:40]
+            patch, others = patches.get(sha_full) or ("", [])
+            keep = max(0, len(patch) - (len(block) - max_chars) - 200)
+            clipped = {sha_full: (patch[:keep] + f"\n... (patch truncated, {len(patch) - keep} chars omitted)", others)}
+            block = build_multi_commit_diff_block([c], file_path, clipped)
+        if cur and cur_len + len(block) + 2 > max_chars:
+            groups.append((cur, "\n\n".join(cur_texts)))
+            cur, cur_texts, cur_len = [], [], 0
+        cur.append(c)
+        cur_texts.append(block)
+        cur_len += len(block) + 2
+    if cur:
+        groups.append((cur, "\n\n".join(cur_texts)))
+    return groups
 
 
 # ---------------- UI Tab ----------------
@@ -600,6 +1020,8 @@ class FileHistoryTab:
         ttk.Label(row, text="File URL:").pack(side=tk.LEFT)
         self.file_url_var = tk.StringVar()
         ttk.Entry(row, textvariable=self.file_url_var, width=90).pack(side=tk.LEFT, padx=6, fill=tk.X, expand=True)
+        self.follow_renames_var = tk.BooleanVar(value=bool(self.cfg.get("filehist_follow_renames", True)))
+        ttk.Checkbutton(row, text="Follow renames", variable=self.follow_renames_var).pack(side=tk.LEFT, padx=6)
         ttk.Button(row, text="Load History", command=self.on_load_file_history).pack(side=tk.LEFT, padx=6)
 
         # --- Filters ---
@@ -704,12 +1126,18 @@ class FileHistoryTab:
                 return
 
             self.app._busy_start("Working… Loading file commit history")
-            commits, meta = fetch_file_commit_history(self.app.cfg, url, max_commits=300)
+            scm = get_provider(self.app._run_cfg())
+            commits, meta = scm.get_file_history(url, follow_renames=bool(self.follow_renames_var.get()))
+            scm.flush()
             self._last_file_meta = meta
             self._all_commits = commits
 
             self.apply_filters()
-            self.app.set_status(f"Loaded {len(commits)} commits for {meta.get('path','')}")
+            renamed = [p for p in meta.get("renames") or [] if p != meta.get("path")]
+            self.app.set_status(
+                f"Loaded {len(commits)} commits for {meta.get('path','')}"
+                + (f" (following renames: {', '.join(renamed)})" if renamed else "")
+            )
             self.app._busy_stop("Loaded file history")
         except Exception as e:
             self.app._busy_stop("Error")
@@ -767,7 +1195,12 @@ class FileHistoryTab:
           ONLY the commits MULTI-SELECTED from the CURRENT FILTERED LIST.
           Each commit is rendered as a dedicated HTML table block.
           Include 'Other Files Modified' per commit if non-empty.
+        Profiled (cProfile + tracemalloc) when cfg["profile_reviews"] is on.
         """
+        with profile_session(self.app.cfg, "filehist") as prof:
+            self._generate_summary(prof)
+
+    def _generate_summary(self, prof):
         try:
             if not self._last_file_meta or not self._filtered_commits_cache:
                 messagebox.showerror("File History", "Load history and/or apply filters first.")
@@ -787,32 +1220,15 @@ class FileHistoryTab:
             repo = self._last_file_meta["repo"]
             fpath = self._last_file_meta["path"]
 
-            # Build scaffold text with metadata markers for each commit
-            multi_template = build_multi_commit_diff_block(chosen, fpath)
-
-            # Fetch patch & other files for each chosen commit and substitute into scaffold
+            # Fetch patch & other files for each chosen commit, then build the combined text in one pass
             self.app._busy_start("Working… Fetching per-commit patches")
-            combined = multi_template
-            selected_shas = []
-            for c in chosen:
-                sha_full = (c.get("sha") or "")[:40]
-                selected_shas.append(sha_full)
-                patch, others = fetch_commit_patch_for_file(self.app.cfg, host, owner, repo, sha_full, fpath)
-
-                # Replace patch marker
-                combined = combined.replace(
-                    f"[[PATCH::{sha_full}]]", patch or "(No patch for this file in this commit)"
-                )
-
-                # Replace others marker (skip if empty)
-                if others:
-                    others_block = "Other files modified:\n" + "\n".join(f"- {o}" for o in others)
-                    combined = combined.replace(f"[[OTHERS::{sha_full}]]", others_block)
-                else:
-                    combined = combined.replace(f"[[OTHERS::{sha_full}]]", "")
-
-                self.app._busy_step()
-
+            selected_shas = [(c.get("sha") or "")[:40] for c in chosen]
+            patches = fetch_commit_patches_for_file(
+                self.app._run_cfg(), host, owner, repo, selected_shas, fpath,
+                max_workers=int(self.app.cfg.get("github_max_workers") or 8),
+                on_progress=self.app._busy_step,
+                paths={(c.get("sha") or "")[:40]: c["path"] for c in chosen if c.get("path")},
+            )
             # Run selected models
             selected_models = self.app._collect_selected_models()
             if not selected_models:
@@ -820,43 +1236,86 @@ class FileHistoryTab:
                 self.app._busy_stop("Ready")
                 return
 
+            # Reuse per-commit tables summarised in earlier runs; only new commits go to the models
+            cfg = self.app.cfg
+            tables = {m: {} for m in selected_models}  # model -> {sha: table}
+            for m in selected_models:
+                for sha in dict.fromkeys(selected_shas):
+                    hit = load_cached_commit_summary(cfg, host, owner, repo, fpath, sha, m)
+                    cache_lookup("commit_summary", bool(hit))
+                    if hit:
+                        tables[m][sha] = hit
+
+            # Split each model's uncached commits into groups within the token budget (map step input)
+            budget = int(cfg.get("filehist_group_tokens") or 6000)
+            groups_by_model = {}
+            for m in selected_models:
+                todo = [c for c in chosen if (c.get("sha") or "")[:40] not in tables[m]]
+                groups_by_model[m] = build_commit_groups(todo, fpath, patches, budget) if todo else []
+
             results = {}
             errors = {}
-
-            def run_one(mname):
-                try:
-                    header_meta = {
-                        "owner": owner, "repo": repo, "path": fpath,
-                        "selected_shas": selected_shas,
-                        "selected_count": len(selected_shas),
-                        "filtered_count": len(self._filtered_commits_cache),
-                    }
-                    out = _single_model_file_history_summary(self.app.cfg, mname, combined, header_meta)
-                    return mname, out
-                except Exception as e:
-                    return mname, e
-
-            self.app._busy_start("Working… Generating summaries with selected models")
-            if bool(self.app.parallel_var.get()):
+            unsplit = {m: [] for m in selected_models}
+            group_errors = {m: [] for m in selected_models}
+
+            def run_one(mname, k):
+                groups = groups_by_model[mname]
+                group_commits, group_text = groups[k]
+                group_shas = [(c.get("sha") or "")[:40] for c in group_commits]
+                with profile_thread():
+                    try:
+                        header_meta = {
+                            "owner": owner, "repo": repo, "path": fpath,
+                            "selected_shas": group_shas,
+                            "selected_count": len(selected_shas),
+                            "filtered_count": len(self._filtered_commits_cache),
+                        }
+                        out = _single_model_file_history_summary(
+                            cfg, mname, group_text, header_meta, part=(k + 1, len(groups))
+                        )
+                        return mname, k, out
+                    except Exception as e:
+                        return mname, k, e
+
+            def record(mname, k, res):
+                groups = groups_by_model[mname]
+                if isinstance(res, Exception):
+                    group_errors[mname].append(f"group {k + 1}/{len(groups)}: {res}")
+                    return
+                group_shas = [(c.get("sha") or "")[:40] for c in groups[k][0]]
+                split = split_commit_tables(res or "", group_shas)
+                for sha, table in split.items():
+                    tables[mname][sha] = table
+                    store_commit_summary(cfg, host, owner, repo, fpath, sha, mname, table)
+                if not split and (res or "").strip():
+                    # Model ignored the COMMIT markers: keep its output (uncached) rather than lose it
+                    unsplit[mname].append(res)
+
+            tasks = [(m, k) for m in selected_models for k in range(len(groups_by_model[m]))]
+            cached_count = sum(len(t) for t in tables.values())
+            self.app._busy_start(
+                f"Working… Summarising {len(tasks)} commit group(s) ({cached_count} cached commit summaries reused)"
+            )
+            if tasks and bool(self.app.parallel_var.get()):
                 import concurrent.futures as futures
-                with futures.ThreadPoolExecutor(max_workers=min(len(selected_models), 8)) as ex:
-                    futs = [ex.submit(run_one, m) for m in selected_models]
+                with futures.ThreadPoolExecutor(max_workers=min(len(tasks), 8)) as ex:
+                    futs = [ex.submit(TRACER.bind(run_one), m, k) for m, k in tasks]
                     for f in futures.as_completed(futs):
-                        mname, res = f.result()
-                        if isinstance(res, Exception):
-                            errors[mname] = str(res); results[mname] = ""
-                        else:
-                            results[mname] = res
+                        record(*f.result())
                         self.app._busy_step()
             else:
-                for m in selected_models:
-                    mname, res = run_one(m)
-                    if isinstance(res, Exception):
-                        errors[mname] = str(res); results[mname] = ""
-                    else:
-                        results[mname] = res
+                for m, k in tasks:
+                    record(*run_one(m, k))
                     self.app._busy_step()
 
+            # Per-model result = its per-commit tables in commit order; partial output is kept
+            for m in selected_models:
+                ordered = [tables[m][sha] for sha in dict.fromkeys(selected_shas) if sha in tables[m]]
+                if ordered or unsplit[m]:
+                    results[m] = "\n\n".join(ordered + unsplit[m])
+                if group_errors[m]:
+                    errors[m] = "; ".join(group_errors[m])
+
             # Synthesize final with base model
             self.app._busy_start("Working… Synthesizing final curated summary")
             final_fragment = synthesize_file_history_with_base(
@@ -870,7 +1329,7 @@ class FileHistoryTab:
             )
 
             # Normalize (convert Markdown from model -> HTML, enforce borders & blue labels)
-            normalized_final = normalize_model_fragment(final_fragment)
+            normalized_final = normalize_model_fragment(_strip_commit_markers(final_fragment))
 
             # If there were failed models, append a section at the end
             failed_section = ""
@@ -887,10 +1346,6 @@ class FileHistoryTab:
 
             combined_fragment = normalized_final + failed_section
 
-            # Save full HTML (even if cfg says markdown, we embed as <pre>); wrapper ensures consistent page.
-            is_html = ((self.app.cfg.get("output_format") or "html").lower() == "html")
-            full_html = wrap_fragment_as_full_html(combined_fragment, is_html_fragment=is_html)
-
             ts = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
             base = os.path.basename(fpath).replace(os.sep, "_")
             rng = (
@@ -898,6 +1353,18 @@ class FileHistoryTab:
                 if len(chosen) > 1 else (chosen[0].get('sha') or "")[:7]
             )
             fname = f"{owner}-{repo}-FILEHIST-CURATED-{base}-{rng}-{ts}.html"
+            if prof:
+                prof.name_as(os.path.join(STORE_DIR, fname[:-len(".html")]))
+                combined_fragment += (
+                    '<p style="color:#6b7280;font-size:13px;">Profile: '
+                    f'<a href="{_escape_html(prof.summary_path)}" target="_blank">Open Profile Summary</a>'
+                    " (cProfile + tracemalloc; .pstats alongside)</p>"
+                )
+
+            # Save full HTML (even if cfg says markdown, we embed as <pre>); wrapper ensures consistent page.
+            is_html = _filehist_format(self.app.cfg) == "html"
+            full_html = wrap_fragment_as_full_html(combined_fragment, is_html_fragment=is_html)
+
             path = os.path.join(STORE_DIR, fname)
             with open(path, "w", encoding="utf-8") as f:
                 f.write(full_html)
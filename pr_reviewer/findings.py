@@ -0,0 +1,270 @@
+# findings.py
+"""
+Structured review output (output_format "json"). Models answer with one JSON object per review
+(REVIEW_SCHEMA); it is parsed and validated once per model, stored compactly next to the HTML
+report and rendered to HTML from the structure, so nothing downstream re-parses model HTML:
+
+    review = parse_review(text)              # FindingsError when the answer is not usable JSON
+    html = review_html(review)               # same sections as the HTML template
+    save_findings(path, pr_url, {model: review}, head_sha=...)
+
+Findings carry file, line, severity, category, observation and recommendation; multi-chunk
+reviews are merged locally with merge_reviews instead of another gateway call.
+"""
+import re
+import json
+import html as _html
+
+SEVERITIES = ("HIGH", "MEDIUM", "LOW")
+
+FINDING_SCHEMA = {
+    "type": "object",
+    "required": ["file", "line", "severity", "category", "observation", "recommendation"],
+    "properties": {
+        "file": {"type": "string", "description": "path as shown in the diff"},
+        "line": {"type": ["integer", "null"], "description": "line in the new file; null if not line-specific"},
+        "end_line": {"type": ["integer", "null"]},
+        "severity": {"enum": list(SEVERITIES)},
+        "category": {"type": "string", "description": "Correctness, Security, Performance, Concurrency, ..."},
+        "observation": {"type": "string"},
+        "recommendation": {"type": "string"},
+    },
+}
+
+REVIEW_SCHEMA = {
+    "type": "object",
+    "required": ["summary", "findings", "verdict"],
+    "properties": {
+        "summary": {"type": "string", "description": "one or two sentences on intent and purpose"},
+        "key_points": {"type": "array", "items": {"type": "string"}},
+        "files": {"type": "array", "items": {"type": "object", "properties": {
+            "file": {"type": "string"}, "changes": {"type": "array", "items": {"type": "string"}}}}},
+        "findings": {"type": "array", "items": FINDING_SCHEMA},
+        "tests": {"type": "array", "items": {"type": "object", "properties": {
+            k: {"type": "string"} for k in ("id", "title", "type", "area", "setup", "steps", "expected", "priority")}}},
+        "verdict": {"type": "string"},
+    },
+}
+
+_TEST_KEYS = ("id", "title", "type", "area", "setup", "steps", "expected", "priority")
+
+
+class FindingsError(ValueError):
+    """The model's answer is not a JSON review."""
+
+
+# ---------------------------- Parse & validate ----------------------------
+def _text(v) -> str:
+    if v is None:
+        return ""
+    if isinstance(v, (list, tuple)):
+        return "; ".join(_text(x) for x in v if x is not None)
+    return " ".join(str(v).split())
+
+
+def _line(v) -> int | None:
+    if isinstance(v, bool):
+        return None
+    if isinstance(v, int):
+        return v if v > 0 else None
+    m = re.search(r"\d+", str(v or ""))
+    return int(m.group()) if m else None
+
+
+def _severity(v) -> str:
+    s = str(v or "").upper()
+    if "CRIT" in s or "BLOCK" in s:
+        return "HIGH"
+    return next((k for k in SEVERITIES if k in s), "MEDIUM")
+
+
+def normalize_finding(raw: dict) -> dict | None:
+    """One finding in schema shape from a JSON entry or a Review Table row ("L87-L90" lines, "Risk" text); None if empty."""
+    f = {
+        "file": _text(raw.get("file") or raw.get("path")).strip("`"),
+        "line": _line(raw.get("line")),
+        "severity": _severity(raw.get("severity") or raw.get("risk")),
+        "category": _text(raw.get("category")),
+        "observation": _text(raw.get("observation") or raw.get("comment") or raw.get("issue")),
+        "recommendation": _text(raw.get("recommendation") or raw.get("fix") or raw.get("suggestion")),
+    }
+    nums = [int(n) for n in re.findall(r"\d+", str(raw.get("line") or ""))]
+    end = _line(raw.get("end_line")) or (nums[-1] if len(nums) > 1 else None)
+    if end and f["line"] and end > f["line"]:
+        f["end_line"] = end
+    return f if (f["observation"] or f["recommendation"]) else None
+
+
+def validate_review(obj) -> dict:
+    """Coerces a decoded answer to REVIEW_SCHEMA (types, severities, line numbers); drops empty findings."""
+    if isinstance(obj, list):  # a bare findings array
+        obj = {"findings": obj}
+    if not isinstance(obj, dict):
+        raise FindingsError(f"expected a JSON object, got {type(obj).__name__}")
+    findings = [f for f in (normalize_finding(x) for x in obj.get("findings") or [] if isinstance(x, dict)) if f]
+    review = {
+        "summary": _text(obj.get("summary")),
+        "key_points": [_text(x) for x in obj.get("key_points") or [] if _text(x)],
+        "files": [
+            {"file": _text(x.get("file")), "changes": [_text(c) for c in x.get("changes") or [] if _text(c)]}
+            for x in obj.get("files") or [] if isinstance(x, dict) and x.get("file")
+        ],
+        "findings": findings,
+        "tests": [{k: _text(t.get(k)) for k in _TEST_KEYS} for t in obj.get("tests") or [] if isinstance(t, dict)],
+        "verdict": _text(obj.get("verdict")),
+    }
+    if not (review["summary"] or review["findings"] or review["verdict"] or review["files"]):
+        raise FindingsError("JSON answer has no summary, findings, files or verdict")
+    return review
+
+
+def parse_review(text: str) -> dict:
+    """The first JSON object in a model answer (code fences and surrounding prose are ignored), validated."""
+    s = (text or "").strip()
+    start = min([i for i in (s.find("{"), s.find("[")) if i >= 0], default=-1)
+    if start < 0:
+        raise FindingsError("no JSON object in the answer")
+    try:
+        obj, _ = json.JSONDecoder().raw_decode(s[start:])
+    except json.JSONDecodeError as e:
+        end = s.rfind("}")
+        try:
+            obj = json.loads(s[s.find("{"):end + 1])
+        except (json.JSONDecodeError, ValueError):
+            raise FindingsError(f"invalid JSON: {e}") from None
+    return validate_review(obj)
+
+
+def dumps_review(review: dict) -> str:
+    """Compact canonical JSON (what single_model_review returns in json mode)."""
+    return json.dumps(review, ensure_ascii=False, separators=(",", ":"))
+
+
+def compact_review(review: dict) -> str:
+    """
+    Synthesis input: summary, verdict and findings as [file, line, severity, category, observation,
+    recommendation] rows in compact JSON, a fraction of the tokens of the rendered draft.
+    """
+    doc = {k: review[k] for k in ("summary", "verdict") if review.get(k)}
+    doc["findings"] = [[f["file"], f["line"], f["severity"], f["category"], f["observation"], f["recommendation"]]
+                       for f in review.get("findings") or []]
+    return json.dumps(doc, ensure_ascii=False, separators=(",", ":"))
+
+
+# ---------------------------- Merge & analytics ----------------------------
+def finding_key(f: dict) -> tuple:
+    return f["file"], f["line"], " ".join(f["observation"].lower().split())
+
+
+def _unique(items) -> list:
+    seen, out = set(), []
+    for x in items:
+        k = x.lower() if isinstance(x, str) else x
+        if x and k not in seen:
+            seen.add(k)
+            out.append(x)
+    return out
+
+
+def merge_reviews(reviews: list[dict]) -> dict:
+    """One review from per-chunk reviews of the same model: union of files, findings and tests, exact duplicates dropped."""
+    files: dict[str, list[str]] = {}
+    for r in reviews:
+        for x in r["files"]:
+            files[x["file"]] = _unique(files.get(x["file"], []) + x["changes"])
+    findings, seen = [], set()
+    for r in reviews:
+        for f in r["findings"]:
+            if finding_key(f) not in seen:
+                seen.add(finding_key(f))
+                findings.append(f)
+    tests, titles = [], set()
+    for r in reviews:
+        for t in r["tests"]:
+            if t["title"].lower() not in titles:
+                titles.add(t["title"].lower())
+                tests.append(dict(t, id=f"TC-{len(tests) + 1:03d}"))
+    return {
+        "summary": " ".join(_unique(r["summary"] for r in reviews)),
+        "key_points": _unique(p for r in reviews for p in r["key_points"]),
+        "files": [{"file": k, "changes": v} for k, v in files.items()],
+        "findings": findings,
+        "tests": tests,
+        "verdict": " ".join(_unique(r["verdict"] for r in reviews)),
+    }
+
+
+def severity_counts(review: dict) -> dict[str, int]:
+    counts = {s: 0 for s in SEVERITIES}
+    for f in review.get("findings") or []:
+        counts[f["severity"]] = counts.get(f["severity"], 0) + 1
+    return counts
+
+
+# ---------------------------- Storage ----------------------------
+def save_findings(path: str, pr_url: str, reviews: dict[str, dict], head_sha: str | None = None,
+                  consensus: list[dict] | None = None):
+    """Compact JSON: {"v", "pr_url", "head_sha", "models": {model: review}, "consensus"}; empty fields are dropped."""
+    def _compact(review: dict) -> dict:
+        out = {k: v for k, v in review.items() if v}
+        if "findings" in out:
+            out["findings"] = [{k: v for k, v in f.items() if v not in ("", None)} for f in out["findings"]]
+        return out
+
+    doc = {"v": 1, "pr_url": pr_url, "head_sha": head_sha, "models": {m: _compact(r) for m, r in reviews.items()}}
+    if consensus:
+        doc["consensus"] = consensus
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(doc, f, ensure_ascii=False, separators=(",", ":"))
+
+
+def load_findings(path: str) -> dict:
+    """Inverse of save_findings; every review comes back with all REVIEW_SCHEMA keys."""
+    with open(path, "r", encoding="utf-8") as f:
+        doc = json.load(f) or {}
+    doc["models"] = {m: validate_review(r) for m, r in (doc.get("models") or {}).items()}
+    return doc
+
+
+# ---------------------------- HTML ----------------------------
+def _lines_label(f: dict) -> str:
+    if not f.get("line"):
+        return "-"
+    return f"L{f['line']}" + (f"–L{f['end_line']}" if f.get("end_line") else "")
+
+
+def review_html(review: dict) -> str:
+    """HTML fragment with the sections of the HTML prompt template, built from a validated review."""
+    esc = _html.escape
+    p = ["<section>", "<h2>Change Requirement</h2>",
+         f"<p><strong>High-Level Summary:</strong> {esc(review['summary'])}</p>"]
+    if review["key_points"]:
+        p.append("<h3>Key Points</h3><ul>" + "".join(f"<li>{esc(x)}</li>" for x in review["key_points"]) + "</ul>")
+    if review["files"]:
+        p.append("<h2>Change Summary by File</h2><ul>")
+        for x in review["files"]:
+            steps = "".join(f"<li>{esc(c)}</li>" for c in x["changes"])
+            p.append(f"<li><strong>{esc(x['file'])}</strong>" + (f"<ol>{steps}</ol>" if steps else "") + "</li>")
+        p.append("</ul>")
+
+    p.append("<h2>Review Table</h2>")
+    if review["findings"]:
+        p.append("<table><thead><tr><th>File</th><th>Line No.</th><th>Category</th>"
+                 "<th>Code Change Risk (LOW/MEDIUM/HIGH)</th><th>Observation</th><th>Recommendation</th></tr></thead><tbody>")
+        for f in sorted(review["findings"], key=lambda f: SEVERITIES.index(f["severity"])):
+            p.append(f"<tr><td>{esc(f['file'])}</td><td>{_lines_label(f)}</td><td>{esc(f['category'])}</td>"
+                     f"<td>{f['severity']}</td><td>{esc(f['observation'])}</td><td>{esc(f['recommendation'])}</td></tr>")
+        p.append("</tbody></table>")
+    else:
+        p.append("<p>No findings.</p>")
+
+    if review["tests"]:
+        p.append("<h2>Suggested Test Cases</h2><table><thead><tr><th>ID</th><th>Title</th><th>Type</th>"
+                 "<th>Area / File</th><th>Preconditions / Setup</th><th>Steps (numbered)</th><th>Expected Result</th>"
+                 "<th>Priority (P0/P1/P2)</th></tr></thead><tbody>")
+        for t in review["tests"]:
+            p.append("<tr>" + "".join(f"<td>{esc(t[k])}</td>" for k in _TEST_KEYS) + "</tr>")
+        p.append("</tbody></table>")
+    p.append(f"<h2>Overall Verdict</h2><p>{esc(review['verdict'])}</p>")
+    p.append("</section>")
+    return "".join(p)
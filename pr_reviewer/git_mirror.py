@@ -0,0 +1,159 @@
+# git_mirror.py
+"""
+Optional local backend: a bare `git clone --mirror` per repository, refreshed with an incremental
+`git fetch`, that serves PR diffs, file history and per-commit patches from local git instead of
+the GitHub REST API. Enabled with cfg["git_mirror"]; results have the same shapes as the API helpers.
+"""
+import os
+import re
+import time
+import base64
+import threading
+import subprocess
+
+from .storage import STORE_DIR
+from .tls import get_verify_path
+from .tracing import TRACER
+
+MIRROR_DIR = os.path.join(STORE_DIR, "git_mirrors")
+
+_US, _RS = "\x1f", "\x1e"  # field / record separators for `git log --format`
+_DIFF_HEADER_RE = re.compile(r"^diff --git a/(?P<a>.+?) b/(?P<b>.+)$", re.MULTILINE)
+
+_locks: dict[str, threading.Lock] = {}
+_locks_guard = threading.Lock()
+
+
+def mirror_path(host: str, owner: str, repo: str) -> str:
+    return os.path.join(MIRROR_DIR, host, owner, repo + ".git")
+
+
+def _remote_url(cfg: dict, host: str, owner: str, repo: str) -> str:
+    tmpl = (cfg.get("git_mirror_remote") or "https://{host}/{owner}/{repo}.git").strip()
+    return tmpl.format(host=host, owner=owner, repo=repo)
+
+
+def _git_env(cfg: dict) -> dict:
+    """Token and CA bundle go through GIT_CONFIG_* env vars: never on the command line or in the mirror's config."""
+    env = dict(os.environ, GIT_TERMINAL_PROMPT="0", TZ="UTC")
+    tok = (cfg.get("github_token") or "").strip()
+    extra = []
+    if tok:
+        basic = base64.b64encode(f"x-access-token:{tok}".encode("utf-8")).decode("ascii")
+        extra.append(("http.extraHeader", f"Authorization: Basic {basic}"))
+    extra.append(("http.sslCAInfo", get_verify_path(cfg)))
+    env["GIT_CONFIG_COUNT"] = str(len(extra))
+    for i, (k, v) in enumerate(extra):
+        env[f"GIT_CONFIG_KEY_{i}"] = k
+        env[f"GIT_CONFIG_VALUE_{i}"] = v
+    return env
+
+
+def _git(cfg: dict, git_dir: str | None, *args: str, timeout: int = 600) -> str:
+    cmd = ["git"] + (["--git-dir", git_dir] if git_dir else []) + list(args)
+    with TRACER.span(f"git.{args[0]}") as sp:
+        try:
+            p = subprocess.run(cmd, capture_output=True, env=_git_env(cfg), timeout=timeout)
+        except FileNotFoundError:
+            raise RuntimeError("git executable not found; install git or turn off the local mirror backend.")
+        if p.returncode != 0:
+            raise RuntimeError(f"git {args[0]} failed: {p.stderr.decode('utf-8', 'replace').strip()}")
+        sp.set(bytes=len(p.stdout))
+        return p.stdout.decode("utf-8", "replace")
+
+
+def ensure_mirror(cfg: dict, host: str, owner: str, repo: str) -> str:
+    """
+    Returns the mirror's git dir, cloning it on first use and fetching new objects when the
+    last fetch is older than cfg["git_mirror_fetch_interval_s"].
+    """
+    path = mirror_path(host, owner, repo)
+    with _locks_guard:
+        lock = _locks.setdefault(path, threading.Lock())
+    with lock:
+        stamp = os.path.join(path, "pr-reviewer-fetched")
+        if not os.path.isdir(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            _git(cfg, None, "clone", "--mirror", "--quiet", _remote_url(cfg, host, owner, repo), path, timeout=3600)
+        else:
+            interval = float(cfg.get("git_mirror_fetch_interval_s") or 0)
+            try:
+                fresh = time.time() - os.path.getmtime(stamp) < interval
+            except OSError:
+                fresh = False
+            if not fresh:
+                _git(cfg, path, "fetch", "--prune", "--quiet", "origin")
+        with open(stamp, "w", encoding="utf-8") as f:
+            f.write(str(time.time()))
+    return path
+
+
+# ---------------------------- API-shaped helpers ----------------------------
+def mirror_pr_diff(cfg: dict, host: str, owner: str, repo: str, number: int) -> str:
+    """
+    Same text as the REST diff media type: base...head (changes since the merge base).
+    GitHub mirrors carry refs/pull/<n>/head; the base tip is the first parent of refs/pull/<n>/merge,
+    or the PR's base branch from the API when the PR has no merge ref (e.g. conflicts or closed).
+    """
+    git_dir = ensure_mirror(cfg, host, owner, repo)
+    head = f"refs/pull/{number}/head"
+    try:
+        base = _git(cfg, git_dir, "rev-parse", "--verify", f"refs/pull/{number}/merge^1").strip()
+    except RuntimeError:
+        from .github_api import fetch_pr_meta  # late import: github_api dispatches here
+        meta = fetch_pr_meta(cfg, f"https://{host}/{owner}/{repo}/pull/{number}")
+        base = ((meta.get("base") or {}).get("sha") or "").strip()
+        if not base:
+            raise RuntimeError(f"Cannot resolve the base of PR #{number} in the local mirror.")
+    return _git(cfg, git_dir, "diff", "--no-color", "--no-ext-diff", "-M", f"{base}...{head}")
+
+
+def mirror_file_history(cfg: dict, host: str, owner: str, repo: str, ref: str, path: str,
+                        follow_renames: bool = True) -> list:
+    """
+    `git log [--follow]` for one file, newest first, shaped like REST /commits items.
+    With renames followed, commits made under an older name carry it in "path".
+    """
+    git_dir = ensure_mirror(cfg, host, owner, repo)
+    out = _git(
+        cfg, git_dir, "log", "--name-only", "--date=format-local:%Y-%m-%dT%H:%M:%SZ",
+        f"--format={_RS}%H{_US}%an{_US}%ad{_US}%s",
+        *(["--follow"] if follow_renames else []), ref, "--", path,
+    )
+    commits = []
+    for rec in out.split(_RS):
+        if not rec.strip():
+            continue
+        header, _, names = rec.partition("\n")
+        sha, author, date, subject = (header.split(_US) + ["", "", "", ""])[:4]
+        item = {
+            "sha": sha,
+            "commit": {"author": {"name": author, "date": date}, "message": subject},
+            "author": {"login": ""},
+        }
+        name = next((n for n in names.splitlines() if n.strip()), path)
+        if name != path:
+            item["path"] = name
+        commits.append(item)
+    return commits
+
+
+def mirror_commit_patch_for_file(cfg: dict, host: str, owner: str, repo: str, sha: str, file_path: str):
+    """
+    Returns (patch for the target file, list of other modified files), like the REST helper:
+    the patch starts at the first hunk header and the file also matches by its pre-rename name.
+    """
+    git_dir = ensure_mirror(cfg, host, owner, repo)
+    # Merge commits: diff against the first parent (what the REST API returns), not a combined diff --cc
+    show = _git(cfg, git_dir, "show", "--no-color", "--no-ext-diff", "-M", "-m", "--first-parent", "--format=", sha)
+    marks = list(_DIFF_HEADER_RE.finditer(show))
+    patch_for_target, others = "", []
+    for i, m in enumerate(marks):
+        a, b = m.group("a"), m.group("b")
+        block = show[m.start():marks[i + 1].start() if i + 1 < len(marks) else len(show)]
+        if file_path in (a, b):
+            hunk = block.find("\n@@")
+            patch_for_target = block[hunk + 1:].rstrip("\n") if hunk >= 0 else ""
+        else:
+            others.append(b)
+    return patch_for_target, others
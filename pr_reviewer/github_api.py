@@ -8,6 +8,10 @@ from typing import List, Tuple, Dict, Any, Optional
 import requests
 
 from .tls import get_verify_path
+from .commit_store import COMMIT_STORE, configure_commit_store
+from .git_mirror import mirror_pr_diff
+from .tracing import TRACER, traced
+from .metrics import observe_github_response, cache_lookup
 
 # ---------------------------- PR URL parsing & basics ----------------------------
 PR_URL_RE = re.compile(
@@ -40,12 +44,21 @@ def _gh_headers(cfg: Dict[str, Any], accept: str) -> Dict[str, str]:
     }
 
 # ---------------------------- Pull Request content/meta ----------------------------
+@traced("github.pr_diff")
 def fetch_pr_diff(cfg: Dict[str, Any], pr_url: str) -> str:
     """
     Raw unified diff for a PR (no filtering). Use fetch_pr_diff_filtered if
     you want generated files excluded and the skipped-file list.
     """
     host, owner, repo, number = parse_pr_url(pr_url)
+    TRACER.current().set(pr=f"{owner}/{repo}#{number}")
+    if cfg.get("git_mirror"):
+        try:
+            diff = mirror_pr_diff(cfg, host, owner, repo, number)
+            TRACER.current().set(source="git_mirror", bytes=len(diff))
+            return diff
+        except Exception as e:
+            print(f"[WARN] Local git mirror unavailable, using the GitHub API: {e}")
     api_base = github_api_base_from_host(host)
     url = f"{api_base}/repos/{owner}/{repo}/pulls/{number}"
     r = requests.get(
@@ -54,6 +67,7 @@ def fetch_pr_diff(cfg: Dict[str, Any], pr_url: str) -> str:
         verify=get_verify_path(cfg),
         timeout=60,
     )
+    observe_github_response(r, "pulls.diff")
     if r.status_code == 401:
         raise RuntimeError(
             "GitHub 401 Unauthorized. Ensure the PAT has repo read access for this repository."
@@ -61,16 +75,18 @@ def fetch_pr_diff(cfg: Dict[str, Any], pr_url: str) -> str:
     if r.status_code == 403 and "rate limit" in (r.text or "").lower():
         raise RuntimeError("GitHub rate limit/abuse detection hit (403). Try again later.")
     r.raise_for_status()
+    TRACER.current().set(source="rest", status=r.status_code, bytes=len(r.content))
     return r.text
 
 
-def fetch_pr_diff_filtered(cfg: dict, pr_url: str):
+def fetch_pr_diff_filtered(cfg: dict, pr_url: str, raw: Optional[str] = None):
     """
     Always returns (filtered_diff_text: str, skipped_files: List[str]).
-    Never returns 3+ items.
+    Never returns 3+ items. Pass `raw` to filter a diff obtained elsewhere (e.g. an SCM provider).
     """
     # Get raw diff
-    raw = fetch_pr_diff(cfg, pr_url)  # existing function
+    if raw is None:
+        raw = fetch_pr_diff(cfg, pr_url)  # existing function
 
     # Filter (helper may return 2 or 3 items in other versions)
     filtered, skipped = None, []
@@ -94,6 +110,7 @@ def fetch_pr_diff_filtered(cfg: dict, pr_url: str):
     return filtered, skipped
 
 
+@traced("github.pr_meta")
 def fetch_pr_meta(cfg: Dict[str, Any], pr_url: str) -> Dict[str, Any]:
     host, owner, repo, number = parse_pr_url(pr_url)
     api_base = github_api_base_from_host(host)
@@ -104,9 +121,156 @@ def fetch_pr_meta(cfg: Dict[str, Any], pr_url: str) -> Dict[str, Any]:
         verify=get_verify_path(cfg),
         timeout=60,
     )
+    observe_github_response(r, "pulls.get")
+    TRACER.current().set(status=r.status_code, bytes=len(r.content))
     return r.json() if r.ok else {}
 
+
+@traced("github.review_post")
+def post_pr_review(cfg: Dict[str, Any], pr_url: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Creates one pull request review with all its inline comments in a single call
+    (POST /repos/{owner}/{repo}/pulls/{number}/reviews). Needs a PAT with pull request write access.
+    """
+    host, owner, repo, number = parse_pr_url(pr_url)
+    api_base = github_api_base_from_host(host)
+    r = requests.post(
+        f"{api_base}/repos/{owner}/{repo}/pulls/{number}/reviews",
+        headers=_gh_headers(cfg, "application/vnd.github+json"),
+        json=payload,
+        verify=get_verify_path(cfg),
+        timeout=60,
+    )
+    observe_github_response(r, "pulls.reviews.create")
+    TRACER.current().set(pr=f"{owner}/{repo}#{number}", status=r.status_code,
+                         comments=len(payload.get("comments") or []))
+    if r.status_code in (403, 429) and "rate limit" in (r.text or "").lower():
+        raise RuntimeError(f"GitHub rate limit/abuse detection hit ({r.status_code}) posting the review. Try again later.")
+    if r.status_code in (401, 403, 404):
+        raise RuntimeError(
+            f"GitHub {r.status_code} posting the review. Ensure the PAT can write pull requests on {owner}/{repo}."
+        )
+    if r.status_code == 422:
+        try:
+            detail = "; ".join([r.json().get("message", "")] + [str(e) for e in r.json().get("errors") or []])
+        except ValueError:
+            detail = r.text
+        raise RuntimeError(f"GitHub rejected the review (422): {detail}")
+    r.raise_for_status()
+    return r.json()
+
+# ---------------------------- Commit objects ----------------------------
+@traced("github.commit")
+def fetch_commit(cfg: Dict[str, Any], host: str, owner: str, repo: str, sha: str) -> Dict[str, Any]:
+    """
+    Commit detail JSON (/repos/{owner}/{repo}/commits/{sha}), read from the local commit
+    store first. Commits are immutable, so a full-SHA hit never needs a network call.
+    """
+    configure_commit_store(cfg)
+    cached = COMMIT_STORE.get(sha)
+    TRACER.current().set(sha=sha[:12], cache_hit=cached is not None)
+    cache_lookup("commit_store", cached is not None)
+    if cached is not None:
+        return cached
+
+    api_base = github_api_base_from_host(host)
+    r = requests.get(
+        f"{api_base}/repos/{owner}/{repo}/commits/{sha}",
+        headers=_gh_headers(cfg, "application/vnd.github+json"),
+        verify=get_verify_path(cfg),
+        timeout=60,
+    )
+    observe_github_response(r, "commits.get")
+    if not r.ok:
+        raise RuntimeError(f"Failed to fetch commit detail: {r.status_code} {r.text}")
+    TRACER.current().set(bytes=len(r.content))
+    data = r.json()
+    COMMIT_STORE.put(data.get("sha") or sha, data)
+    return data
+
+# ---------------------------- File history (GraphQL) ----------------------------
+def github_graphql_url_from_host(host: str) -> str:
+    return "https://api.github.com/graphql" if host.lower() == "github.com" else f"https://{host}/api/graphql"
+
+
+FILE_HISTORY_QUERY = """
+query($owner: String!, $name: String!, $ref: String!, $path: String!, $first: Int!, $after: String) {
+  repository(owner: $owner, name: $name) {
+    object(expression: $ref) {
+      ... on Commit {
+        history(first: $first, after: $after, path: $path) {
+          pageInfo { hasNextPage endCursor }
+          nodes { oid messageHeadline author { name date user { login } } }
+        }
+      }
+    }
+  }
+}
+"""
+
+
+def _history_node_to_commit(node: dict) -> Dict[str, Any]:
+    """Shapes a GraphQL history node like the REST /commits items the File History tab renders."""
+    author = node.get("author") or {}
+    return {
+        "sha": node.get("oid") or "",
+        "commit": {
+            "author": {"name": author.get("name") or "", "date": author.get("date") or ""},
+            "message": node.get("messageHeadline") or "",
+        },
+        "author": {"login": (author.get("user") or {}).get("login") or ""},
+    }
+
+
+@traced("github.file_history_graphql")
+def fetch_file_history_graphql(cfg: Dict[str, Any], host: str, owner: str, repo: str, ref: str, path: str,
+                               stop_at: Optional[str] = None, page_size: int = 100) -> Tuple[List[Dict[str, Any]], bool]:
+    """
+    Full commit history of one file (newest first) via GraphQL `history(path:)` with cursor paging;
+    unlike the REST commits endpoint there is no page cap. Only the fields the tab shows are requested.
+    Paging stops before `stop_at` (the newest commit already stored locally).
+    Returns (commits, reached_stop_at).
+    """
+    url = github_graphql_url_from_host(host)
+    headers = _gh_headers(cfg, "application/vnd.github+json")
+    verify = get_verify_path(cfg)
+
+    commits: List[Dict[str, Any]] = []
+    after = None
+    while True:
+        r = requests.post(
+            url,
+            json={
+                "query": FILE_HISTORY_QUERY,
+                "variables": {"owner": owner, "name": repo, "ref": ref, "path": path,
+                              "first": page_size, "after": after},
+            },
+            headers=headers,
+            verify=verify,
+            timeout=60,
+        )
+        observe_github_response(r, "graphql")
+        if not r.ok:
+            raise RuntimeError(f"GraphQL file history failed: {r.status_code} {r.text}")
+        data = r.json() or {}
+        if data.get("errors"):
+            raise RuntimeError(f"GraphQL file history failed: {data['errors'][0].get('message', data['errors'])}")
+        obj = ((data.get("data") or {}).get("repository") or {}).get("object")
+        if not obj or "history" not in obj:
+            raise RuntimeError(f"Ref not found or not a commit: {ref}")
+        history = obj["history"]
+        TRACER.current().add("pages")
+        for node in history.get("nodes") or []:
+            if stop_at and node.get("oid") == stop_at:
+                return commits, True
+            commits.append(_history_node_to_commit(node))
+        page = history.get("pageInfo") or {}
+        if not page.get("hasNextPage"):
+            return commits, False
+        after = page.get("endCursor")
+
 # ---------------------------- PR pagination helpers ----------------------------
+@traced("github.list_prs")
 def fetch_all_prs(cfg: dict, host: str, owner: str, repo: str):
     token = (cfg.get("github_token") or "").strip()
     if not token:
@@ -126,6 +290,7 @@ def fetch_all_prs(cfg: dict, host: str, owner: str, repo: str):
     while True:
         url = f"{api_base}/repos/{owner}/{repo}/pulls?state=all&per_page={per_page}&page={page}"
         r = requests.get(url, headers=headers, verify=get_verify_path(cfg), timeout=60)
+        observe_github_response(r, "pulls.list")
         if not r.ok:
             raise RuntimeError(f"Failed to fetch PRs: {r.status_code} {r.text}")
         batch = r.json() or []
@@ -254,6 +419,7 @@ def _page_json(url: str, headers: dict, verify) -> Optional[List[dict]]:
         sep = '&' if '?' in url else '?'
         paged_url = f"{url}{sep}per_page={per_page}&page={page}"
         r = requests.get(paged_url, headers=headers, verify=verify, timeout=60)
+        observe_github_response(r, "repos.list")
         if r.status_code == 404:
             return None
         if not r.ok:
@@ -268,6 +434,7 @@ def _page_json(url: str, headers: dict, verify) -> Optional[List[dict]]:
     return items
 
 
+@traced("github.list_repos")
 def fetch_all_repos_for_owner(cfg: dict, host: str, owner: str) -> list[str]:
     """
     Fetch ALL repositories for a given owner (user or org), across all pages.
@@ -0,0 +1,280 @@
+# github_review.py
+"""
+Publishes a finished review to GitHub as ONE pull request review. Each "Review Table" row whose
+File / Line No. lands on the PR diff becomes an inline comment at that diff position; rows that
+cannot be placed (unchanged lines, unknown files, no line) are listed in the review body.
+
+    payload = build_review_payload(cfg, diff, results, meta)
+    publish_review(cfg, pr_url, payload)    # github_review_dry_run: print the payload, post nothing
+
+All comments go out in a single POST /repos/{owner}/{repo}/pulls/{n}/reviews. Posting them one call
+each is what trips GitHub's secondary (content-creation) rate limits on bulk and webhook runs.
+"""
+import re
+import json
+from html.parser import HTMLParser
+
+from .scm import get_provider
+from .tracing import TRACER
+
+REVIEW_EVENTS = ("COMMENT", "REQUEST_CHANGES", "APPROVE")
+MAX_BODY_CHARS = 60000  # GitHub rejects review/comment bodies over 65536 characters
+_SEVERITY_RANK = {"CRITICAL": 0, "HIGH": 1, "MEDIUM": 2, "LOW": 3}
+_EMPTY_CELLS = ("-", "—", "n/a", "none")
+
+# column -> header keywords (HTML prompt: Line No./Code Change Risk/Observation/Recommendation,
+# markdown prompt: Location/Severity/Comment/Suggested fix)
+_COLUMNS = {
+    "file": ("file",),
+    "line": ("line", "location"),
+    "category": ("category",),
+    "severity": ("risk", "severity"),
+    "observation": ("observation", "comment", "issue"),
+    "recommendation": ("recommend", "fix", "suggest"),
+}
+
+
+# ---------------------------- Review Table rows ----------------------------
+class _TableParser(HTMLParser):
+    """Cell text of the first <table> in the fed HTML, one list per <tr>."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.rows: list[list[str]] = []
+        self._depth = 0
+        self._done = False
+        self._cell: list[str] | None = None
+
+    def handle_starttag(self, tag, attrs):
+        if self._done:
+            return
+        if tag == "table":
+            self._depth += 1
+        elif self._depth == 1 and tag == "tr":
+            self.rows.append([])
+        elif self._depth == 1 and tag in ("td", "th") and self.rows:
+            self._cell = []
+        elif self._cell is not None and tag == "br":
+            self._cell.append(" ")
+
+    def handle_endtag(self, tag):
+        if self._done:
+            return
+        if tag in ("td", "th") and self._cell is not None:
+            self.rows[-1].append(" ".join("".join(self._cell).split()))
+            self._cell = None
+        elif tag == "table":
+            self._depth -= 1
+            self._done = self._depth <= 0
+
+    def handle_data(self, data):
+        if self._cell is not None:
+            self._cell.append(data)
+
+
+def _table_rows(text: str) -> list[list[str]]:
+    """Rows of the table that follows the "Review Table" heading (HTML or markdown pipes)."""
+    m = re.search(r"review\s+table", text or "", re.IGNORECASE)
+    if not m:
+        return []
+    rest = text[m.end():]
+    t = re.search(r"<table\b", rest, re.IGNORECASE)
+    nxt = re.search(r"<h[1-6]\b|^\s{0,3}#{1,6}\s", rest, re.IGNORECASE | re.MULTILINE)
+    if t and (not nxt or t.start() < nxt.start()):
+        parser = _TableParser()
+        parser.feed(rest[t.start():])
+        return [r for r in parser.rows if r]
+
+    rows, started = [], False
+    for line in rest.splitlines():
+        s = re.sub(r"</?p>", "", line).strip()
+        if s.startswith("|"):
+            started = True
+            cells = [c.strip() for c in s.strip("|").split("|")]
+            if not all(re.fullmatch(r":?-{2,}:?", c) for c in cells if c):
+                rows.append(cells)
+        elif started and s:
+            break
+    return rows
+
+
+def parse_review_table(text: str) -> list[dict]:
+    """Review Table rows as {"file", "line", "category", "severity", "observation", "recommendation"}."""
+    rows = _table_rows(text)
+    if not rows:
+        return []
+    header = [h.lower() for h in rows[0]]
+    cols: dict[str, int] = {}
+    for key, words in _COLUMNS.items():
+        for i, h in enumerate(header):
+            if i not in cols.values() and any(w in h for w in words):
+                cols[key] = i
+                break
+    if "file" not in cols:
+        return []
+    out = []
+    for r in rows[1:]:
+        item = {k: (r[i].strip() if i < len(r) else "") for k, i in cols.items()}
+        item = {k: ("" if v.lower() in _EMPTY_CELLS else v) for k, v in item.items()}
+        for k in _COLUMNS:
+            item.setdefault(k, "")
+        if item["observation"] or item["recommendation"]:
+            out.append(item)
+    return out
+
+
+def _finding_rows(review: dict) -> list[dict]:
+    """Review Table rows from a structured review (findings.py), without re-parsing any HTML."""
+    return [
+        {"file": f["file"], "category": f["category"], "severity": f["severity"],
+         "observation": f["observation"], "recommendation": f["recommendation"],
+         "line": (f"L{f['line']}" + (f"-L{f['end_line']}" if f.get("end_line") else "")) if f.get("line") else ""}
+        for f in review.get("findings") or []
+    ]
+
+
+# ---------------------------- Diff positions ----------------------------
+def diff_positions(diff: str) -> dict[str, dict[int, int]]:
+    """
+    {path: {new-file line: diff position}} for every added or context line. Positions follow the
+    GitHub reviews API: 1 is the line below the file's first @@ header and counting continues
+    through later hunk headers until the next file.
+    """
+    out: dict[str, dict[int, int]] = {}
+    path, lines, pos, new_ln = None, None, None, 0
+    for line in (diff or "").splitlines():
+        if line.startswith("diff --git "):
+            path, lines, pos = None, None, None
+        elif pos is None and line.startswith("+++ "):
+            target = line[4:].strip()
+            path = None if target == "/dev/null" else (target[2:] if target.startswith("b/") else target)
+            lines = out.setdefault(path, {}) if path else None
+        elif line.startswith("@@"):
+            m = re.match(r"^@@ -\d+(?:,\d+)? \+(\d+)(?:,\d+)? @@", line)
+            pos = 0 if pos is None else pos + 1
+            new_ln = int(m.group(1)) if m else new_ln
+        elif pos is not None:
+            pos += 1
+            if lines is None or line.startswith("\\"):
+                continue
+            if line.startswith("+") or line.startswith(" ") or line == "":
+                lines[new_ln] = pos
+                new_ln += 1
+    return out
+
+
+def _match_path(name: str, paths) -> str | None:
+    name = re.sub(r"^(?:[ab]/|\./)", "", (name or "").strip().strip("`'\" "))
+    if not name:
+        return None
+    if name in paths:
+        return name
+    tail = [p for p in paths if p.endswith("/" + name)]
+    return tail[0] if len(tail) == 1 else None
+
+
+def _place(row: dict, positions: dict[str, dict[int, int]], slack: int) -> tuple[str | None, int | None]:
+    """(path, position) for a row; position is None when the line is not on the diff."""
+    path = _match_path(row["file"], positions)
+    if not path:
+        return None, None
+    nums = [int(n) for n in re.findall(r"\d+", row["line"])]
+    if not nums:
+        return path, None
+    lines = positions[path]
+    lo, hi = nums[0], (nums[-1] if 0 <= nums[-1] - nums[0] <= 200 else nums[0])
+    for ln in range(lo, hi + 1):  # first changed line inside the cited range
+        if ln in lines:
+            return path, lines[ln]
+    for d in range(1, slack + 1):  # models are often a line or two off
+        for ln in (lo - d, hi + d):
+            if ln in lines:
+                return path, lines[ln]
+    return path, None
+
+
+# ---------------------------- Payload ----------------------------
+def _severity(row: dict) -> str:
+    s = (row.get("severity") or "").upper()
+    return next((k for k in _SEVERITY_RANK if k in s), s)
+
+
+def _finding_text(row: dict) -> str:
+    head = " · ".join(x for x in (_severity(row), row["category"]) if x)
+    text = f"**{head}** — {row['observation']}" if head else row["observation"]
+    if row["recommendation"]:
+        text += f"\n\n*Suggested fix:* {row['recommendation']}"
+    return text
+
+
+def build_review_payload(cfg: dict, diff: str, results: dict[str, str], meta: dict | None = None,
+                         head_sha: str | None = None) -> dict:
+    """
+    Body for POST /pulls/{n}/reviews from each model's output (`results`: model -> raw text, or the
+    validated review dict in json mode). The review is anchored to `head_sha` (default: the meta's head).
+    Identical findings from several models are merged; at most cfg["github_review_max_comments"]
+    inline comments, highest severity first, the rest go to the review body.
+    """
+    positions = diff_positions(diff)
+    slack = int(cfg.get("github_review_line_slack", 2) or 0)
+    max_comments = int(cfg.get("github_review_max_comments", 30) or 0)
+
+    findings: dict[tuple, dict] = {}  # (path, position, observation) -> row + models
+    for model, text in results.items():
+        rows = _finding_rows(text) if isinstance(text, dict) else parse_review_table(text or "")
+        for row in rows:
+            path, pos = _place(row, positions, slack)
+            key = (path or row["file"], pos if pos is not None else row["line"], row["observation"].lower())
+            f = findings.setdefault(key, {**row, "path": path, "position": pos, "models": []})
+            f["models"].append(model)
+
+    ranked = sorted(findings.values(), key=lambda f: (_SEVERITY_RANK.get(_severity(f), 9), f["file"], f["line"]))
+    inline = [f for f in ranked if f["position"] is not None]
+    general = [f for f in ranked if f["position"] is None] + inline[max_comments:]
+    inline = inline[:max_comments]
+
+    by_pos: dict[tuple[str, int], list[dict]] = {}
+    for f in inline:
+        by_pos.setdefault((f["path"], f["position"]), []).append(f)
+    comments = [
+        {"path": path, "position": pos,
+         "body": "\n\n---\n\n".join(f"{_finding_text(f)}\n\n<sub>{', '.join(f['models'])}</sub>" for f in fs)}
+        for (path, pos), fs in by_pos.items()
+    ]
+
+    models = [m for m, t in results.items() if (t if isinstance(t, dict) else (t or "").strip())]
+    body = [f"### Automated PR review ({len(models)} model{'s' if len(models) != 1 else ''})",
+            ", ".join(f"`{m}`" for m in models), "",
+            f"{len(inline)} finding(s) as inline comments on {len(comments)} line(s)."]
+    if general:
+        body += ["", "#### Other findings (not on a changed line)"]
+        for f in general:
+            where = f"`{f['path'] or f['file']}`" + (f" {f['line']}" if f["line"] else "") if f["file"] else "General"
+            body.append(f"- {where}: {_finding_text(f).replace(chr(10) * 2, ' ')} ({', '.join(f['models'])})")
+    text = "\n".join(body)
+    if len(text) > MAX_BODY_CHARS:
+        text = text[:MAX_BODY_CHARS] + "\n\n… (truncated; see the HTML report)"
+
+    event = (cfg.get("github_review_event") or "COMMENT").upper()
+    payload = {"body": text, "event": event if event in REVIEW_EVENTS else "COMMENT", "comments": comments}
+    head_sha = head_sha or ((meta or {}).get("head") or {}).get("sha")
+    if head_sha:
+        payload["commit_id"] = head_sha  # positions refer to this revision of the diff
+    return payload
+
+
+def publish_review(cfg: dict, pr_url: str, payload: dict, dry_run: bool | None = None) -> dict:
+    """
+    Posts `payload` as one review (one API call). With dry_run (default cfg["github_review_dry_run"])
+    the request is printed as JSON and nothing is sent.
+    Returns {"dry_run", "comments", "id", "html_url"}.
+    """
+    dry_run = bool(cfg.get("github_review_dry_run")) if dry_run is None else dry_run
+    n = len(payload.get("comments") or [])
+    if dry_run:
+        print(json.dumps({"pr_url": pr_url, "review": payload}, indent=2, ensure_ascii=False))
+        return {"dry_run": True, "comments": n, "id": None, "html_url": ""}
+    with TRACER.span("github.review_create", comments=n) as sp:
+        res = get_provider(cfg).post_review(pr_url, payload) or {}
+        sp.set(review_id=res.get("id"))
+    return {"dry_run": False, "comments": n, "id": res.get("id"), "html_url": res.get("html_url", "")}
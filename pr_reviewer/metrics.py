@@ -0,0 +1,193 @@
+# metrics.py
+"""
+Operational metrics in the Prometheus text exposition format (0.0.4), for unattended batch runs.
+
+The review engine, gateway client and GitHub layer always update METRICS (a few dict updates per
+call); the HTTP endpoint only runs when cfg["metrics_port"] > 0:
+
+    start_metrics_server(cfg)            # idempotent; serves GET /metrics on metrics_host:metrics_port
+
+No prometheus_client dependency: counters, gauges and histograms with labels are kept here, and
+values that are cheaper to read at scrape time (queue depth, reviews per minute) come from
+collectors registered with METRICS.register_collector(fn).
+"""
+import time
+import bisect
+import threading
+from collections import deque
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+DEFAULT_BUCKETS = (0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300)
+
+# name -> (type, help, histogram buckets)
+METRIC_DEFS = {
+    "pr_reviewer_gateway_requests_in_flight": ("gauge", "Gateway chat completions currently running.", None),
+    "pr_reviewer_gateway_requests_total": ("counter", "Gateway chat completions by outcome.", None),
+    "pr_reviewer_gateway_request_duration_seconds": ("histogram", "Gateway chat completion latency.", DEFAULT_BUCKETS),
+    "pr_reviewer_gateway_tokens_total": ("counter", "Tokens reported by the gateway (kind=prompt|completion).", None),
+    "pr_reviewer_github_requests_total": ("counter", "GitHub API requests by endpoint and HTTP status.", None),
+    "pr_reviewer_github_rate_limit_remaining": ("gauge", "X-RateLimit-Remaining from the last GitHub response.", None),
+    "pr_reviewer_github_rate_limit_reset_timestamp_seconds": ("gauge", "X-RateLimit-Reset from the last GitHub response.", None),
+    "pr_reviewer_cache_lookups_total": ("counter", "Local cache lookups (result=hit|miss).", None),
+    "pr_reviewer_queue_depth": ("gauge", "Items waiting in internal queues.", None),
+    "pr_reviewer_webhook_events_total": ("counter", "Webhook deliveries by event and result.", None),
+    "pr_reviewer_reviews_total": ("counter", "Completed PR reviews by outcome.", None),
+    "pr_reviewer_reviews_per_minute": ("gauge", "PR reviews completed in the last 60 seconds.", None),
+    "pr_reviewer_review_duration_seconds": ("histogram", "Wall time of a whole PR review.",
+                                            (5, 10, 30, 60, 120, 300, 600, 1200)),
+}
+
+
+def _label_key(labels: dict) -> tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _fmt_labels(key: tuple, extra: tuple = ()) -> str:
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    esc = lambda v: v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+    return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in pairs) + "}"
+
+
+def _fmt_value(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return str(int(v)) if float(v).is_integer() else repr(float(v))
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values: dict[str, dict[tuple, float]] = {}
+        self._hist: dict[str, dict[tuple, list]] = {}  # key -> [bucket counts..., overflow, sum, count]
+        self._collectors: list = []
+        self._reviews = deque(maxlen=10000)  # completion times for reviews_per_minute
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        with self._lock:
+            series = self._values.setdefault(name, {})
+            key = _label_key(labels)
+            series[key] = series.get(key, 0) + amount
+
+    def set(self, name: str, value: float, **labels):
+        with self._lock:
+            self._values.setdefault(name, {})[_label_key(labels)] = value
+
+    def observe(self, name: str, value: float, **labels):
+        buckets = METRIC_DEFS[name][2] or DEFAULT_BUCKETS
+        with self._lock:
+            row = self._hist.setdefault(name, {}).setdefault(_label_key(labels), [0] * (len(buckets) + 3))
+            row[bisect.bisect_left(buckets, value)] += 1
+            row[-2] += value
+            row[-1] += 1
+
+    def review_done(self, outcome: str, seconds: float | None = None):
+        self.inc("pr_reviewer_reviews_total", outcome=outcome)
+        if seconds is not None:
+            self.observe("pr_reviewer_review_duration_seconds", seconds)
+        with self._lock:
+            self._reviews.append(time.monotonic())
+
+    def register_collector(self, fn):
+        """fn() -> [(name, labels dict, value)], called on every scrape."""
+        with self._lock:
+            self._collectors.append(fn)
+
+    def render(self) -> str:
+        with self._lock:
+            cutoff = time.monotonic() - 60
+            while self._reviews and self._reviews[0] < cutoff:
+                self._reviews.popleft()
+            values = {n: dict(s) for n, s in self._values.items()}
+            values.setdefault("pr_reviewer_reviews_per_minute", {})[()] = len(self._reviews)
+            hist = {n: {k: list(r) for k, r in s.items()} for n, s in self._hist.items()}
+            collectors = list(self._collectors)
+        for fn in collectors:
+            try:
+                for name, labels, value in fn():
+                    values.setdefault(name, {})[_label_key(labels)] = value
+            except Exception as e:
+                print(f"[WARN] Metrics collector failed: {e}")
+
+        lines = []
+        for name, (kind, help_text, buckets) in METRIC_DEFS.items():
+            if name not in values and name not in hist:
+                continue
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            if kind == "histogram":
+                for key, row in sorted(hist.get(name, {}).items()):
+                    cum = 0
+                    for le, n in zip(buckets, row):
+                        cum += n
+                        lines.append(f"{name}_bucket{_fmt_labels(key, (('le', _fmt_value(le)),))} {cum}")
+                    lines.append(f"{name}_bucket{_fmt_labels(key, (('le', '+Inf'),))} {row[-1]}")
+                    lines.append(f"{name}_sum{_fmt_labels(key)} {_fmt_value(row[-2])}")
+                    lines.append(f"{name}_count{_fmt_labels(key)} {row[-1]}")
+            else:
+                for key, v in sorted(values[name].items()):
+                    lines.append(f"{name}{_fmt_labels(key)} {_fmt_value(v)}")
+        return "\n".join(lines) + "\n"
+
+
+METRICS = Metrics()
+
+
+def observe_github_response(r, endpoint: str):
+    """Request count and rate-limit headroom from one GitHub `requests` response."""
+    METRICS.inc("pr_reviewer_github_requests_total", endpoint=endpoint, status=r.status_code)
+    h = r.headers or {}
+    resource = h.get("X-RateLimit-Resource") or ("graphql" if endpoint == "graphql" else "core")
+    if h.get("X-RateLimit-Remaining") is not None:
+        try:
+            METRICS.set("pr_reviewer_github_rate_limit_remaining", int(h["X-RateLimit-Remaining"]), resource=resource)
+            METRICS.set("pr_reviewer_github_rate_limit_reset_timestamp_seconds", int(h.get("X-RateLimit-Reset") or 0),
+                        resource=resource)
+        except ValueError:
+            pass
+
+
+def cache_lookup(cache: str, hit: bool):
+    METRICS.inc("pr_reviewer_cache_lookups_total", cache=cache, result="hit" if hit else "miss")
+
+
+# ---------------------------- HTTP endpoint ----------------------------
+class _Handler(BaseHTTPRequestHandler):
+    def log_message(self, fmt, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?")[0].rstrip("/") not in ("/metrics", ""):
+            self.send_error(404)
+            return
+        body = METRICS.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+_SERVER = None
+_SERVER_LOCK = threading.Lock()
+
+
+def start_metrics_server(cfg: dict):
+    """Starts the /metrics endpoint once when cfg["metrics_port"] > 0; returns the server or None."""
+    global _SERVER
+    port = int(cfg.get("metrics_port") or 0)
+    if port <= 0:
+        return None
+    with _SERVER_LOCK:
+        if _SERVER is None:
+            host = (cfg.get("metrics_host") or "127.0.0.1").strip()
+            try:
+                _SERVER = ThreadingHTTPServer((host, port), _Handler)
+            except OSError as e:
+                print(f"[WARN] Metrics endpoint not started on {host}:{port}: {e}")
+                return None
+            _SERVER.daemon_threads = True
+            threading.Thread(target=_SERVER.serve_forever, daemon=True, name="metrics").start()
+            print(f"Metrics on http://{host}:{_SERVER.server_address[1]}/metrics")
+        return _SERVER
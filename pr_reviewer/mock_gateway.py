@@ -0,0 +1,278 @@
+# mock_gateway.py
+"""
+Local stand-in for the OpenAI-compatible gateway, for load / latency experiments without AIA.
+
+    python -m pr_reviewer.mock_gateway [--port 8765] [--profile mock_profile.yaml] [--seed 7] [--time-scale 1.0]
+
+Point a profile at it with gateway_base: http://127.0.0.1:8765/v1, token_mode: preissued and any
+aia_access_token. Serves POST <base>/chat/completions (plain or stream=true SSE), GET <base>/models
+and GET /stats (per-model call/error counters).
+
+Behaviour per model comes from a YAML/JSON profile:
+    seed: 7
+    time_scale: 1.0            # multiply every delay (0.01 = 100x faster runs)
+    default:                   # applied to every model, then overridden per model
+      latency: {dist: lognormal, p50_s: 2.0, sigma: 0.35}   # or {dist: fixed, s: 1} / {dist: uniform, min_s: 1, max_s: 3}
+      error_rate: 0.0
+      error_status: 503
+      tokens_per_s: 60         # output throughput (paces streaming and the non-stream total)
+      output_tokens: 400
+    models:
+      gpt-oss-120b: {error_rate: 0.2}
+Without a profile, each model in MODEL_REGISTRY gets p50 = 2 s x its relative_latency.
+
+Random draws are seeded per (seed, model, prompt, n-th identical request), so a run is repeatable
+regardless of thread scheduling, while a retried or hedged duplicate draws a fresh latency.
+"""
+import re
+import json
+import math
+import time
+import random
+import hashlib
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import yaml
+
+from .model_registry import MODEL_REGISTRY, model_profile, estimate_tokens
+
+DEFAULT_BEHAVIOUR = {
+    "latency": {"dist": "lognormal", "p50_s": 2.0, "sigma": 0.35},
+    "error_rate": 0.0,
+    "error_status": 503,
+    "tokens_per_s": 60,
+    "output_tokens": 400,
+}
+
+
+def load_profile(path: str | None) -> dict:
+    if not path:
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return yaml.safe_load(f) or {}
+
+
+class MockGateway:
+    """Request → (delay, error, reply) model shared by the HTTP handler threads."""
+
+    def __init__(self, profile: dict | None = None, seed: int | None = None, time_scale: float | None = None):
+        profile = profile or {}
+        self.seed = int(seed if seed is not None else profile.get("seed", 7))
+        self.time_scale = float(time_scale if time_scale is not None else profile.get("time_scale", 1.0))
+        self.default = {**DEFAULT_BEHAVIOUR, **(profile.get("default") or {})}
+        self.models = profile.get("models") or {}
+        self._lock = threading.Lock()
+        self._seen: dict[str, int] = {}
+        self.stats: dict[str, dict] = {}
+
+    def behaviour(self, model: str) -> dict:
+        b = dict(self.default)
+        if "latency" not in (self.models.get(model) or {}) and "p50_s" in b["latency"]:
+            rel = model_profile(model)["relative_latency"]
+            b["latency"] = {**b["latency"], "p50_s": b["latency"]["p50_s"] * rel}
+        b.update(self.models.get(model) or {})
+        return b
+
+    def _rng(self, model: str, prompt: str) -> random.Random:
+        key = hashlib.sha256(f"{self.seed}|{model}|{prompt}".encode("utf-8")).hexdigest()
+        with self._lock:
+            n = self._seen.get(key, 0)
+            self._seen[key] = n + 1
+        return random.Random(f"{key}:{n}")
+
+    @staticmethod
+    def _draw_latency(rng: random.Random, lat: dict) -> float:
+        dist = (lat.get("dist") or "lognormal").lower()
+        if dist == "fixed":
+            return float(lat.get("s", 0))
+        if dist == "uniform":
+            return rng.uniform(float(lat.get("min_s", 0)), float(lat.get("max_s", 0)))
+        return float(lat.get("p50_s", 1.0)) * math.exp(rng.gauss(0.0, float(lat.get("sigma", 0.35))))
+
+    def plan(self, model: str, messages: list) -> dict:
+        """Decides the fate of one call: {"ttft": s, "per_token": s, "error": status|None, "reply": str, ...}."""
+        prompt = _messages_text(messages)
+        b = self.behaviour(model)
+        rng = self._rng(model, prompt)
+        ttft = self._draw_latency(rng, b["latency"]) * self.time_scale
+        error = int(b["error_status"]) if rng.random() < float(b["error_rate"]) else None
+        reply = _canned_reply(model, prompt, int(b["output_tokens"]))
+        tps = float(b["tokens_per_s"]) or 1e9
+        with self._lock:
+            st = self.stats.setdefault(model, {"calls": 0, "errors": 0})
+            st["calls"] += 1
+            st["errors"] += 1 if error else 0
+        return {
+            "ttft": ttft,
+            "per_token": self.time_scale / tps,
+            "error": error,
+            "reply": reply,
+            "prompt_tokens": estimate_tokens(prompt),
+        }
+
+
+# ---------------------------- Canned replies ----------------------------
+def _messages_text(messages: list) -> str:
+    parts = []
+    for m in messages or []:
+        c = m.get("content")
+        if isinstance(c, list):
+            parts.extend(p.get("text", "") for p in c if isinstance(p, dict))
+        else:
+            parts.append(str(c or ""))
+    return "\n".join(parts)
+
+
+def _canned_reply(model: str, prompt: str, output_tokens: int) -> str:
+    """
+    A well-formed answer for whichever pipeline step sent the prompt: packed micro-batches get one
+    <!-- PR-REVIEW: n --> section per PR and file-history groups one <!-- COMMIT sha --> table per commit.
+    """
+    filler = "The change looks consistent with the surrounding code. "
+    pad = filler * max(1, (output_tokens * 4) // len(filler) // 4)
+
+    packed = re.findall(r"^===== PR (\d+) =====$", prompt, re.MULTILINE)
+    commits = re.findall(r"^=== Commit ([0-9a-f]{7,40}) ", prompt, re.MULTILINE)
+    if "matching this JSON Schema" in prompt:  # output_format "json"
+        files = re.findall(r"^diff --git a/\S+ b/(\S+)", prompt, re.MULTILINE) or ["-"]
+        review = json.dumps({
+            "summary": f"[{model}] {pad}", "files": [{"file": f, "changes": ["Updated."]} for f in files],
+            "findings": [{"file": files[0], "line": 1, "severity": "LOW", "category": "Maintainability",
+                          "observation": "Consider a comment explaining the change.", "recommendation": "Add one."}],
+            "tests": [], "verdict": "Approve",
+        })
+        return "\n".join(f"<!-- PR-REVIEW: {n} -->\n{review}" for n in packed) if packed else review
+    if packed:
+        return "\n".join(
+            f"<!-- PR-REVIEW: {n} -->\n<h3>Review Table</h3><p>[{model}] PR {n}. {pad}</p>" for n in packed
+        )
+    if commits:
+        return "\n".join(
+            f"<!-- COMMIT {sha[:7]} -->\n<table border=\"1\"><tr><th>Commit</th><td>{sha[:7]}</td></tr>"
+            f"<tr><th>Change Summary</th><td>[{model}] {pad}</td></tr></table>"
+            for sha in commits
+        )
+    return (
+        f"<h3>Change Summary by File</h3><p>[{model}] {pad}</p>"
+        "<h3>Review Table</h3><table border=\"1\"><tr><th>File</th><th>Issue</th></tr>"
+        "<tr><td>-</td><td>No blocking issues.</td></tr></table>"
+        "<h3>Overall Verdict</h3><p>Approve</p>"
+    )
+
+
+# ---------------------------- HTTP ----------------------------
+class _Handler(BaseHTTPRequestHandler):
+    gateway: MockGateway = None  # set on the per-server subclass
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, fmt, *args):  # keep benchmark output clean
+        pass
+
+    def _json(self, status: int, obj: dict):
+        body = json.dumps(obj).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            self._json(200, {"object": "list", "data": [
+                {"id": mid, "object": "model", "owned_by": "mock"} for mid, *_ in MODEL_REGISTRY
+            ]})
+        elif self.path.rstrip("/") == "/stats":
+            with self.gateway._lock:
+                self._json(200, {"models": json.loads(json.dumps(self.gateway.stats))})
+        else:
+            self._json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._json(404, {"error": {"message": f"Unknown path {self.path}"}})
+            return
+        try:
+            req = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+        except ValueError:
+            self._json(400, {"error": {"message": "Invalid JSON body"}})
+            return
+        model = req.get("model") or ""
+        plan = self.gateway.plan(model, req.get("messages") or [])
+        time.sleep(plan["ttft"])
+        if plan["error"]:
+            self._json(plan["error"], {"error": {"message": f"mock gateway: injected {plan['error']} for {model}",
+                                                 "type": "mock_error"}})
+            return
+
+        cid = "chatcmpl-mock-" + hashlib.sha1(f"{time.time_ns()}".encode()).hexdigest()[:12]
+        words = plan["reply"].split(" ")
+        usage = {"prompt_tokens": plan["prompt_tokens"], "completion_tokens": estimate_tokens(plan["reply"]),
+                 "total_tokens": plan["prompt_tokens"] + estimate_tokens(plan["reply"])}
+        if not req.get("stream"):
+            time.sleep(plan["per_token"] * usage["completion_tokens"])
+            self._json(200, {
+                "id": cid, "object": "chat.completion", "created": int(time.time()), "model": model,
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": plan["reply"]}}],
+                "usage": usage,
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        for i, w in enumerate(words):
+            piece = w if i == len(words) - 1 else w + " "
+            self._sse({"id": cid, "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                       "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]})
+            time.sleep(plan["per_token"] * estimate_tokens(piece))
+        self._sse({"id": cid, "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                   "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}], "usage": usage})
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+    def _sse(self, obj: dict):
+        self.wfile.write(b"data: " + json.dumps(obj).encode("utf-8") + b"\n\n")
+        self.wfile.flush()
+
+
+def start_mock_gateway(port: int = 0, profile: dict | None = None, seed: int | None = None,
+                       time_scale: float | None = None, host: str = "127.0.0.1"):
+    """
+    Starts the mock gateway on a daemon thread (port 0 = pick a free port).
+    Returns (server, base_url); call server.shutdown() when done. server.gateway exposes the stats.
+    """
+    gateway = MockGateway(profile, seed=seed, time_scale=time_scale)
+    handler = type("MockGatewayHandler", (_Handler,), {"gateway": gateway})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.gateway = gateway
+    threading.Thread(target=server.serve_forever, daemon=True, name="mock-gateway").start()
+    return server, f"http://{host}:{server.server_address[1]}/v1"
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Local OpenAI-compatible mock gateway")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--profile", help="YAML/JSON behaviour profile")
+    ap.add_argument("--seed", type=int)
+    ap.add_argument("--time-scale", type=float)
+    args = ap.parse_args()
+
+    server, base = start_mock_gateway(args.port, load_profile(args.profile), args.seed, args.time_scale, args.host)
+    print(f"Mock gateway on {base} (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,15 @@
-from openai import OpenAI
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from openai import OpenAI, APITimeoutError
 import httpx
 from .tls import get_verify_path, patch_certifi_with_pki_zip
+from .model_registry import ROUTER, estimate_tokens
+from .model_health import HEALTH, CircuitOpenError
+from .prompts import record_prompt_stats
+from .tracing import TRACER
+from .usage import record_usage
+from .metrics import METRICS
 
 
 def get_gateway_token(cfg: dict) -> str:
@@ -47,3 +56,169 @@ def make_client(cfg: dict):
         api_key=token,
     )
     return client
+
+
+# ---------------------------- Gateway calls (timeouts + hedging) ----------------------------
+class ModelTimeoutError(TimeoutError):
+    """A model call (or the model's share of the review) ran past its deadline."""
+
+    def __init__(self, message: str, deadline_capped: bool = False):
+        super().__init__(message)
+        # True when the review/model deadline (not the model's own call timeout) cut the call short
+        self.deadline_capped = deadline_capped
+
+
+# Shared pool for hedged calls; sized for a full ensemble with one duplicate each.
+_HEDGE_POOL = ThreadPoolExecutor(max_workers=32, thread_name_prefix="gw-hedge")
+
+
+def _hedge_delay(cfg: dict, model_name: str) -> float | None:
+    if not cfg.get("hedge_requests"):
+        return None
+    stats = ROUTER.latency_stats(model_name)
+    if stats["count"] < 3:
+        return None
+    return max(stats["p95"], float(cfg.get("hedge_min_delay_s") or 0))
+
+
+def _message_tokens(messages: list) -> int:
+    total = 0
+    for msg in messages:
+        content = msg.get("content")
+        if isinstance(content, list):
+            total += sum(estimate_tokens(part.get("text", "")) for part in content)
+        else:
+            total += estimate_tokens(content or "")
+    return total
+
+
+def prompt_usage(messages: list, prefix_len: int, completion) -> tuple[int, int, int]:
+    """(prompt_tokens, prefix_tokens, cached_tokens) of one call, for PromptStats."""
+    usage = getattr(completion, "usage", None)
+    prompt_tokens = getattr(usage, "prompt_tokens", None) or _message_tokens(messages)
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached = getattr(details, "cached_tokens", None) or 0
+    return prompt_tokens, _message_tokens(messages[:prefix_len]), cached
+
+
+def completion_usage(messages: list, completion) -> tuple[int, int, bool]:
+    """(prompt_tokens, completion_tokens, estimated) from usage, estimated from the text when the gateway omits it."""
+    usage = getattr(completion, "usage", None)
+    prompt = getattr(usage, "prompt_tokens", None)
+    done = getattr(usage, "completion_tokens", None)
+    if prompt is not None and done is not None:
+        return int(prompt), int(done), False
+    try:
+        text = completion.choices[0].message.content or ""
+    except Exception:
+        text = ""
+    return int(prompt if prompt is not None else _message_tokens(messages)), \
+        int(done if done is not None else estimate_tokens(text)), True
+
+
+def create_chat_completion(cfg: dict, client, model_name: str, messages: list, deadline: float | None = None,
+                           default_correlation_id: str = "pr-review-ui", prefix_len: int = 0):
+    """
+    Single entry point for chat.completions.create.
+      - circuit breaker: models whose circuit is open fail fast with CircuitOpenError
+      - per-call timeout from cfg["model_call_timeout_s"], capped by `deadline` (time.monotonic())
+      - optional hedging: when cfg["hedge_requests"] is on and the model has latency history,
+        a duplicate call is sent once the observed p95 elapses and the first answer wins
+      - observed latency is fed back to the router and the model's health record
+      - prompt tokens are recorded in PROMPT_STATS and the review's prompt stats; `prefix_len` leading
+        messages count as the static prefix
+      - prompt/completion tokens are booked to the current review's usage ledger (usage.py)
+      - in-flight count, latency, outcome and tokens feed the operational metrics (metrics.py)
+    Raises ModelTimeoutError when the deadline is exhausted.
+    """
+    with TRACER.span("gateway.chat_completion", model=model_name, messages=len(messages),
+                     prompt_tokens_est=_message_tokens(messages)) as sp:
+        if deadline is not None and deadline <= time.monotonic():
+            # Out of time before calling; not the model's fault, so keep it out of the health record
+            raise ModelTimeoutError(f"{model_name}: deadline exceeded before call", deadline_capped=True)
+        if not HEALTH.allow(model_name, cfg):
+            METRICS.inc("pr_reviewer_gateway_requests_total", model=model_name, outcome="circuit_open")
+            raise CircuitOpenError(f"{model_name}: circuit open (recent calls failing); skipped")
+
+        started = time.monotonic()
+        METRICS.inc("pr_reviewer_gateway_requests_in_flight", model=model_name)
+        try:
+            completion = _call_with_hedging(cfg, client, model_name, messages, deadline, default_correlation_id)
+        except Exception as e:
+            if isinstance(e, ModelTimeoutError) and e.deadline_capped:
+                # A call cut short by the review's deadline says nothing about the model's health,
+                # but it may have been the half-open probe: free the slot for the next caller
+                HEALTH.release(model_name)
+            else:
+                HEALTH.record(model_name, cfg, ok=False, seconds=time.monotonic() - started, error=str(e))
+            METRICS.inc("pr_reviewer_gateway_requests_total", model=model_name,
+                        outcome="timeout" if isinstance(e, ModelTimeoutError) else "error")
+            raise
+        finally:
+            METRICS.inc("pr_reviewer_gateway_requests_in_flight", -1, model=model_name)
+        elapsed = time.monotonic() - started
+        METRICS.inc("pr_reviewer_gateway_requests_total", model=model_name, outcome="ok")
+        METRICS.observe("pr_reviewer_gateway_request_duration_seconds", elapsed, model=model_name)
+        ROUTER.observe(model_name, elapsed)
+        HEALTH.record(model_name, cfg, ok=True, seconds=elapsed)
+        record_prompt_stats(model_name, *prompt_usage(messages, prefix_len, completion))
+        prompt_tokens, completion_tokens, estimated = completion_usage(messages, completion)
+        record_usage(model_name, prompt_tokens, completion_tokens, estimated)
+        METRICS.inc("pr_reviewer_gateway_tokens_total", prompt_tokens, model=model_name, kind="prompt")
+        METRICS.inc("pr_reviewer_gateway_tokens_total", completion_tokens, model=model_name, kind="completion")
+        sp.set(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens, usage_estimated=estimated or None)
+        return completion
+
+
+def _call_with_hedging(cfg: dict, client, model_name: str, messages: list, deadline: float | None,
+                       default_correlation_id: str):
+    timeout = float(cfg.get("model_call_timeout_s") or 0) or None
+    capped = False
+    if deadline is not None:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise ModelTimeoutError(f"{model_name}: deadline exceeded before call", deadline_capped=True)
+        capped = not timeout or remaining < timeout
+        timeout = min(timeout, remaining) if timeout else remaining
+    within = f" within {timeout:.0f}s" if timeout is not None else ""
+
+    def call():
+        try:
+            return client.chat.completions.create(
+                extra_headers={"x-correlation-id": (cfg.get("correlation_id") or default_correlation_id)},
+                model=model_name,
+                messages=messages,
+                stream=False,
+                temperature=0.2,
+                timeout=timeout,
+            )
+        except APITimeoutError as e:
+            raise ModelTimeoutError(f"{model_name}: no response{within}", deadline_capped=capped) from e
+
+    hedge_after = _hedge_delay(cfg, model_name)
+    if hedge_after is None or (timeout is not None and hedge_after >= timeout):
+        return call()
+
+    started = time.monotonic()
+    primary = _HEDGE_POOL.submit(call)
+    done, _ = wait([primary], timeout=hedge_after)
+    if done:
+        return primary.result()
+    pending = {primary, _HEDGE_POOL.submit(call)}
+    TRACER.current().set(hedged=True, attempts=2, hedge_after_s=round(hedge_after, 2))
+
+    last_error: BaseException | None = None
+    while pending:
+        wait_for = None if timeout is None else max(0.0, started + timeout - time.monotonic())
+        done, pending = wait(pending, timeout=wait_for, return_when=FIRST_COMPLETED)
+        if not done:
+            break
+        for f in done:
+            if f.exception() is None:
+                for other in pending:
+                    other.cancel()
+                return f.result()
+            last_error = f.exception()
+    if last_error is not None and not isinstance(last_error, ModelTimeoutError):
+        raise last_error
+    raise ModelTimeoutError(f"{model_name}: no response{within} (hedged)", deadline_capped=capped)
@@ -0,0 +1,176 @@
+import os
+import json
+import time
+import atexit
+import threading
+
+from .storage import STORE_DIR
+from .model_registry import _percentile
+
+HEALTH_PATH = os.path.join(STORE_DIR, "model_health.json")
+SAVE_INTERVAL_S = 30.0  # call events are flushed at most this often; breaker state changes at once
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling a model whose circuit is open."""
+
+
+class ModelHealth:
+    """
+    Per-model circuit breaker over a rolling window of gateway calls.
+      closed    : calls flow; opens when the error rate in the window reaches the threshold
+      open      : calls are rejected immediately until the cooldown elapses
+      half_open : a single probe call is let through; success closes, failure re-opens
+    Events and state are persisted to STORE_DIR so dead endpoints stay skipped across runs:
+    immediately when a circuit changes state, otherwise at most every SAVE_INTERVAL_S (and at exit),
+    off the model-call path. Nothing is recorded while cfg["circuit_breaker"] is off.
+    Thresholds come from cfg on every call (breaker_* keys).
+    """
+
+    def __init__(self, path: str = HEALTH_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._io_lock = threading.Lock()
+        self._models: dict[str, dict] = {}
+        self._probing: set[str] = set()
+        self._dirty = False
+        self._saved_at = time.monotonic()
+        self._load()
+
+    # ----- persistence -----
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self._models = data.get("models", {}) if isinstance(data, dict) else {}
+        except Exception:
+            self._models = {}
+
+    def flush(self):
+        """Writes the current state if anything changed since the last write. Call without holding _lock."""
+        with self._lock:
+            if not self._dirty:
+                return
+            data = {m: dict(e, events=list(e["events"])) for m, e in self._models.items()}
+            self._dirty = False
+            self._saved_at = time.monotonic()
+        with self._io_lock:
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                tmp = self.path + ".tmp"
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump({"models": data}, f, ensure_ascii=False, indent=2)
+                os.replace(tmp, self.path)
+            except Exception as e:
+                print(f"[WARN] Could not persist model health: {e}")
+
+    def _entry(self, model: str) -> dict:
+        return self._models.setdefault(
+            model, {"state": CLOSED, "opened_at": 0.0, "events": [], "last_error": ""}
+        )
+
+    @staticmethod
+    def _trim(entry: dict, cfg: dict, now: float):
+        window_s = float(cfg.get("breaker_window_s") or 600)
+        entry["events"] = [ev for ev in entry["events"] if now - ev[0] <= window_s][-200:]
+
+    # ----- breaker -----
+    def is_open(self, model: str, cfg: dict) -> bool:
+        """True while calls would be rejected outright (open and still cooling down). Does not take a probe slot."""
+        if not cfg.get("circuit_breaker", True):
+            return False
+        with self._lock:
+            entry = self._models.get(model)
+            if not entry or entry["state"] != OPEN:
+                return False
+            return time.time() - entry["opened_at"] < float(cfg.get("breaker_cooldown_s") or 300)
+
+    def allow(self, model: str, cfg: dict) -> bool:
+        if not cfg.get("circuit_breaker", True):
+            return True
+        now = time.time()
+        with self._lock:
+            entry = self._entry(model)
+            if entry["state"] == CLOSED:
+                return True
+            if entry["state"] == OPEN:
+                if now - entry["opened_at"] < float(cfg.get("breaker_cooldown_s") or 300):
+                    return False
+                entry["state"] = HALF_OPEN
+            # half-open: exactly one probe in flight
+            if model in self._probing:
+                return False
+            self._probing.add(model)
+            return True
+
+    def record(self, model: str, cfg: dict, ok: bool, seconds: float, error: str = ""):
+        if not cfg.get("circuit_breaker", True):
+            return
+        now = time.time()
+        with self._lock:
+            entry = self._entry(model)
+            state = entry["state"]
+            entry["events"].append([now, 1 if ok else 0, round(float(seconds), 3)])
+            self._trim(entry, cfg, now)
+            if not ok:
+                entry["last_error"] = (error or "")[:300]
+            was_probe = model in self._probing
+            self._probing.discard(model)
+
+            if was_probe or entry["state"] == HALF_OPEN:
+                if ok:
+                    entry["state"], entry["events"] = CLOSED, [entry["events"][-1]]
+                else:
+                    entry["state"], entry["opened_at"] = OPEN, now
+            elif entry["state"] == CLOSED and not ok:
+                calls = len(entry["events"])
+                errs = sum(1 for ev in entry["events"] if not ev[1])
+                if calls >= int(cfg.get("breaker_min_calls") or 4) and \
+                        errs / calls >= float(cfg.get("breaker_error_rate") or 0.5):
+                    entry["state"], entry["opened_at"] = OPEN, now
+            self._dirty = True
+            persist = entry["state"] != state or time.monotonic() - self._saved_at >= SAVE_INTERVAL_S
+        if persist:
+            self.flush()
+
+    def release(self, model: str):
+        """Frees a half-open probe slot without an outcome (the call was cut short by the caller's deadline)."""
+        with self._lock:
+            self._probing.discard(model)
+
+    def reset(self, model: str | None = None):
+        with self._lock:
+            if model:
+                self._models.pop(model, None)
+                self._probing.discard(model)
+            else:
+                self._models.clear()
+                self._probing.clear()
+            self._dirty = True
+        self.flush()
+
+    # ----- reporting -----
+    def snapshot(self) -> list[dict]:
+        with self._lock:
+            rows = []
+            for model, entry in sorted(self._models.items()):
+                events = entry.get("events") or []
+                lat = sorted(ev[2] for ev in events if ev[1])
+                calls = len(events)
+                errs = sum(1 for ev in events if not ev[1])
+                rows.append({
+                    "model": model,
+                    "state": entry.get("state", CLOSED),
+                    "calls": calls,
+                    "error_rate": (errs / calls) if calls else 0.0,
+                    "p50": _percentile(lat, 50),
+                    "p95": _percentile(lat, 95),
+                    "last_error": entry.get("last_error", ""),
+                })
+            return rows
+
+
+HEALTH = ModelHealth()
+atexit.register(HEALTH.flush)
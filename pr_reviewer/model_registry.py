@@ -1,3 +1,5 @@
+import threading
+from collections import deque
 
 MODEL_REGISTRY = [
     ("llama-3-3-70b-instruct", "Llama-3.3-70B (Base Synthesizer)", True, "Base model (fixed for synthesis)"),
@@ -16,3 +18,127 @@ MODEL_REGISTRY = [
     ("gpt-oss-120b", "GPT-OSS-120B (Experimental)", False, "General chat; not code-tuned"),
     ("gpt-oss-20b", "GPT-OSS-20B", False, ""),
 ]
+
+# Routing metadata per model.
+#   context_window   : tokens accepted by the gateway deployment (prompt + completion)
+#   relative_latency : typical wall time per call, relative to the base synthesizer (1.0)
+#   cost             : relative cost per call, relative to the base synthesizer (1.0)
+MODEL_PROFILES = {
+    "llama-3-3-70b-instruct": {"context_window": 128000, "relative_latency": 1.0, "cost": 1.0},
+    "mixtral-8x7b-instruct-v01": {"context_window": 32000, "relative_latency": 0.7, "cost": 0.6},
+    "mistral-7b-instruct-v03": {"context_window": 32000, "relative_latency": 0.35, "cost": 0.15},
+    "mistral-7b-instruct-v03-fc": {"context_window": 32000, "relative_latency": 0.35, "cost": 0.15},
+    "mistral-small-3.1-24b-instruct-2503": {"context_window": 128000, "relative_latency": 0.55, "cost": 0.35},
+    "llama-3-8b-instruct": {"context_window": 8192, "relative_latency": 0.35, "cost": 0.15},
+    "llama-3-1-8b-instruct": {"context_window": 128000, "relative_latency": 0.35, "cost": 0.15},
+    "llama-3-2-3b-instruct": {"context_window": 8192, "relative_latency": 0.2, "cost": 0.05},
+    "llama-3-3-nemotron-super-49b-v1": {"context_window": 128000, "relative_latency": 0.8, "cost": 0.7},
+    "phi-3-mini-128k-instruct": {"context_window": 128000, "relative_latency": 0.3, "cost": 0.08},
+    "phi-3-5-moe-instruct": {"context_window": 128000, "relative_latency": 0.5, "cost": 0.3},
+    "gemma-3-27b-it": {"context_window": 128000, "relative_latency": 0.6, "cost": 0.4},
+    "codellama-13b-instruct": {"context_window": 16384, "relative_latency": 0.45, "cost": 0.25},
+    "gpt-oss-120b": {"context_window": 128000, "relative_latency": 1.6, "cost": 1.2},
+    "gpt-oss-20b": {"context_window": 128000, "relative_latency": 0.6, "cost": 0.3},
+}
+
+DEFAULT_PROFILE = {"context_window": 8192, "relative_latency": 1.0, "cost": 1.0}
+
+# Tokens kept free for system prompt, template and the model's answer when checking context fit.
+PROMPT_RESERVE_TOKENS = 4000
+
+
+def model_profile(model_id: str) -> dict:
+    return {**DEFAULT_PROFILE, **MODEL_PROFILES.get(model_id, {})}
+
+
+def estimate_tokens(text: str) -> int:
+    # ~4 chars per token is close enough for code/diff text and needs no tokenizer
+    return (len(text or "") + 3) // 4
+
+
+def _percentile(sorted_vals: list[float], pct: float) -> float:
+    if not sorted_vals:
+        return 0.0
+    k = max(0, min(len(sorted_vals) - 1, int(round(pct / 100.0 * (len(sorted_vals) - 1)))))
+    return sorted_vals[k]
+
+
+class ModelRouter:
+    """
+    Picks the model set for each diff chunk from the static profiles above plus
+    observed gateway latencies (rolling window per model).
+    """
+
+    def __init__(self, window: int = 50, min_samples: int = 3):
+        self._lock = threading.Lock()
+        self._window = window
+        self._min_samples = min_samples
+        self._samples: dict[str, deque] = {}
+
+    # ----- latency feedback -----
+    def observe(self, model_id: str, seconds: float):
+        with self._lock:
+            dq = self._samples.setdefault(model_id, deque(maxlen=self._window))
+            dq.append(float(seconds))
+
+    def latency_stats(self, model_id: str) -> dict:
+        with self._lock:
+            vals = sorted(self._samples.get(model_id) or [])
+        return {"count": len(vals), "p50": _percentile(vals, 50), "p95": _percentile(vals, 95)}
+
+    def _seconds_per_latency_unit(self) -> float:
+        # Calibrates profile relative_latency into seconds using the models we have observed.
+        with self._lock:
+            observed = {m: sorted(dq) for m, dq in self._samples.items() if len(dq) >= self._min_samples}
+        ratios = sorted(
+            _percentile(vals, 50) / model_profile(m)["relative_latency"]
+            for m, vals in observed.items() if model_profile(m)["relative_latency"] > 0
+        )
+        return _percentile(ratios, 50) if ratios else 1.0
+
+    def expected_latency(self, model_id: str) -> float:
+        """Observed p50 once enough samples exist, otherwise the profile's relative latency scaled to seconds."""
+        stats = self.latency_stats(model_id)
+        if stats["count"] >= self._min_samples:
+            return stats["p50"]
+        return model_profile(model_id)["relative_latency"] * self._seconds_per_latency_unit()
+
+    # ----- routing -----
+    def fits(self, model_id: str, chunk: str) -> bool:
+        needed = estimate_tokens(chunk) + PROMPT_RESERVE_TOKENS
+        return model_profile(model_id)["context_window"] >= needed
+
+    def route(self, cfg: dict, chunk: str, candidates: list[str]) -> list[str]:
+        """
+        Returns the models that should review `chunk`.
+          - tiny chunks go to the configured small models
+          - models whose context window cannot hold the chunk are dropped
+          - if nothing fits, the configured long-context models take over
+          - remaining candidates are ranked by expected latency x cost, and models whose
+            observed p95 exceeds the latency budget are dropped while others remain
+        """
+        small_chars = int(cfg.get("routing_small_chunk_chars") or 0)
+        small_models = [m for m in (cfg.get("routing_small_chunk_models") or []) if self.fits(m, chunk)]
+        if small_chars and len(chunk) <= small_chars and small_models:
+            return small_models
+
+        eligible = [m for m in candidates if self.fits(m, chunk)]
+        if not eligible:
+            long_models = [m for m in (cfg.get("routing_long_context_models") or []) if self.fits(m, chunk)]
+            if long_models:
+                return long_models
+            # Nothing fits on paper; let the largest-context candidate try rather than skip the chunk.
+            return sorted(candidates, key=lambda m: model_profile(m)["context_window"], reverse=True)[:1]
+
+        budget = float(cfg.get("routing_latency_budget_s") or 0)
+        if budget:
+            within = [m for m in eligible
+                      if self.latency_stats(m)["count"] < self._min_samples or self.latency_stats(m)["p95"] <= budget]
+            eligible = within or eligible
+
+        ranked = sorted(eligible, key=lambda m: self.expected_latency(m) * max(model_profile(m)["cost"], 0.01))
+        limit = int(cfg.get("routing_max_models_per_chunk") or 0)
+        return ranked[:limit] if limit > 0 else ranked
+
+
+ROUTER = ModelRouter()
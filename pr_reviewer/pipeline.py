@@ -0,0 +1,334 @@
+# pipeline.py
+"""
+Headless PR review: diff → generated-file filter → PR meta → models (optionally routed per chunk)
+→ HTML report in STORE_DIR → optional GitHub review → review index entry. Used by the desktop app's
+Review button and by the webhook service; no Tk calls here, progress is reported through the
+`progress(msg=None)` callback.
+"""
+import os
+import html
+import time
+import uuid
+import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeout
+
+from .storage import STORE_DIR, append_index_item
+from .github_api import parse_pr_url, fetch_pr_diff_filtered
+from .scm import get_provider
+from .review_engine import single_model_review, plan_routes, model_deadline, SynthesisStage
+from .model_client import ModelTimeoutError
+from .model_health import HEALTH, CircuitOpenError
+from .model_registry import MODEL_REGISTRY
+from .prompts import PromptStats, track_prompt_stats
+from .tracing import TRACER, NULL_SPAN, TRACE_DIR, export_trace, timing_table_html
+from .usage import track_usage
+from .metrics import METRICS
+from .profiling import profile_session, profile_thread
+from .github_review import build_review_payload, publish_review
+from .findings import (parse_review, review_html, save_findings, severity_counts, compact_review,
+                       SEVERITIES, FindingsError)
+from .consensus import findings_by_model, build_consensus, consensus_html
+from .report import normalize_model_html, save_error_log, wrap_full_report, safe_base_filename
+
+
+BASE_MODEL = MODEL_REGISTRY[0][0]  # the registry's base synthesizer
+
+
+class SupersededError(RuntimeError):
+    """The PR's head moved past the commit the review was pinned to (a newer push is reviewed instead)."""
+
+
+def _no_progress(msg: str | None = None):
+    pass
+
+
+def _consensus_section(cfg: dict, stage, synth_model: str, synthesis: str | None, synth_error: str | None,
+                       consensus: dict | None) -> str | None:
+    """Report "Consensus" section: the pipelined base-model synthesis (if on), then the local agreement table."""
+    parts = []
+    if stage is not None:
+        if synthesis:
+            try:
+                body = review_html(parse_review(synthesis)) if (cfg.get("output_format") or "").lower() == "json" \
+                    else synthesis
+            except FindingsError:
+                body = synthesis
+            missing = (f" Not included (synthesis call failed): {html.escape(', '.join(stage.missing))}."
+                       if stage.missing else "")
+            parts.append(
+                f"<p class='meta'>Synthesized by {html.escape(synth_model)} from {len(stage.sources)} model review(s) "
+                f"in {stage.rounds} pipelined call(s), using compact findings.{missing}</p>" + normalize_model_html(body)
+            )
+        else:
+            parts.append(f"<p class='meta'>Synthesis unavailable: {html.escape(synth_error or 'no model reviews')}</p>")
+    if consensus:
+        parts.append("<h3>Agreement across models</h3>" + consensus_html(consensus))
+    return "".join(parts) or None
+
+
+def run_review(cfg: dict, pr_url: str, models: list[str] | None = None, parallel: bool | None = None,
+               routing: bool | None = None, progress=None, head_sha: str | None = None) -> dict:
+    """
+    Reviews one PR with `models` (default cfg["selected_models"]) and saves the report.
+    `parallel` / `routing` default to cfg["parallel_models"] / cfg["adaptive_routing"].
+    Returns {"path", "entry" (index item), "pr_url", "host", "owner", "repo", "number", "meta",
+    "models", "results", "errors", "timed_out", "usage", "trace_path", "published", "publish_error",
+    "findings" (model -> validated review when output_format is "json"), "consensus" (consensus.py, 2+ models),
+    "synthesis" (base-model review when cfg["synthesis"] is on)}.
+    With cfg["github_review_publish"] the findings are also posted as one GitHub review (see github_review.py);
+    a failed post is reported in "publish_error" and does not fail the review.
+    `head_sha` pins the review to one commit (webhook events): SupersededError is raised before any
+    model runs when the PR head has moved on, and a published review is anchored to that commit.
+    Raises RuntimeError when there is nothing to review; per-model failures land in "errors".
+    """
+    selected_models = list(models if models is not None else (cfg.get("selected_models") or []))
+    if not selected_models:
+        raise RuntimeError("No models selected.")
+    parallel = bool(cfg.get("parallel_models", True)) if parallel is None else parallel
+    routing = bool(cfg.get("adaptive_routing", False)) if routing is None else routing
+    progress = progress or _no_progress
+    started = time.monotonic()
+    root = None
+
+    try:
+        with profile_session(cfg, "review") as prof, \
+                (TRACER.trace("review", pr_url=pr_url, models=len(selected_models)) if cfg.get("tracing", True)
+                 else NULL_SPAN) as root:
+            # 1) Diff
+            scm = get_provider(cfg)
+            with TRACER.span("scm.get_pr_diff", provider=scm.name) as sp:
+                raw_diff = scm.get_pr_diff(pr_url)
+                sp.set(bytes=len(raw_diff or ""))
+            with TRACER.span("filter_generated", bytes_in=len(raw_diff or "")) as sp:
+                res = fetch_pr_diff_filtered(cfg, pr_url, raw=raw_diff)
+            diff, skipped_files = None, []
+            if isinstance(res, tuple):
+                if len(res) >= 1:
+                    diff = res[0]
+                if len(res) >= 2 and isinstance(res[1], (list, tuple)):
+                    skipped_files = list(res[1])
+            else:
+                diff = res
+            sp.set(bytes_out=len(diff or ""), skipped_files=len(skipped_files))
+            if not (diff or "").strip():
+                raise RuntimeError(
+                    "No reviewable changes after excluding generated files. "
+                    "Disable 'skip_generated' in Configuration to include them."
+                )
+            if skipped_files:
+                progress(f"Excluded {len(skipped_files)} generated file(s)")
+
+            # 2) PR meta
+            progress("Working… Fetching PR metadata")
+            with TRACER.span("scm.get_pr_meta", provider=scm.name):
+                meta = scm.get_pr_meta(pr_url) or {}
+            scm.flush()
+            current_sha = (meta.get("head") or {}).get("sha") or ""
+            if head_sha and current_sha and current_sha != head_sha:
+                # Meta is read after the diff, so a matching head here means the diff is of head_sha too
+                raise SupersededError(f"{pr_url}: head moved from {head_sha[:7]} to {current_sha[:7]}")
+            pr_title = (meta.get("title") or "").strip() or "Pull Request"
+            author = (((meta.get("user") or {}).get("login", "") or "").strip())
+            host, owner, repo, number = parse_pr_url(pr_url)
+
+            # 3) Run models (optionally routed per chunk)
+            progress("Working… Running selected models")
+            results: dict[str, str] = {}
+            errors: dict[str, str] = {}
+
+            routes = None
+            if routing:
+                with TRACER.span("route_plan") as sp:
+                    routes = plan_routes(cfg, diff, selected_models)
+                    selected_models = list(routes)
+                    sp.set(models=len(selected_models))
+
+            review_timeout = float(cfg.get("review_timeout_s") or 0)
+            review_deadline = time.monotonic() + review_timeout if review_timeout else None
+            timed_out: set[str] = set()
+
+            def run_one(mname):
+                if HEALTH.is_open(mname, cfg):
+                    return mname, CircuitOpenError(f"{mname}: circuit open (recent calls failing); skipped")
+                with profile_thread():
+                    try:
+                        out = single_model_review(cfg, mname, diff, meta,
+                                                  chunk_indices=routes.get(mname) if routes else None,
+                                                  deadline=model_deadline(cfg, review_deadline))
+                        return mname, out
+                    except Exception as e:
+                        return mname, e
+
+            # Structured mode: each model's JSON is parsed + validated once, as it arrives
+            json_mode = (cfg.get("output_format") or "html").lower().strip() == "json"
+            structured: dict[str, dict] = {}
+            stage = None
+
+            def record(mname, res2):
+                if isinstance(res2, ModelTimeoutError):
+                    timed_out.add(mname)
+                    errors[mname] = f"Timed out: {res2}"; results[mname] = ""
+                elif isinstance(res2, Exception):
+                    errors[mname] = str(res2); results[mname] = ""
+                else:
+                    results[mname] = res2 or ""
+                if not results[mname]:
+                    return
+                if json_mode:
+                    try:
+                        structured[mname] = parse_review(results[mname])
+                    except FindingsError as e:
+                        print(f"[WARN] {mname}: review is not valid JSON ({e}); rendering the raw answer")
+                if stage:  # synthesis works from compact findings, not the full drafts
+                    review = structured.get(mname) or {"findings": findings_by_model({mname: results[mname]})[mname]}
+                    stage.add(mname, compact_review(review))
+
+            synth_model = (cfg.get("synthesis_model") or "").strip() or BASE_MODEL
+            synthesis, synth_error = None, None
+            with TRACER.span("models", count=len(selected_models), parallel=parallel) as models_sp, \
+                    track_usage() as ledger, track_prompt_stats() as prompt_stats:
+                if cfg.get("synthesis") and len(selected_models) >= 2:
+                    stage = SynthesisStage(cfg, synth_model, after_k=int(cfg.get("synthesis_after_k") or 2),
+                                           deadline=review_deadline)
+                if parallel:
+                    ex = ThreadPoolExecutor(max_workers=min(len(selected_models), 8))
+                    futs = {ex.submit(TRACER.bind(run_one), m): m for m in selected_models}
+                    try:
+                        # Small grace so models that honour their own deadline can report first
+                        wait_s = max(0.0, review_deadline - time.monotonic()) + 5 if review_deadline else None
+                        for f in as_completed(futs, timeout=wait_s):
+                            record(*f.result())
+                            progress()
+                    except FuturesTimeout:
+                        for f, m in futs.items():
+                            if not f.done():
+                                timed_out.add(m)
+                                errors[m] = f"Timed out: no result within the {review_timeout:.0f}s review deadline"
+                                results[m] = ""
+                    finally:
+                        # Do not block the report on stragglers; their calls end at their own deadline
+                        ex.shutdown(wait=False, cancel_futures=True)
+                else:
+                    for m in selected_models:
+                        record(*run_one(m))
+                        progress()
+                models_sp.set(failed=len(errors), timed_out=len(timed_out))
+
+                # 3b) Base-model synthesis: started after the first K models, only the last delta is left
+                if stage:
+                    progress("Working… Finishing consensus synthesis")
+                    stage.close()
+                    try:
+                        wait_s = max(0.0, review_deadline - time.monotonic()) + 5 if review_deadline else None
+                        synthesis = stage.result(wait_s)
+                        if stage.error:
+                            print(f"[WARN] Synthesis: {stage.error}")
+                            if not synthesis:
+                                synth_error = stage.error
+                    except FuturesTimeout:
+                        synth_error = "did not finish before the review deadline"
+                    except Exception as e:
+                        synth_error = str(e)
+                    if synth_error:
+                        print(f"[WARN] Consensus synthesis unavailable: {synth_error}")
+            usage = ledger.summary(cfg)
+
+            # Cross-model consensus: cluster similar findings locally (no gateway call)
+            consensus = None
+            if cfg.get("consensus", True) and sum(1 for m in selected_models if results.get(m)) >= 2:
+                with TRACER.span("consensus") as sp:
+                    consensus = build_consensus(cfg, findings_by_model(
+                        {m: results.get(m, "") for m in selected_models}, structured))
+                    sp.set(clusters=len(consensus["clusters"]), elapsed_ms=consensus["elapsed_ms"])
+
+            # 4) Build report
+            progress("Working… Building HTML report")
+            base = safe_base_filename(owner, repo, number, pr_title)
+            ts = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+            trace_path = os.path.join(TRACE_DIR, f"{base}-{ts}.json") if cfg.get("tracing", True) else None
+            if prof:
+                prof.name_as(os.path.join(STORE_DIR, f"{base}-{ts}"))
+            with TRACER.span("normalize_html", models=len(selected_models)):
+                sections = [(m, normalize_model_html(review_html(structured[m]) if m in structured
+                                                     else results.get(m, ""))) for m in selected_models]
+            findings_path = None
+            if structured:
+                findings_path = os.path.join(STORE_DIR, f"{base}-{ts}.findings.json")
+                save_findings(findings_path, pr_url, structured, head_sha=(meta.get("head") or {}).get("sha"),
+                              consensus=consensus["clusters"] if consensus else None)
+
+            err_link = save_error_log(errors) if errors else None
+            title = f"PR Review — {owner}/{repo} — #{number}: {pr_title}"
+
+            full_html = wrap_full_report(
+                title=title,
+                pr_url=pr_url,
+                owner=owner, repo=repo, number=number,
+                sections=sections,
+                failed=errors,
+                error_log_link=err_link,
+                timed_out=timed_out,
+                prompt_stats=PromptStats.totals(prompt_stats.snapshot()),
+                usage=usage,
+                timings_html=timing_table_html(TRACER.spans(root.trace_id) + [root]) if root else None,
+                trace_link=trace_path,
+                profile_link=prof.summary_path if prof else None,
+                findings_link=findings_path,
+                consensus_html=_consensus_section(cfg, stage, synth_model, synthesis, synth_error, consensus),
+            )
+
+            # 5) Save
+            path = os.path.join(STORE_DIR, f"{base}-{ts}.html")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(full_html)
+
+            # 6) Optionally publish as one GitHub review (inline comments from the Review Tables)
+            published, publish_error = None, None
+            if cfg.get("github_review_publish"):
+                progress("Working… Posting review to GitHub")
+                try:
+                    payload = build_review_payload(
+                        cfg, diff, {m: structured.get(m) or results.get(m, "") for m in selected_models}, meta,
+                        head_sha=head_sha)
+                    published = publish_review(cfg, pr_url, payload)
+                except Exception as e:
+                    publish_error = str(e)
+                    print(f"[WARN] Review not posted to GitHub: {e}")
+
+            # 7) Persist to index
+            entry = {
+                "id": str(uuid.uuid4()),
+                "pr_url": pr_url,
+                "html_path": path,
+                "title": pr_title,
+                "author": author,
+                "owner": owner,
+                "repo": repo,
+                "number": number,
+                "timestamp": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                "usage": usage,
+            }
+            if structured:
+                entry["findings_path"] = findings_path
+                entry["findings"] = {sev: sum(severity_counts(r)[sev] for r in structured.values()) for sev in SEVERITIES}
+            if published and not published["dry_run"]:
+                entry["github_review_url"] = published["html_url"]
+            append_index_item(entry)
+
+        if root:
+            export_trace(TRACER.pop(root.trace_id), trace_path)
+    except Exception as e:
+        if root:
+            TRACER.pop(root.trace_id)  # drop the failed review's spans (long-running services)
+        METRICS.review_done("superseded" if isinstance(e, SupersededError) else "error", time.monotonic() - started)
+        raise
+    METRICS.review_done("ok" if len(errors) < len(selected_models) else "error", time.monotonic() - started)
+
+    return {
+        "path": path, "entry": entry, "pr_url": pr_url,
+        "host": host, "owner": owner, "repo": repo, "number": number, "meta": meta,
+        "models": selected_models, "results": results, "errors": errors, "timed_out": timed_out,
+        "usage": usage, "trace_path": trace_path,
+        "published": published, "publish_error": publish_error, "findings": structured,
+        "consensus": consensus, "synthesis": synthesis,
+    }
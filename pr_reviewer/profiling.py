@@ -0,0 +1,197 @@
+# profiling.py
+"""
+Opt-in cProfile + tracemalloc capture around one review or file-history summary.
+Enabled by cfg["profile_reviews"] or `python main.py --profile`:
+
+    with profile_session(cfg, "review") as prof:       # prof is None when profiling is off
+        ...
+        prof.name_as(os.path.join(STORE_DIR, f"{base}-{ts}"))   # files land next to the HTML report
+        ... report links prof.summary_path ...
+
+Writes <name>.pstats (load with pstats / snakeviz) and <name>-profile.txt (top functions by
+cumulative time, top allocations since the start, peak traced memory).
+
+Before Python 3.12 cProfile only sees the thread it runs on, so model workers wrap their body in
+`with profile_thread():` and their stats are merged into the session's .pstats. From 3.12 a
+profiler is process-wide (sys.monitoring) and only one may be active: the session's own profiler
+already sees every thread, profile_thread is a no-op, and a session that starts while another
+holds the profiler (concurrent webhook reviews) records memory only.
+tracemalloc is shared by reference count and stopped when the last session ends.
+"""
+import io
+import os
+import sys
+import time
+import pstats
+import cProfile
+import datetime
+import threading
+import tracemalloc
+import contextvars
+from contextlib import contextmanager
+
+from .storage import STORE_DIR
+
+_session: contextvars.ContextVar = contextvars.ContextVar("pr_reviewer_profile", default=None)
+_FORCED = False
+_PER_THREAD = sys.version_info < (3, 12)  # 3.12+: one process-wide profiler at a time
+
+# Shared between concurrent sessions
+_state_lock = threading.Lock()
+_tm_users = 0
+_tm_owned = False  # tracemalloc was started here (not by the caller), so stop it with the last session
+
+
+def enable_profiling():
+    """CLI switch: profile every review regardless of the config flag."""
+    global _FORCED
+    _FORCED = True
+
+
+def profiling_enabled(cfg: dict) -> bool:
+    return _FORCED or bool(cfg.get("profile_reviews"))
+
+
+class ProfileSession:
+    def __init__(self, label: str, top_n: int = 40):
+        self.label = label
+        self.top_n = top_n
+        self.base = os.path.join(STORE_DIR, f"profile-{label}-{datetime.datetime.now():%Y%m%d-%H%M%S}")
+        self._owner = threading.get_ident()
+        self._lock = threading.Lock()
+        self._profiles: list[cProfile.Profile] = []
+        self._closed = False
+        self._prof: cProfile.Profile | None = None
+        self._note = ""
+        self._start_snapshot = None
+        self._t0 = 0.0
+
+    @property
+    def pstats_path(self) -> str:
+        return self.base + ".pstats"
+
+    @property
+    def summary_path(self) -> str:
+        return self.base + "-profile.txt"
+
+    def name_as(self, base_path: str):
+        """Output path without extension; call once the report name is known."""
+        self.base = base_path
+
+    def start(self):
+        global _tm_users, _tm_owned
+        self._t0 = time.monotonic()
+        with _state_lock:
+            if _tm_users == 0:
+                _tm_owned = not tracemalloc.is_tracing()
+                if _tm_owned:
+                    tracemalloc.start()
+                tracemalloc.reset_peak()  # concurrent sessions share the peak from the first one's start
+            else:
+                self._note = "peak memory shared with concurrent sessions"
+            _tm_users += 1
+        self._start_snapshot = tracemalloc.take_snapshot()
+        prof = cProfile.Profile()
+        try:
+            prof.enable()
+        except ValueError as e:  # 3.12+: another session (or tool) holds the process-wide profiler
+            self._note = f"no cProfile ({e}); memory only"
+        else:
+            self._prof = prof
+            self._profiles.append(prof)
+        return self
+
+    def _add(self, prof: cProfile.Profile):
+        with self._lock:
+            if not self._closed:  # stragglers finishing after the report are dropped
+                self._profiles.append(prof)
+
+    def _release_tracemalloc(self):
+        global _tm_users
+        with _state_lock:
+            _tm_users -= 1
+            if _tm_users == 0 and _tm_owned:
+                tracemalloc.stop()
+
+    def stop(self):
+        if self._prof:
+            self._prof.disable()
+        wall = time.monotonic() - self._t0
+        with self._lock:
+            self._closed = True
+            profiles = list(self._profiles)
+
+        try:
+            end_snapshot = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+        except Exception as e:
+            print(f"[WARN] Could not snapshot memory for the profile: {e}")
+            end_snapshot, peak = None, 0
+        finally:
+            self._release_tracemalloc()
+
+        try:
+            os.makedirs(os.path.dirname(self.base) or ".", exist_ok=True)
+            out = io.StringIO()
+            out.write(f"Profile: {self.label}\n")
+            out.write(f"Wall time: {wall:.2f} s   Peak traced memory: {peak / 1e6:.1f} MB   "
+                      f"Profiles merged: {len(profiles)} (calling thread + worker tasks)\n")
+            if self._note:
+                out.write(f"Note: {self._note}\n")
+            if profiles:
+                stats = pstats.Stats(profiles[0])
+                for p in profiles[1:]:
+                    stats.add(p)
+                stats.dump_stats(self.pstats_path)
+                out.write(f"pstats: {os.path.basename(self.pstats_path)}\n\n")
+                out.write(f"== Top {self.top_n} functions by cumulative time (all profiled threads) ==\n")
+                pstats.Stats(self.pstats_path, stream=out).strip_dirs().sort_stats("cumulative").print_stats(self.top_n)
+            if end_snapshot is not None:
+                out.write(f"\n== Top {self.top_n} allocations since start (by line) ==\n")
+                filters = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, "<frozen*")]
+                diff = end_snapshot.filter_traces(filters).compare_to(self._start_snapshot.filter_traces(filters), "lineno")
+                for stat in diff[:self.top_n]:
+                    out.write(f"{stat}\n")
+            with open(self.summary_path, "w", encoding="utf-8") as f:
+                f.write(out.getvalue())
+        except Exception as e:
+            print(f"[WARN] Could not save profile: {e}")
+
+
+@contextmanager
+def profile_session(cfg: dict, label: str):
+    """Profiles the enclosed block when enabled; yields the ProfileSession or None."""
+    if not profiling_enabled(cfg):
+        yield None
+        return
+    session = ProfileSession(label, top_n=int(cfg.get("profile_top_n") or 40)).start()
+    token = _session.set(session)
+    try:
+        yield session
+    finally:
+        _session.reset(token)
+        session.stop()
+
+
+@contextmanager
+def profile_thread():
+    """
+    Inside a worker thread of a profiled session (context copied via TRACER.bind): profile this
+    thread too. No-op on 3.12+, where the session's profiler already covers all threads.
+    """
+    session = _session.get()
+    if session is None or not _PER_THREAD or threading.get_ident() == session._owner:
+        yield
+        return
+    prof = cProfile.Profile()
+    try:
+        prof.enable()
+    except Exception as e:  # never fail the profiled work because of the profiler
+        print(f"[WARN] Could not profile worker thread: {e}")
+        yield
+        return
+    try:
+        yield
+    finally:
+        prof.disable()
+        session._add(prof)
@@ -1,14 +1,146 @@
 # pr_reviewer/prompts.py
+import json
+import threading
+import contextvars
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import NamedTuple
+
+from .model_registry import estimate_tokens
+from .findings import REVIEW_SCHEMA
+
+__all__ = ["build_prompts", "compile_prompts", "CompiledPrompts", "PROMPT_STATS", "track_prompt_stats",
+           "record_prompt_stats"]
+
+
+class CompiledPrompts(NamedTuple):
+    """
+    Immutable prompt set for one output format, built once and shared by every chunk and model.
+    `static_block` (template + format hint) always follows the system prompt so gateways with
+    prefix/KV caching can reuse the same leading messages across calls.
+    """
+    output_format: str
+    system: str
+    user: str
+    hint: str
+    static_block: str
+    prefix_tokens: int
+
+    def prefix_messages(self) -> list[dict]:
+        """Leading messages shared by every review call; per-PR/per-chunk content goes after these."""
+        return [
+            {"role": "system", "content": self.system},
+            {"role": "user", "content": self.static_block},
+        ]
+
+
+def compile_prompts(cfg: dict) -> CompiledPrompts:
+    return _compile((cfg.get("output_format") or "html").lower().strip())
+
+
+@lru_cache(maxsize=None)
+def _compile(output_format: str) -> CompiledPrompts:
+    system, user, hint = _prompt_triplet(output_format)
+    static_block = "\n\n".join([user, hint])
+    return CompiledPrompts(
+        output_format=output_format,
+        system=system,
+        user=user,
+        hint=hint,
+        static_block=static_block,
+        prefix_tokens=estimate_tokens(system) + estimate_tokens(static_block),
+    )
 
-__all__ = ["build_prompts"]
 
 def build_prompts(cfg: dict):
     """
-    Returns (system, user, hint) prompt triplet based on cfg["output_format"].
+    Returns (system, user, hint) prompt triplet based on cfg["output_format"] ("html", "json" or "markdown").
     Default is HTML (fragment). Adds a 'Suggested Test Cases' section and colgroups to widen tables.
     """
-    output_format = (cfg.get("output_format") or "html").lower().strip()
+    compiled = compile_prompts(cfg)
+    return compiled.system, compiled.user, compiled.hint
+
+
+class PromptStats:
+    """
+    Per-model prompt token counters, used to see how much of each prompt is the shared prefix.
+      prompt_tokens : reported by the gateway (usage.prompt_tokens), estimated when absent
+      prefix_tokens : estimated tokens of the leading static messages
+      cached_tokens : reported by gateways that expose prefix-cache hits (usage.prompt_tokens_details)
+    PROMPT_STATS holds the process totals; track_prompt_stats() keeps a separate one per review.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_model: dict[str, dict] = {}
+
+    def record(self, model: str, prompt_tokens: int, prefix_tokens: int, cached_tokens: int, share: float = 1.0):
+        """`share` < 1 books a fraction of a call shared with other reviews (micro-batched prompts)."""
+        with self._lock:
+            row = self._by_model.setdefault(
+                model, {"calls": 0, "prompt_tokens": 0, "prefix_tokens": 0, "cached_tokens": 0}
+            )
+            row["calls"] += share
+            row["prompt_tokens"] += int(prompt_tokens or 0) * share
+            row["prefix_tokens"] += int(prefix_tokens or 0) * share
+            row["cached_tokens"] += int(cached_tokens or 0) * share
+
+    def snapshot(self) -> dict[str, dict]:
+        with self._lock:
+            return {m: dict(row) for m, row in self._by_model.items()}
+
+    @staticmethod
+    def totals(snapshot: dict[str, dict], since: dict[str, dict] | None = None) -> dict:
+        """Sums a snapshot across models, minus an earlier snapshot when given."""
+        keys = ("calls", "prompt_tokens", "prefix_tokens", "cached_tokens")
+        tot = {k: 0 for k in keys}
+        for m, row in snapshot.items():
+            base = (since or {}).get(m, {})
+            for k in keys:
+                tot[k] += row.get(k, 0) - base.get(k, 0)
+        return {k: int(round(v)) for k, v in tot.items()}
+
+
+PROMPT_STATS = PromptStats()
+
+# Per-review stats, like usage.py's ledger: follows TRACER.bind(fn) into worker threads
+_review_stats: contextvars.ContextVar = contextvars.ContextVar("pr_reviewer_prompt_stats", default=None)
 
+
+@contextmanager
+def track_prompt_stats():
+    """Starts per-review prompt stats; calls recorded in this context (and bound threads) land there too."""
+    stats = PromptStats()
+    token = _review_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _review_stats.reset(token)
+
+
+@contextmanager
+def use_prompt_stats(stats: PromptStats | None):
+    """Re-enters a review's prompt stats on a thread that did not inherit them (micro-batch flushes)."""
+    token = _review_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _review_stats.reset(token)
+
+
+def current_prompt_stats() -> PromptStats | None:
+    return _review_stats.get()
+
+
+def record_prompt_stats(model: str, prompt_tokens: int, prefix_tokens: int, cached_tokens: int):
+    """Books one call into PROMPT_STATS and the current review's stats (if any)."""
+    PROMPT_STATS.record(model, prompt_tokens, prefix_tokens, cached_tokens)
+    stats = _review_stats.get()
+    if stats is not None:
+        stats.record(model, prompt_tokens, prefix_tokens, cached_tokens)
+
+
+def _prompt_triplet(output_format: str):
     if output_format == "html":
         system = (
             "You are a senior software engineer performing a rigorous code review of a GitHub PR unified diff. "
@@ -118,6 +250,32 @@ def build_prompts(cfg: dict):
         hint = "Return a single HTML fragment only (no <html> wrapper). Include the 'Suggested Test Cases' table."
         return system, user, hint
 
+    elif output_format == "json":
+        system = (
+            "You are a senior software engineer performing a rigorous code review of a GitHub PR unified diff. "
+            "Return only one JSON object (no markdown, no code fences, no prose). Identify correctness, security, "
+            "performance, concurrency, API/contract, error handling, logging, testing, and maintainability issues. "
+            "Report each material issue as one finding tied to a file and a line of the new file; ignore generated code. "
+            "Also propose prioritized SUGGESTED TEST CASES with concrete steps and expected outcomes."
+        )
+
+        user = (
+            "Using the unified diff below, produce one JSON object with:\n"
+            "- summary: one to two precise sentences on the intent and purpose of the change\n"
+            "- key_points: acceptance criteria\n"
+            "- files: per changed file, the step-wise changes and why they matter\n"
+            "- findings: one entry per issue (file, line, severity LOW/MEDIUM/HIGH, category, observation, recommendation)\n"
+            "- tests: suggested test cases\n"
+            "- verdict: short paragraph on readiness and risk"
+        )
+
+        hint = (
+            "OUTPUT FORMAT (strict): exactly one JSON object matching this JSON Schema. Use null for `line` when a "
+            "finding is not tied to one line; use an empty findings array when there are no issues.\n"
+            + json.dumps(REVIEW_SCHEMA, separators=(",", ":"))
+        )
+        return system, user, hint
+
     else:
         system = (
             "You are a senior software engineer performing a rigorous code review of a GitHub PR unified diff. "
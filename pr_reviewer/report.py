@@ -0,0 +1,388 @@
+# report.py
+"""
+HTML report building for PR reviews: model output normalisation, the error log page and the
+full report with index. Kept free of Tk so the pipeline can be driven headless (benchmarks, bulk runs).
+"""
+import os
+import re
+import datetime
+
+from .storage import STORE_DIR
+
+
+def sanitize_model_anchor(model_name: str) -> str:
+    return "m-" + "".join(ch.lower() if ch.isalnum() else "-" for ch in model_name).strip("-")
+
+
+def strip_code_fences(text: str) -> str:
+    if not text:
+        return ""
+    text = re.sub(r"^```[a-zA-Z0-9_-]*\s*", "", text.strip())
+    text = re.sub(r"\s*```$", "", text.strip())
+    return text.strip()
+
+
+def markdown_to_html_light(text: str) -> str:
+    if not text:
+        return ""
+    if "<html" in text.lower() or "<div" in text.lower() or "<table" in text.lower() or "<section" in text.lower():
+        return text
+    text = strip_code_fences(text)
+
+    import html as _html
+    import re as _re
+    esc = _html.escape
+    lines = text.splitlines()
+    html_lines = []
+    in_ul = in_ol = in_pre = False
+
+    def close_lists():
+        nonlocal in_ul, in_ol
+        if in_ul:
+            html_lines.append("</ul>"); in_ul = False
+        if in_ol:
+            html_lines.append("</ol>"); in_ol = False
+
+    for raw in lines:
+        line = raw.rstrip("\n")
+
+        m = _re.match(r"^\s{0,3}(#{1,6})\s+(.*)$", line)
+        if m:
+            close_lists()
+            level = len(m.group(1))
+            content = m.group(2).strip()
+            html_lines.append(f"<h{level}>{esc(content)}</h{level}>")
+            continue
+
+        if _re.match(r"^\s*[-*]\s+.+$", line):
+            if not in_ul:
+                close_lists()
+                in_ul = True
+                html_lines.append("<ul>")
+            html_lines.append(f"<li>{esc(line.lstrip(' -*'))}</li>")
+            continue
+
+        if _re.match(r"^\s*\d+\.\s+.+$", line):
+            if not in_ol:
+                close_lists()
+                in_ol = True
+                html_lines.append("<ol>")
+            cleaned_line = esc(_re.sub(r'^\s*\d+\.\s+', '', line))
+            html_lines.append(f"<li>{cleaned_line}</li>")
+
+            continue
+
+        if _re.match(r"^\s{4,}.*$", line):
+            if not in_pre:
+                close_lists()
+                in_pre = True
+                html_lines.append("<pre><code>")
+            html_lines.append(esc(line[4:]))
+            continue
+        else:
+            if in_pre and line.strip() == "":
+                html_lines.append("")
+                continue
+            elif in_pre:
+                html_lines.append("</code></pre>")
+                in_pre = False
+
+        if line.strip():
+            close_lists()
+            html_lines.append(f"<p>{esc(line.strip())}</p>")
+        else:
+            close_lists()
+            html_lines.append("")
+
+    close_lists()
+    if in_pre:
+        html_lines.append("</code></pre>")
+
+    out = "\n".join(l for l in html_lines if l is not None)
+    return out.strip()
+
+
+def force_headings_blue(html_fragment: str) -> str:
+    if not html_fragment:
+        return ""
+    import re as _re
+
+    # Added "Suggested Test Cases" and "Overall Verdict"
+    targets = [
+        "Change Requirement",
+        "Key Points",
+        "Change Summary by File",
+        "Review Table",
+        "Suggested Test Cases",
+        "Overall Verdict",
+    ]
+
+    def repl_heading(m):
+        tag = m.group(1);
+        inner = m.group(2)
+        for t in targets:
+            if inner.strip().lower() == t.lower():
+                return f"<{tag} style=\"color:#0B63C5;\">{t}</{tag}>"
+        return m.group(0)
+
+    # Color <h1>..</h1> .. <h6>..</h6>
+    html_fragment = _re.sub(
+        r"<(h[1-6])>([^<]+)</\1>",
+        repl_heading,
+        html_fragment,
+        flags=_re.IGNORECASE,
+    )
+
+    # Color <p><strong>...</strong></p> and <p><b>...</b></p> variants
+    for t in targets:
+        html_fragment = html_fragment.replace(
+            f"<p><strong>{t}</strong></p>",
+            f"<p><strong style=\"color:#0B63C5;\">{t}</strong></p>"
+        ).replace(
+            f"<p><b>{t}</b></p>",
+            f"<p><b style=\"color:#0B63C5;\">{t}</b></p>"
+        )
+
+    return html_fragment
+
+
+def ensure_bordered_tables(html_fragment: str) -> str:
+    if not html_fragment:
+        return ""
+    import re as _re
+
+    def add_table_style(m):
+        tag = m.group(0)
+        if "style=" in tag:
+            return tag
+        return '<table style="border-collapse:collapse;width:100%;border:1px solid #cbd5e1;">'
+
+    html_fragment = _re.sub(r"<table(\s*)>", add_table_style, html_fragment, flags=_re.IGNORECASE)
+    html_fragment = html_fragment.replace("<th", "<th style=\"border:1px solid #cbd5e1;padding:8px;\"")
+    html_fragment = html_fragment.replace("<td", "<td style=\"border:1px solid #cbd5e1;padding:8px;\"")
+    return html_fragment
+
+
+def normalize_model_html(raw_text: str) -> str:
+    if not raw_text:
+        return ""
+    s = raw_text.strip()
+    s = strip_code_fences(s)
+    s = markdown_to_html_light(s)
+    s = force_headings_blue(s)
+    s = ensure_bordered_tables(s)
+    return s
+
+
+def save_error_log(model_errors: dict) -> str | None:
+    if not model_errors:
+        return None
+    import html as _html
+    errdir = os.path.join(STORE_DIR, "errorlog")
+    os.makedirs(errdir, exist_ok=True)
+    ts = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+    path = os.path.join(errdir, f"errors-{ts}.html")
+    parts = [
+        "<!doctype html><html><head><meta charset='utf-8'>",
+        "<title>Model Errors</title>",
+        "<style>body{font-family:Inter,Segoe UI,Arial,sans-serif;padding:16px;} h1{color:#b91c1c;} ",
+        "table{border-collapse:collapse;width:100%;} td,th{border:1px solid #ddd;padding:8px;text-align:left;} ",
+        "th{background:#f8f8f8;}</style></head><body>",
+        "<h1>Model Errors</h1>",
+        "<table><thead><tr><th>Model</th><th>Error</th></tr></thead><tbody>",
+    ]
+    for m, e in model_errors.items():
+        parts.append(
+            f"<tr><td>{_html.escape(m)}</td><td><pre style='white-space:pre-wrap;'>{_html.escape(e)}</pre></td></tr>"
+        )
+    parts.append("</tbody></table></body></html>")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("".join(parts))
+    return path
+
+
+def safe_base_filename(owner: str, repo: str, number: int | str, title: str) -> str:
+    raw = f"{owner}-{repo}-PR{number}-{title or ''}"
+    clean = "".join((c if c.isalnum() or c in ("-", "_") else "_") for c in raw)
+    return clean[:180]
+
+
+def wrap_full_report(title: str, pr_url: str, owner: str, repo: str, number: int | str,
+                      sections: list[tuple[str, str]], failed: dict, error_log_link: str | None,
+                      timed_out: set | None = None, prompt_stats: dict | None = None,
+                      timings_html: str | None = None, trace_link: str | None = None,
+                      usage: dict | None = None, profile_link: str | None = None,
+                      findings_link: str | None = None, consensus_html: str | None = None) -> str:
+    import html as _html
+    esc = _html.escape
+    css = """
+    :root{--blue:#0B63C5;--red:#b91c1c;--border:#cbd5e1;--muted:#6b7280;}
+    *{box-sizing:border-box;}
+    html,body{max-width:100%;overflow-x:hidden;}
+    body{font-family:Inter,Segoe UI,Arial,sans-serif;margin:0;padding:0;background:#fff;}
+
+    /* Slightly narrower and centered to avoid horizontal scroll on most displays */
+    .container{width:min(92vw,1320px);max-width:none;margin:0;padding:24px;}
+
+    h1{margin:0 0 10px 0;font-size:24px;}
+    h2{margin:20px 0 8px 0;}
+    h3{margin:14px 0 6px 0;}
+    a{color:#0B63C5;text-decoration:none;}
+    a:hover{text-decoration:underline;}
+    .header{border-bottom:1px solid var(--border);padding-bottom:12px;margin-bottom:16px;}
+    .meta{color:var(--muted);font-size:14px;overflow-wrap:anywhere;word-break:break-word;}
+
+    /* Index table */
+    .index-table{width:100%;max-width:100%;border-collapse:collapse;margin:10px 0 20px 0;table-layout:fixed;}
+    .index-table th,.index-table td{
+        border:1px solid var(--border);padding:8px;text-align:left;
+        overflow-wrap:anywhere;word-break:break-word;white-space:normal;
+    }
+    .index-table th{background:#f8f8f8;}
+
+    .model-title{color:var(--red);margin:0;}
+    .back{font-size:13px;margin:2px 0 12px 0;}
+    hr.sep{border:none;border-top:2px solid var(--border);margin:22px 0;}
+
+    /* Any tables inside model sections (e.g., Review Table, Suggested Test Cases) */
+    .model-section table{border-collapse:collapse;width:100%;max-width:100%;table-layout:fixed;}
+    .model-section th,.model-section td{
+        border:1px solid var(--border);padding:8px;text-align:left;
+        overflow-wrap:anywhere;word-break:break-word;white-space:normal;
+    }
+
+    /* Images and pre/code wrap to avoid overflow */
+    img{max-width:100%;height:auto;}
+    pre, code{white-space:pre-wrap;word-wrap:break-word;overflow-wrap:anywhere;}
+    """
+
+    # Build index rows
+    timed_out = timed_out or set()
+    by_model = (usage or {}).get("by_model") or {}
+    rows = []
+    for model_name, fragment in sections:
+        ok = (fragment.strip() != "")
+        status = "OK" if ok else ("Timed out" if model_name in timed_out else "Failed")
+        usage_cells = ""
+        if usage:
+            u = by_model.get(model_name) or {}
+            usage_cells = (
+                f"<td>{u.get('calls', 0):,}</td>"
+                f"<td>{u.get('prompt_tokens', 0):,} / {u.get('completion_tokens', 0):,}</td>"
+                f"<td>{u.get('cost', 0):,.3f}</td>"
+            )
+        rows.append(
+            f"<tr><td><a href='#{sanitize_model_anchor(model_name)}'>{esc(model_name)}</a></td>"
+            f"<td>{status}</td>{usage_cells}</tr>"
+        )
+    # Models used only behind the scenes (e.g. routing fallbacks) still show their usage
+    for model_name, u in by_model.items():
+        if model_name not in {m for m, _ in sections}:
+            rows.append(
+                f"<tr><td>{esc(model_name)}</td><td>-</td><td>{u.get('calls', 0):,}</td>"
+                f"<td>{u.get('prompt_tokens', 0):,} / {u.get('completion_tokens', 0):,}</td>"
+                f"<td>{u.get('cost', 0):,.3f}</td></tr>"
+            )
+
+    parts = []
+    parts.append("<!doctype html><html><head><meta charset='utf-8'>")
+    parts.append(f"<title>{esc(title)}</title>")
+    parts.append(f"<style>{css}</style></head><body>")
+    parts.append("<div class='container'>")
+
+    # Header
+    parts.append("<div class='header'>")
+    parts.append(f"<h1>{esc(title)}</h1>")
+    if pr_url:
+        parts.append(
+            f"<div class='meta'>PR:&nbsp;<a href='{esc(pr_url)}' target='_blank'>{esc(pr_url)}</a></div>"
+        )
+    parts.append(
+        f"<div class='meta'>Repo: {esc(owner)}/{esc(repo)} &nbsp;&nbsp; PR #{esc(str(number))}</div>"
+    )
+    if error_log_link:
+        parts.append(
+            f"<div class='meta'>Errors:&nbsp;<a href='{esc(error_log_link)}' target='_blank'>Open Error Log</a></div>"
+        )
+    if findings_link:
+        parts.append(
+            f"<div class='meta'>Findings:&nbsp;<a href='{esc(findings_link)}' target='_blank'>Open Findings (JSON)</a></div>"
+        )
+    if profile_link:
+        parts.append(
+            f"<div class='meta'>Profile:&nbsp;<a href='{esc(profile_link)}' target='_blank'>Open Profile Summary</a>"
+            f" (cProfile + tracemalloc; .pstats alongside)</div>"
+        )
+    if trace_link:
+        parts.append(
+            f"<div class='meta'>Trace:&nbsp;<a href='{esc(trace_link)}' target='_blank'>Open Trace (OTLP JSON)</a>"
+            f" &nbsp;&nbsp; <a href='#timings'>Timings</a></div>"
+        )
+    if prompt_stats and prompt_stats.get("calls"):
+        total = prompt_stats.get("prompt_tokens", 0)
+        prefix = prompt_stats.get("prefix_tokens", 0)
+        share = f"{prefix / total:.0%}" if total else "-"
+        parts.append(
+            f"<div class='meta'>Prompt tokens: {total:,} over {prompt_stats['calls']} call(s) &nbsp;&nbsp; "
+            f"shared prefix ≈ {prefix:,} ({share}) &nbsp;&nbsp; gateway-cached: {prompt_stats.get('cached_tokens', 0):,}</div>"
+        )
+    if usage and usage.get("calls"):
+        est = f" &nbsp;&nbsp; ({usage['estimated_calls']} call(s) estimated)" if usage.get("estimated_calls") else ""
+        parts.append(
+            f"<div class='meta'>Usage: {usage.get('total_tokens', 0):,} tokens "
+            f"(prompt {usage.get('prompt_tokens', 0):,} / completion {usage.get('completion_tokens', 0):,}) "
+            f"over {usage['calls']} call(s) &nbsp;&nbsp; est. cost {usage.get('cost', 0):,.3f}{est}</div>"
+        )
+    parts.append("</div>")
+
+    # Index
+    parts.append("<a id='index'></a>")
+    parts.append("<h2>Index</h2>")
+    if consensus_html:
+        parts.append("<div class='back'><a href='#consensus'>Consensus across models</a></div>")
+    usage_heads = "<th>Calls</th><th>Tokens (prompt / completion)</th><th>Est. cost</th>" if usage else ""
+    parts.append(f"<table class='index-table'><thead><tr><th>Model</th><th>Status</th>{usage_heads}</tr></thead><tbody>")
+    parts.extend(rows)
+    parts.append("</tbody></table>")
+
+    # Cross-model consensus (consensus.py), ahead of the per-model sections
+    if consensus_html:
+        parts.append("<hr class='sep'>")
+        parts.append("<div class='model-section'><a id='consensus'></a><h2>Consensus</h2>")
+        parts.append("<div class='back'><a href='#index'>Back to Index</a></div>")
+        parts.append(consensus_html)
+        parts.append("</div>")
+
+    # Sections
+    for model_name, fragment in sections:
+        anchor = sanitize_model_anchor(model_name)
+        parts.append("<hr class='sep'>")
+        parts.append(f"<div class='model-section'><a id='{anchor}'></a>")
+        parts.append(f"<h2 class='model-title'>{esc(model_name)}</h2>")
+        parts.append("<div class='back'><a href='#index'>Back to Index</a></div>")
+        if fragment.strip():
+            parts.append(fragment)
+        elif model_name in timed_out:
+            parts.append("<p><em>No output (model timed out; the report was not held for it).</em></p>")
+        else:
+            parts.append("<p><em>No output (model failed or returned empty).</em></p>")
+        parts.append("</div>")
+
+    # Failed models list
+    if failed:
+        parts.append("<hr class='sep'>")
+        parts.append("<h2>Failed Models</h2>")
+        parts.append("<ul>")
+        for m, err in failed.items():
+            parts.append(f"<li><strong>{esc(m)}</strong> — <span class='meta'>{esc(err)[:400]}</span></li>")
+        parts.append("</ul>")
+
+    # Per-stage timings (trace spans)
+    if timings_html:
+        parts.append("<hr class='sep'>")
+        parts.append("<a id='timings'></a><h2>Timings</h2>")
+        parts.append("<div class='back'><a href='#index'>Back to Index</a></div>")
+        parts.append(timings_html)
+
+    parts.append("</div></body></html>")
+    return "".join(parts)
@@ -1,91 +1,292 @@
-from .model_client import make_client
+import re
+import time
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FuturesTimeout
+
+from .model_client import make_client, create_chat_completion, completion_usage, prompt_usage, ModelTimeoutError
 from .diff_utils import extract_changed_files, chunk_text
-from .prompts import build_prompts
+from .prompts import compile_prompts, current_prompt_stats, use_prompt_stats
+from .findings import parse_review, merge_reviews, dumps_review, FindingsError
+from .model_registry import ROUTER
+from .batching import MicroBatcher
+from .tracing import TRACER
+from .usage import usage_part, use_ledger, current_ledger
+from .metrics import METRICS, start_metrics_server
 
+CHUNK_CHARS = 12000
+
+
+def plan_routes(cfg: dict, diff_text: str, selected_models: list[str], router=ROUTER) -> dict[str, list[int]]:
+    """
+    Returns {model: [chunk numbers (1-based)]} for adaptive routing.
+    Models not in `selected_models` may appear when the router falls back to small or long-context models.
+    """
+    plan: dict[str, list[int]] = {}
+    for i, chunk in enumerate(chunk_text(diff_text, max_chars=CHUNK_CHARS), 1):
+        for m in router.route(cfg, chunk, selected_models):
+            plan.setdefault(m, []).append(i)
+    return plan
+
+
+def model_deadline(cfg: dict, review_deadline: float | None = None) -> float | None:
+    """Per-model deadline (time.monotonic()) from cfg["model_timeout_s"], capped by the review deadline."""
+    per_model = float(cfg.get("model_timeout_s") or 0)
+    own = time.monotonic() + per_model if per_model else None
+    if own is None or review_deadline is None:
+        return own if own is not None else review_deadline
+    return min(own, review_deadline)
+
+
+def _pr_meta_lines(pr_meta: dict | None) -> list[str]:
+    if not pr_meta:
+        return []
+    return [
+        f"PR Title: {pr_meta.get('title','')}",
+        f"Author: {(pr_meta.get('user') or {}).get('login','')}",
+        f"Base → Head: {(pr_meta.get('base') or {}).get('ref','')} → {(pr_meta.get('head') or {}).get('ref','')}",
+    ]
 
-def single_model_review(cfg: dict, model_name: str, diff_text: str, pr_meta: dict | None) -> str:
-    client = make_client(cfg)
 
+def _file_list_text(diff_text: str) -> str:
     files = extract_changed_files(diff_text)
-    file_list_text = (
+    return (
         "Files changed:\n" + "\n".join(f"- {f}" for f in files)
         if files else "Files changed: (not detected)"
     )
 
-    chunks = chunk_text(diff_text, max_chars=12000)
-    system, user_template, format_hint = build_prompts(cfg)
-    all_parts: list[str] = []
 
-    for i, chunk in enumerate(chunks, 1):
-        meta_lines: list[str] = []
-        if pr_meta:
-            meta_lines.append(f"PR Title: {pr_meta.get('title','')}")
-            meta_lines.append(f"Author: {(pr_meta.get('user') or {}).get('login','')}")
-            meta_lines.append(
-                f"Base → Head: {(pr_meta.get('base') or {}).get('ref','')} → {(pr_meta.get('head') or {}).get('ref','')}"
+def single_model_review(cfg: dict, model_name: str, diff_text: str, pr_meta: dict | None,
+                        chunk_indices: list[int] | None = None, deadline: float | None = None) -> str:
+    """
+    Review `diff_text` with one model. `chunk_indices` (1-based) limits the review to the
+    chunks routed to this model by plan_routes; None reviews every chunk.
+    Small single-chunk diffs go through the micro-batcher when cfg["micro_batch_window_ms"] > 0,
+    so concurrent reviews of small PRs share gateway calls.
+    Raises ModelTimeoutError once `deadline` (time.monotonic()) passes.
+    """
+    with TRACER.span("review.model", model=model_name, diff_bytes=len(diff_text),
+                     routed_chunks=len(chunk_indices) if chunk_indices is not None else None) as sp:
+        if chunk_indices is None and _batchable(cfg, diff_text):
+            sp.set(batched=True)
+            fut = _get_batcher(cfg).submit(
+                (model_name, (cfg.get("output_format") or "html").lower()),
+                {"cfg": cfg, "diff": diff_text, "meta": pr_meta, "deadline": deadline, "ledger": current_ledger(),
+                 "prompt_stats": current_prompt_stats()},
+                size=len(diff_text),
             )
+            try:
+                return fut.result(timeout=None if deadline is None else max(0.0, deadline - time.monotonic()))
+            except FuturesTimeout:
+                raise ModelTimeoutError(f"{model_name}: batched review did not finish before the deadline",
+                                        deadline_capped=True)
+        return _review_chunks(cfg, model_name, diff_text, pr_meta, chunk_indices, deadline)
+
+
+def _review_chunks(cfg: dict, model_name: str, diff_text: str, pr_meta: dict | None,
+                   chunk_indices: list[int] | None, deadline: float | None) -> str:
+    client = make_client(cfg)
+
+    prompts = compile_prompts(cfg)
+    with TRACER.span("chunk_text", bytes=len(diff_text)) as sp:
+        chunks = chunk_text(diff_text, max_chars=CHUNK_CHARS)
+        sp.set(chunks=len(chunks))
+    all_parts: list[str] = []
+
+    # Static prefix (system + template) first and identical for every chunk/model;
+    # the PR header is built once and only the chunk varies after it.
+    pr_header = "\n\n".join(filter(None, ["\n".join(_pr_meta_lines(pr_meta)), _file_list_text(diff_text)]))
 
-        header_block = "\n\n".join(
-            filter(
-                None,
-                [
-                    "\n".join(meta_lines),
-                    file_list_text,
-                    user_template,
-                    format_hint,
+    for i, chunk in enumerate(chunks, 1):
+        if chunk_indices is not None and i not in chunk_indices:
+            continue
+        with TRACER.span("review.chunk", model=model_name, chunk=i, chunks=len(chunks), bytes=len(chunk)), \
+                usage_part(f"chunk {i}"):
+            completion = create_chat_completion(
+                cfg, client, model_name,
+                prompts.prefix_messages() + [
+                    {
+                        "role": "user",
+                        "content": [
+                            {"type": "text", "text": pr_header},
+                            {"type": "text", "text": f"(Chunk {i}/{len(chunks)})"},
+                            {"type": "text", "text": f"```diff\n{chunk}\n```"},
+                        ],
+                    },
                 ],
+                deadline=deadline,
+                prefix_len=2,
             )
-        )
-
-        completion = client.chat.completions.create(
-            extra_headers={"x-correlation-id": (cfg.get("correlation_id") or "pr-review-ui")},
-            model=model_name,
-            messages=[
-                {"role": "system", "content": system},
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": header_block},
-                        {"type": "text", "text": f"(Chunk {i}/{len(chunks)})"},
-                        {"type": "text", "text": f"```diff\n{chunk}\n```"},
-                    ],
-                },
-            ],
-            stream=False,
-            temperature=0.2,
-        )
         all_parts.append(completion.choices[0].message.content)
 
     if len(all_parts) == 1:
         return all_parts[0]
 
+    if prompts.output_format == "json":
+        # Structured chunk reviews merge locally; the model is only asked when a chunk answer is not JSON
+        try:
+            with TRACER.span("review.merge_json", model=model_name, parts=len(all_parts)):
+                return dumps_review(merge_reviews([parse_review(p) for p in all_parts]))
+        except FindingsError as e:
+            print(f"[WARN] {model_name}: chunk review is not valid JSON ({e}); consolidating with the model")
+
     consolidated_prompt = (
         "Merge these chunked reviews into one. "
-        + (
-            "Return a single HTML fragment only (no <html> wrapper)."
-            if (cfg.get("output_format", "html") == "html")
-            else "Follow the Markdown format strictly."
-        )
+        + {
+            "html": "Return a single HTML fragment only (no <html> wrapper).",
+            "json": "Return exactly one JSON object in the schema above.",
+        }.get(prompts.output_format, "Follow the Markdown format strictly.")
         + " Deduplicate and merge by file. Produce one Change Summary, one Review Table, and one Overall Verdict."
     )
 
-    completion = client.chat.completions.create(
-        extra_headers={"x-correlation-id": (cfg.get("correlation_id") or "pr-review-ui")},
-        model=model_name,
-        messages=[
-            {"role": "system", "content": system},
-            {"role": "user", "content": consolidated_prompt},
-            {"role": "user", "content": "\n\n".join(all_parts)},
-        ],
-        stream=False,
-        temperature=0.2,
-    )
+    with TRACER.span("review.consolidate", model=model_name, parts=len(all_parts)), usage_part("consolidate"):
+        completion = create_chat_completion(
+            cfg, client, model_name,
+            [
+                {"role": "system", "content": prompts.system},
+                {"role": "user", "content": consolidated_prompt},
+                {"role": "user", "content": "\n\n".join(all_parts)},
+            ],
+            deadline=deadline,
+            prefix_len=1,
+        )
     return completion.choices[0].message.content
 
 
-def synthesize_with_base(cfg: dict, base_model: str, reviews_by_model: dict) -> str:
+# ---------------------------- Micro-batching of small reviews ----------------------------
+PACK_MARKER_RE = re.compile(r"<!--\s*PR-REVIEW:\s*(?P<n>\d+)\s*-->")
+
+_BATCHER: MicroBatcher | None = None
+
+
+def _batchable(cfg: dict, diff_text: str) -> bool:
+    window_ms = float(cfg.get("micro_batch_window_ms") or 0)
+    return window_ms > 0 and len(diff_text) <= int(cfg.get("micro_batch_max_chars") or 0)
+
+
+def _get_batcher(cfg: dict) -> MicroBatcher:
+    global _BATCHER
+    if _BATCHER is None:
+        _BATCHER = MicroBatcher(_flush_packed_reviews)
+        METRICS.register_collector(lambda: [("pr_reviewer_queue_depth", {"queue": "micro_batch"}, _BATCHER.pending())])
+    _BATCHER.window_s = float(cfg.get("micro_batch_window_ms") or 0) / 1000.0
+    _BATCHER.max_items = int(cfg.get("micro_batch_max_items") or 8)
+    _BATCHER.max_chars = int(cfg.get("micro_batch_max_chars") or 0) * _BATCHER.max_items
+    return _BATCHER
+
+
+def _split_packed(text: str) -> dict[str, str]:
+    marks = list(PACK_MARKER_RE.finditer(text or ""))
+    out: dict[str, str] = {}
+    for k, m in enumerate(marks):
+        end = marks[k + 1].start() if k + 1 < len(marks) else len(text)
+        out[m.group("n")] = text[m.end():end].strip()
+    return out
+
+
+def _flush_packed_reviews(key, payloads: list[dict], contexts: list) -> list:
+    """
+    MicroBatcher flush: packs several small PR diffs for one model into a single prompt with
+    delimiters and splits the answer back per PR. PRs missing from the answer are reviewed alone,
+    in their own request's context.
+    """
+    model_name = key[0]
+    if len(payloads) == 1:
+        p = payloads[0]  # already running in this request's context
+        return [_review_chunks(p["cfg"], model_name, p["diff"], p["meta"], None, p["deadline"])]
+
+    cfg = payloads[0]["cfg"]
+    deadlines = [p["deadline"] for p in payloads if p["deadline"] is not None]
+    client = make_client(cfg)
+    prompts = compile_prompts(cfg)
+
+    blocks = []
+    for n, p in enumerate(payloads, 1):
+        blocks.append("\n\n".join(filter(None, [
+            f"===== PR {n} =====",
+            "\n".join(_pr_meta_lines(p["meta"])),
+            _file_list_text(p["diff"]),
+            f"```diff\n{p['diff']}\n```",
+        ])))
+    instruction = (
+        f"The next message contains {len(payloads)} INDEPENDENT pull requests, each introduced by a line "
+        "'===== PR <n> ====='. Review each one separately using the template above. "
+        "Start each review with the exact line <!-- PR-REVIEW: <n> --> and never mix findings across PRs."
+    )
+
+    messages = prompts.prefix_messages() + [
+        {"role": "user", "content": instruction},
+        {"role": "user", "content": "\n\n".join(blocks)},
+    ]
+    # Outside any one review's ledger: the shared call is booked per PR below
+    with use_ledger(None), use_prompt_stats(None):
+        completion = create_chat_completion(
+            cfg, client, model_name, messages,
+            deadline=min(deadlines) if deadlines else None,
+            prefix_len=2,
+        )
+    # The shared call is booked to each PR's review in proportion to its diff size
+    prompt_tokens, completion_tokens, estimated = completion_usage(messages, completion)
+    prompt_split = prompt_usage(messages, 2, completion)
+    total_chars = sum(len(p["diff"]) for p in payloads) or 1
+    for p in payloads:
+        if p.get("ledger") is not None:
+            p["ledger"].record(model_name, prompt_tokens, completion_tokens, "packed", estimated,
+                               share=len(p["diff"]) / total_chars)
+        if p.get("prompt_stats") is not None:
+            p["prompt_stats"].record(model_name, *prompt_split, share=len(p["diff"]) / total_chars)
+    parts = _split_packed(completion.choices[0].message.content or "")
+
+    results: list = []
+    for n, p in enumerate(payloads, 1):
+        part = parts.get(str(n), "")
+        if part:
+            results.append(part)
+            continue
+        try:
+            results.append(contexts[n - 1].run(
+                _review_chunks, p["cfg"], model_name, p["diff"], p["meta"], None, p["deadline"]))
+        except Exception as e:
+            results.append(e)
+    return results
+
+
+def review_prs(cfg: dict, prs: list[dict], models: list[str], max_workers: int = 8) -> dict[str, dict]:
+    """
+    Bulk entry point: reviews many PRs with many models concurrently.
+    prs: [{"key": <pr url or id>, "diff": <diff text>, "meta": <pr meta dict or None>}]
+    Returns {key: {model: review text | Exception}}. With micro-batching enabled, small
+    same-model reviews submitted within the window share one gateway call.
+    """
+    start_metrics_server(cfg)
+    out: dict[str, dict] = {p["key"]: {} for p in prs}
+    tasks = [(p, m) for p in prs for m in models]
+    started = {p["key"]: time.monotonic() for p in prs}
+    METRICS.inc("pr_reviewer_queue_depth", len(tasks), queue="review_prs")
+
+    def run(p, m):
+        METRICS.inc("pr_reviewer_queue_depth", -1, queue="review_prs")
+        try:
+            return p["key"], m, single_model_review(cfg, m, p["diff"], p.get("meta"))
+        except Exception as e:
+            return p["key"], m, e
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as ex:
+        for key, m, res in ex.map(lambda pm: run(*pm), tasks):
+            out[key][m] = res
+            if len(out[key]) == len(models):
+                ok = any(not isinstance(v, Exception) for v in out[key].values())
+                METRICS.review_done("ok" if ok else "error", time.monotonic() - started[key])
+    return out
+
+
+def synthesize_with_base(cfg: dict, base_model: str, reviews_by_model: dict, previous: str | None = None,
+                         compact: bool = False, deadline: float | None = None) -> str:
+    """
+    One review from several models' reviews of the same PR. `compact` sources are findings.compact_review
+    JSON instead of full drafts; with `previous`, that earlier synthesis is updated with the new sources only.
+    """
     client = make_client(cfg)
-    system, user_template, format_hint = build_prompts(cfg)
+    prompts = compile_prompts(cfg)
 
     sources: list[str] = []
     for m, content in reviews_by_model.items():
@@ -94,26 +295,113 @@ def synthesize_with_base(cfg: dict, base_model: str, reviews_by_model: dict) ->
         # Keep a newline between the model header and its content
         sources.append(f"### Model: {m}\n{content}")
 
-    synth_user = (
-        "You are given multiple code review drafts generated by different models for the SAME PR. "
-        "Synthesize a SINGLE best review that strictly follows the required format already provided in the template, "
-        "preserves the 'Change Requirement' section (High-Level Summary + Acceptance Criteria), and then "
-        "continues with Change Summary by File, Review Table, and Overall Verdict. "
-        "Resolve conflicts by preferring well-justified, concrete issues and precise recommendations. "
-        "Be concise, remove duplicates, and ensure the final output is internally consistent and complete."
-    )
+    if previous:
+        synth_user = (
+            "Below is a synthesized review of the PR built from other models' reviews, followed by the reviews of "
+            "additional models for the SAME PR. Update the synthesized review with them: add new well-justified "
+            "issues, merge duplicates, adjust risks where the new reviews give concrete reasons, and keep the required "
+            "format already provided in the template. Return the complete updated review."
+        )
+    else:
+        synth_user = (
+            "You are given multiple code review drafts generated by different models for the SAME PR. "
+            "Synthesize a SINGLE best review that strictly follows the required format already provided in the template, "
+            "preserves the 'Change Requirement' section (High-Level Summary + Acceptance Criteria), and then "
+            "continues with Change Summary by File, Review Table, and Overall Verdict. "
+            "Resolve conflicts by preferring well-justified, concrete issues and precise recommendations. "
+            "Be concise, remove duplicates, and ensure the final output is internally consistent and complete."
+        )
+    if compact:
+        synth_user += (
+            " Each model review is compact JSON: optional summary and verdict, and findings as rows "
+            "[file, line, severity, category, observation, recommendation]."
+        )
 
-    completion = client.chat.completions.create(
-        extra_headers={"x-correlation-id": (cfg.get("correlation_id") or "pr-review-ui")},
-        model=base_model,
-        messages=[
-            {"role": "system", "content": system},
-            {"role": "user", "content": user_template},
-            {"role": "user", "content": format_hint},
-            {"role": "user", "content": synth_user},
-            {"role": "user", "content": "\n\n".join(sources) if sources else "No sources available."},
-        ],
-        stream=False,
-        temperature=0.2,
-    )
+    messages = prompts.prefix_messages() + [{"role": "user", "content": synth_user}]
+    if previous:
+        messages.append({"role": "user", "content": f"### Synthesized review so far\n{previous}"})
+    messages.append({"role": "user", "content": "\n\n".join(sources) if sources else "No sources available."})
+    with TRACER.span("review.synthesize", model=base_model, sources=len(sources), update=bool(previous)), \
+            usage_part("synthesize"):
+        completion = create_chat_completion(cfg, client, base_model, messages, deadline=deadline, prefix_len=2)
     return completion.choices[0].message.content
+
+
+# ---------------------------- Pipelined synthesis ----------------------------
+class SynthesisStage:
+    """
+    Base-model synthesis that overlaps with the ensemble instead of running after it. The first call
+    starts as soon as `after_k` model reviews are in; reviews that arrive while a call runs are folded
+    into the next, short update call (previous synthesis + new reviews only), so once the last model
+    returns only a small delta is left:
+
+        stage = SynthesisStage(cfg, base_model, after_k=2, deadline=review_deadline)
+        stage.add(model, compact_review(review))    # as each model finishes (any thread)
+        stage.close()                                # no more reviews coming
+        text = stage.result(timeout)                 # None when no review was added
+
+    Created in the review's context (trace span, usage ledger), which its worker thread inherits.
+    A failed call does not end the stage: the previous synthesis is kept, the failure is appended to
+    `error`, and that call's reviews are retried with the next arrivals (and once more at close).
+    `result()` is None when no call succeeded; `missing` lists reviews never folded in.
+    """
+
+    def __init__(self, cfg: dict, base_model: str, after_k: int = 2, deadline: float | None = None):
+        self.cfg = cfg
+        self.base_model = base_model
+        self.after_k = max(1, int(after_k))
+        self.deadline = deadline
+        self.rounds = 0
+        self.sources: list[str] = []
+        self.missing: list[str] = []
+        self.error: str | None = None
+        self._cond = threading.Condition()
+        self._pending: dict[str, str] = {}
+        self._closed = False
+        self._done: Future = Future()
+        threading.Thread(target=TRACER.bind(self._run), daemon=True, name="synthesis").start()
+
+    def add(self, model: str, review_text: str):
+        with self._cond:
+            self._pending[model] = review_text
+            self._cond.notify()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+
+    def result(self, timeout: float | None = None) -> str | None:
+        return self._done.result(timeout)
+
+    def _run(self):
+        text = None
+        failed: dict[str, str] = {}
+        errors: list[str] = []
+        retried = False
+        try:
+            with self._cond:
+                self._cond.wait_for(lambda: len(self._pending) >= self.after_k or self._closed)
+            while True:
+                with self._cond:
+                    self._cond.wait_for(lambda: self._pending or self._closed)
+                    if not self._pending:
+                        if not failed or retried:
+                            break
+                        retried = True  # closed: one last attempt for reviews whose call failed
+                    batch, self._pending = {**failed, **self._pending}, {}
+                try:
+                    text = synthesize_with_base(self.cfg, self.base_model, batch, previous=text,
+                                                compact=True, deadline=self.deadline)
+                except Exception as e:
+                    failed = batch
+                    errors.append(f"{'update' if text else 'synthesis'} with {', '.join(batch)} failed: {e}")
+                    self.error = "; ".join(errors)
+                    continue
+                failed = {}
+                self.rounds += 1
+                self.sources.extend(batch)
+            self.missing = list(failed)
+            self._done.set_result(text)
+        except Exception as e:
+            self._done.set_exception(e)
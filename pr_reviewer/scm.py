@@ -0,0 +1,301 @@
+# scm.py
+"""
+Source-control provider abstraction. The UI and the file-history tab go through
+get_provider(cfg) instead of calling GitHub helpers directly, so the pipeline can run against:
+  github : the GitHub REST/GraphQL helpers (and the optional local git mirror)      [default]
+  record : github, with every answer also written to the fixture file cfg["scm_fixtures"]
+  replay : answers served from that fixture file only; no network and no token needed
+"""
+import os
+import abc
+import json
+import time
+import atexit
+import threading
+
+from .storage import STORE_DIR
+
+
+class SCMProvider(abc.ABC):
+    """Interface; every method returns the same shapes as the GitHub helpers."""
+
+    name = "base"
+    cacheable = True  # results may be kept in the on-disk caches keyed by host/owner/repo
+
+    @abc.abstractmethod
+    def list_repos(self, host: str, owner: str) -> list[str]:
+        ...
+
+    @abc.abstractmethod
+    def list_prs(self, host: str, owner: str, repo: str) -> list[dict]:
+        ...
+
+    @abc.abstractmethod
+    def get_pr_diff(self, pr_url: str) -> str:
+        ...
+
+    @abc.abstractmethod
+    def get_pr_meta(self, pr_url: str) -> dict:
+        ...
+
+    @abc.abstractmethod
+    def get_file_history(self, file_url: str, max_commits: int | None = None,
+                         follow_renames: bool | None = None) -> tuple[list[dict], dict]:
+        ...
+
+    @abc.abstractmethod
+    def get_commit_patch(self, host: str, owner: str, repo: str, sha: str, file_path: str) -> tuple[str, list]:
+        ...
+
+    @abc.abstractmethod
+    def post_review(self, pr_url: str, payload: dict) -> dict:
+        """Creates one pull request review (body + inline comments); returns the API's review object."""
+        ...
+
+    def flush(self):
+        """Persists anything buffered (recorded fixtures); a no-op for most providers."""
+
+
+# ---------------------------- GitHub ----------------------------
+REPO_CACHE_DIR = os.path.join(STORE_DIR, "repo_cache")
+
+
+def load_cached_repo_names(owner: str) -> list[str]:
+    """Last repo list fetched for `owner` (older caches hold full repo objects)."""
+    try:
+        with open(os.path.join(REPO_CACHE_DIR, f"{owner}_repos.json"), "r", encoding="utf-8") as f:
+            cached = json.load(f) or []
+    except Exception:
+        return []
+    names = {r.get("name", "") if isinstance(r, dict) else str(r) for r in cached}
+    return sorted(names - {""}, key=str.lower)
+
+
+class GitHubProvider(SCMProvider):
+    name = "github"
+
+    def __init__(self, cfg: dict):
+        self.cfg = cfg
+
+    def list_repos(self, host: str, owner: str) -> list[str]:
+        """Repo names for `owner`; the last good answer is kept so the list still loads when GitHub is unreachable."""
+        from .github_api import fetch_all_repos_for_owner
+        cache_file = os.path.join(REPO_CACHE_DIR, f"{owner}_repos.json")
+        try:
+            names = fetch_all_repos_for_owner(self.cfg, host, owner)
+        except Exception as e:
+            names, err = [], e
+        else:
+            err = None
+        if names:
+            try:
+                os.makedirs(REPO_CACHE_DIR, exist_ok=True)
+                with open(cache_file, "w", encoding="utf-8") as f:
+                    json.dump(names, f, indent=2)
+            except Exception:
+                pass
+            return names
+        cached = load_cached_repo_names(owner)
+        if cached:
+            return cached
+        if err is not None:
+            raise err
+        raise RuntimeError(f"Owner not found or no accessible repos for: {owner}")
+
+    def list_prs(self, host, owner, repo):
+        from .github_api import fetch_all_prs
+        return fetch_all_prs(self.cfg, host, owner, repo)
+
+    def get_pr_diff(self, pr_url):
+        from .github_api import fetch_pr_diff
+        return fetch_pr_diff(self.cfg, pr_url)
+
+    def get_pr_meta(self, pr_url):
+        from .github_api import fetch_pr_meta
+        return fetch_pr_meta(self.cfg, pr_url)
+
+    def get_file_history(self, file_url, max_commits=None, follow_renames=None):
+        from .file_history_tab import fetch_file_commit_history
+        return fetch_file_commit_history(self.cfg, file_url, max_commits=max_commits, follow_renames=follow_renames)
+
+    def get_commit_patch(self, host, owner, repo, sha, file_path):
+        from .file_history_tab import fetch_commit_patch_for_file
+        return fetch_commit_patch_for_file(self.cfg, host, owner, repo, sha, file_path)
+
+    def post_review(self, pr_url, payload):
+        from .github_api import post_pr_review
+        return post_pr_review(self.cfg, pr_url, payload)
+
+
+# ---------------------------- Fixtures: record / replay ----------------------------
+def _fixture_key(*parts) -> str:
+    return "|".join(str(p) for p in parts)
+
+
+class ReplayProvider(SCMProvider):
+    """
+    Serves recorded answers from a fixture JSON file:
+      {"<method>": {"<key>": <result>}, "latency_ms": {"<method>": <ms>}}
+    Keys are the call arguments joined with "|" (see _fixture_key). The optional per-method latency
+    is slept before answering, to load-test the pipeline with realistic GitHub timings.
+    Unknown keys raise RuntimeError, like a 404 from the API. Posted reviews are kept in `posted`.
+    """
+
+    name = "replay"
+    cacheable = False
+
+    def __init__(self, path: str):
+        self.path = path
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                self.fixtures = json.load(f) or {}
+        except FileNotFoundError:
+            raise RuntimeError(f"SCM fixture file not found: {path}")
+        self.posted: list[dict] = []
+
+    def _answer(self, method: str, *key):
+        delay = float((self.fixtures.get("latency_ms") or {}).get(method) or 0)
+        if delay:
+            time.sleep(delay / 1000.0)
+        table = self.fixtures.get(method) or {}
+        k = _fixture_key(*key)
+        if k not in table:
+            raise RuntimeError(f"No recorded {method} for {k} in {self.path}")
+        return table[k]
+
+    def list_repos(self, host, owner):
+        return self._answer("list_repos", host, owner)
+
+    def list_prs(self, host, owner, repo):
+        return self._answer("list_prs", host, owner, repo)
+
+    def get_pr_diff(self, pr_url):
+        return self._answer("get_pr_diff", pr_url)
+
+    def get_pr_meta(self, pr_url):
+        return self._answer("get_pr_meta", pr_url)
+
+    def get_file_history(self, file_url, max_commits=None, follow_renames=None):
+        commits, meta = self._answer("get_file_history", file_url, max_commits, follow_renames)
+        return commits, meta
+
+    def get_commit_patch(self, host, owner, repo, sha, file_path):
+        patch, others = self._answer("get_commit_patch", host, owner, repo, sha, file_path)
+        return patch, others
+
+    def post_review(self, pr_url, payload):
+        self.posted.append({"pr_url": pr_url, "review": payload})
+        return {"id": len(self.posted), "html_url": ""}
+
+
+class _Recording:
+    """Fixture buffer for one file, shared by every RecordingProvider that writes to it."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._dirty = False
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                self.fixtures = json.load(f) or {}
+        except Exception:
+            self.fixtures = {}
+
+    def add(self, method: str, key: tuple, result):
+        with self._lock:
+            self.fixtures.setdefault(method, {})[_fixture_key(*key)] = result
+            self._dirty = True
+
+    def flush(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                tmp = self.path + ".tmp"
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump(self.fixtures, f, ensure_ascii=False)
+                os.replace(tmp, self.path)
+                self._dirty = False
+            except Exception as e:
+                print(f"[WARN] Could not record SCM fixtures: {e}")
+
+
+class RecordingProvider(SCMProvider):
+    """
+    Wraps a provider and records every answer for ReplayProvider. Answers are buffered in the
+    file's shared _Recording and written on flush() (end of each review, and at exit), not once
+    per call. Never cacheable: a call served from the on-disk caches would be missing from the fixtures.
+    """
+
+    name = "record"
+    cacheable = False
+
+    def __init__(self, inner: SCMProvider, recording: _Recording):
+        self.inner = inner
+        self.recording = recording
+
+    def _record(self, method: str, key: tuple, result):
+        self.recording.add(method, key, result)
+        return result
+
+    def flush(self):
+        self.recording.flush()
+
+    def list_repos(self, host, owner):
+        return self._record("list_repos", (host, owner), self.inner.list_repos(host, owner))
+
+    def list_prs(self, host, owner, repo):
+        return self._record("list_prs", (host, owner, repo), self.inner.list_prs(host, owner, repo))
+
+    def get_pr_diff(self, pr_url):
+        return self._record("get_pr_diff", (pr_url,), self.inner.get_pr_diff(pr_url))
+
+    def get_pr_meta(self, pr_url):
+        return self._record("get_pr_meta", (pr_url,), self.inner.get_pr_meta(pr_url))
+
+    def get_file_history(self, file_url, max_commits=None, follow_renames=None):
+        commits, meta = self.inner.get_file_history(file_url, max_commits, follow_renames)
+        self._record("get_file_history", (file_url, max_commits, follow_renames), [commits, meta])
+        return commits, meta
+
+    def get_commit_patch(self, host, owner, repo, sha, file_path):
+        patch, others = self.inner.get_commit_patch(host, owner, repo, sha, file_path)
+        self._record("get_commit_patch", (host, owner, repo, sha, file_path), [patch, others])
+        return patch, others
+
+    def post_review(self, pr_url, payload):
+        return self.inner.post_review(pr_url, payload)  # writes are not fixtures
+
+
+# ---------------------------- Selection ----------------------------
+_REPLAY_CACHE: dict[str, ReplayProvider] = {}
+_RECORD_CACHE: dict[str, _Recording] = {}
+_RECORD_LOCK = threading.Lock()
+
+
+@atexit.register
+def _flush_recordings():
+    for rec in list(_RECORD_CACHE.values()):
+        rec.flush()
+
+
+def get_provider(cfg: dict) -> SCMProvider:
+    """Provider for cfg["scm_provider"] ("github", "record" or "replay"; fixtures in cfg["scm_fixtures"])."""
+    kind = (cfg.get("scm_provider") or "github").lower().strip()
+    if kind == "github":
+        return GitHubProvider(cfg)
+    path = (cfg.get("scm_fixtures") or "").strip()
+    if not path:
+        raise RuntimeError(f"scm_provider '{kind}' needs a fixture file (scm_fixtures).")
+    if kind == "replay":
+        if path not in _REPLAY_CACHE:
+            _REPLAY_CACHE[path] = ReplayProvider(path)
+        return _REPLAY_CACHE[path]
+    if kind == "record":
+        with _RECORD_LOCK:
+            rec = _RECORD_CACHE.get(path)
+            if rec is None:
+                rec = _RECORD_CACHE[path] = _Recording(path)
+        return RecordingProvider(GitHubProvider(cfg), rec)  # per call: each review keeps its own cfg
+    raise RuntimeError(f"Unknown scm_provider: {kind}")
@@ -1,9 +1,11 @@
 
 import os
 import json
+import threading
 
 STORE_DIR = os.path.join(os.getcwd(), "pr-code-review")
 INDEX_PATH = os.path.join(STORE_DIR, "index.json")
+_INDEX_LOCK = threading.Lock()
 
 def ensure_store_dir():
     os.makedirs(STORE_DIR, exist_ok=True)
@@ -23,3 +25,10 @@ def save_index(index_obj):
     ensure_store_dir()
     with open(INDEX_PATH, "w", encoding="utf-8") as f:
         json.dump(index_obj, f, ensure_ascii=False, indent=2)
+
+def append_index_item(item):
+    """Load + append + save under a lock, for reviews finishing concurrently (webhook workers)."""
+    with _INDEX_LOCK:
+        idx = load_index()
+        idx.setdefault("items", []).append(item)
+        save_index(idx)
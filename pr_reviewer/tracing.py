@@ -0,0 +1,247 @@
+# tracing.py
+"""
+Lightweight span tracing for reviews, exported in the OpenTelemetry OTLP/JSON layout so the files
+load into any OTel-aware viewer (Jaeger, otel-desktop-viewer, ...) without an SDK dependency.
+
+    with TRACER.trace("review", pr_url=url) as root:      # starts a trace
+        with TRACER.span("github.pr_diff") as sp:          # child of the current span
+            sp.set(bytes=len(diff))
+
+Spans only record inside an active trace; elsewhere span() is a no-op, so library code can be
+instrumented unconditionally. The current span lives in a contextvar: work handed to a thread pool
+keeps its parent when submitted through TRACER.bind(fn).
+"""
+import os
+import json
+import time
+import secrets
+import functools
+import threading
+import contextvars
+from collections import deque
+from html import escape as _esc
+
+from .storage import STORE_DIR
+
+TRACE_DIR = os.path.join(STORE_DIR, "traces")
+
+_current: contextvars.ContextVar = contextvars.ContextVar("pr_reviewer_span", default=None)
+
+
+class Span:
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "start_ns", "end_ns", "attributes",
+                 "status", "error", "links", "_token")
+
+    def __init__(self, name: str, trace_id: str, parent_id: str | None, attributes: dict, links=()):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = {k: v for k, v in attributes.items() if v is not None}
+        self.status = "OK"
+        self.error = ""
+        self.links = [(s.trace_id, s.span_id) for s in links if s]  # related spans, possibly in other traces
+        self._token = None
+
+    def set(self, **attrs):
+        for k, v in attrs.items():
+            if v is not None:
+                self.attributes[k] = v
+        return self
+
+    def add(self, key: str, amount=1):
+        self.attributes[key] = self.attributes.get(key, 0) + amount
+        return self
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+    def __bool__(self):
+        return True
+
+
+class _NullSpan:
+    """Stand-in outside a trace: accepts the Span API and records nothing."""
+
+    def set(self, **attrs):
+        return self
+
+    def add(self, key, amount=1):
+        return self
+
+    def __bool__(self):
+        return False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_SPAN = _NullSpan()
+
+
+class _SpanContext:
+    def __init__(self, tracer, name: str, attrs: dict, new_trace: bool, links=()):
+        self.tracer, self.name, self.attrs, self.new_trace, self.links = tracer, name, attrs, new_trace, links
+        self.span = None
+
+    def __enter__(self):
+        parent = _current.get()
+        if self.new_trace:
+            trace_id, parent_id = secrets.token_hex(16), None
+        elif parent is None:
+            return NULL_SPAN
+        else:
+            trace_id, parent_id = parent.trace_id, parent.span_id
+        self.span = Span(self.name, trace_id, parent_id, self.attrs, self.links)
+        self.span._token = _current.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        sp = self.span
+        if sp is None:
+            return False
+        sp.end_ns = time.time_ns()
+        if exc is not None:
+            sp.status, sp.error = "ERROR", f"{exc_type.__name__}: {exc}"[:500]
+        _current.reset(sp._token)
+        self.tracer._finish(sp)
+        return False
+
+
+class Tracer:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._spans: dict[str, list[Span]] = {}  # trace_id -> finished spans
+        self._closed: deque = deque(maxlen=256)  # popped traces; late spans (stragglers) are dropped
+
+    def trace(self, name: str, **attrs) -> _SpanContext:
+        """Root span of a new trace (one per review)."""
+        return _SpanContext(self, name, attrs, new_trace=True)
+
+    def span(self, name: str, links=(), **attrs) -> _SpanContext:
+        """Child of the current span; `links` are related spans (e.g. the requests a shared call serves)."""
+        return _SpanContext(self, name, attrs, new_trace=False, links=links)
+
+    @staticmethod
+    def current():
+        return _current.get() or NULL_SPAN
+
+    @staticmethod
+    def bind(fn):
+        """fn wrapped to run in a copy of the caller's context (keeps the parent span across threads)."""
+        ctx = contextvars.copy_context()
+        return lambda *a, **kw: ctx.run(fn, *a, **kw)
+
+    def _finish(self, sp: Span):
+        with self._lock:
+            if sp.trace_id not in self._closed:
+                self._spans.setdefault(sp.trace_id, []).append(sp)
+
+    def spans(self, trace_id: str) -> list[Span]:
+        with self._lock:
+            return sorted(self._spans.get(trace_id, []), key=lambda s: s.start_ns)
+
+    def pop(self, trace_id: str) -> list[Span]:
+        with self._lock:
+            self._closed.append(trace_id)
+            return sorted(self._spans.pop(trace_id, []), key=lambda s: s.start_ns)
+
+
+TRACER = Tracer()
+
+
+def traced(name: str):
+    """Decorator: runs the function inside TRACER.span(name); the body can add attributes via TRACER.current()."""
+    def wrap(fn):
+        @functools.wraps(fn)
+        def inner(*args, **kwargs):
+            with TRACER.span(name):
+                return fn(*args, **kwargs)
+        return inner
+    return wrap
+
+
+# ---------------------------- Export ----------------------------
+def _otlp_value(v) -> dict:
+    if isinstance(v, bool):
+        return {"boolValue": v}
+    if isinstance(v, int):
+        return {"intValue": str(v)}
+    if isinstance(v, float):
+        return {"doubleValue": v}
+    if isinstance(v, (list, tuple)):
+        return {"arrayValue": {"values": [_otlp_value(x) for x in v]}}
+    return {"stringValue": str(v)}
+
+
+def to_otlp_json(spans: list[Span], service_name: str = "pr-reviewer") -> dict:
+    return {"resourceSpans": [{
+        "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": service_name}}]},
+        "scopeSpans": [{
+            "scope": {"name": "pr_reviewer.tracing"},
+            "spans": [{
+                "traceId": s.trace_id,
+                "spanId": s.span_id,
+                **({"parentSpanId": s.parent_id} if s.parent_id else {}),
+                "name": s.name,
+                "kind": 1,  # SPAN_KIND_INTERNAL
+                "startTimeUnixNano": str(s.start_ns),
+                "endTimeUnixNano": str(s.end_ns or s.start_ns),
+                "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in s.attributes.items()],
+                **({"links": [{"traceId": t, "spanId": i} for t, i in s.links]} if s.links else {}),
+                "status": {"code": 2, "message": s.error} if s.status == "ERROR" else {"code": 1},
+            } for s in spans],
+        }],
+    }]}
+
+
+def export_trace(spans: list[Span], path: str | None = None) -> str | None:
+    """Writes spans as OTLP/JSON (default TRACE_DIR/<trace_id>.json); returns the path."""
+    if not spans:
+        return None
+    path = path or os.path.join(TRACE_DIR, f"{spans[0].trace_id}.json")
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(to_otlp_json(spans), f, ensure_ascii=False)
+        return path
+    except Exception as e:
+        print(f"[WARN] Could not export trace: {e}")
+        return None
+
+
+def timing_table_html(spans: list[Span]) -> str:
+    """Per-review timing table (span tree in start order, indented by depth) for the HTML report."""
+    if not spans:
+        return ""
+    by_id = {s.span_id: s for s in spans}
+    t0 = min(s.start_ns for s in spans)
+
+    def depth(s):
+        d, p = 0, s.parent_id
+        while p in by_id and d < 20:
+            d, p = d + 1, by_id[p].parent_id
+        return d
+
+    rows = []
+    for s in spans:
+        attrs = ", ".join(f"{k}={v}" for k, v in s.attributes.items())
+        status = "" if s.status == "OK" else f"<span style='color:#b91c1c;'>{_esc(s.error)}</span>"
+        rows.append(
+            "<tr>"
+            f"<td style='padding-left:{8 + 16 * depth(s)}px;'>{_esc(s.name)}</td>"
+            f"<td style='text-align:right;'>{(s.start_ns - t0) / 1e6:,.0f}</td>"
+            f"<td style='text-align:right;'>{s.duration_ms:,.0f}</td>"
+            f"<td>{_esc(attrs)}</td><td>{status}</td>"
+            "</tr>"
+        )
+    return (
+        "<table class='index-table'><thead><tr><th>Stage</th><th>Start (ms)</th><th>Duration (ms)</th>"
+        "<th>Attributes</th><th>Error</th></tr></thead><tbody>" + "".join(rows) + "</tbody></table>"
+    )
@@ -1,8 +1,5 @@
 # app.py
-import json
 import os
-import re
-import uuid
 import datetime
 import webbrowser
 import urllib.parse
@@ -11,98 +8,28 @@ from tkinter import Tk, StringVar, BOTH, LEFT, RIGHT, X, TOP, BOTTOM, NSEW, mess
 from tkinter import ttk
 from tkinter import filedialog
 from dotenv import load_dotenv
-import requests
-import certifi
 
 from .config import (
     DEFAULT_CONFIG, config_path_for_correlation, load_last_config_path,
     save_last_config_path, load_config, save_config,
 )
-from .storage import STORE_DIR, ensure_store_dir, load_index, save_index
+from .storage import ensure_store_dir, load_index, save_index
 from .tls import patch_certifi_with_pki_zip
-from .github_api import parse_pr_url, fetch_pr_meta, fetch_pr_diff_filtered, fetch_all_prs
-from .review_engine import single_model_review
+from .scm import get_provider, load_cached_repo_names
+from .model_health import HEALTH
+from .usage import usage_by_repo
+from .metrics import start_metrics_server
 from .html_utils import wrap_fragment_as_full_html, human_repo
+from .report import (
+    sanitize_model_anchor, strip_code_fences, markdown_to_html_light, force_headings_blue,
+    ensure_bordered_tables, normalize_model_html, save_error_log, wrap_full_report, safe_base_filename,
+)
+from .pipeline import run_review
 from .model_registry import MODEL_REGISTRY
 from .file_history_tab import FileHistoryTab
 from typing import Optional
 
 
-# ---------------------- Helpers: GitHub repos for owner ----------------------
-def github_api_base_from_host(host: str) -> str:
-    return "https://api.github.com" if host.lower() == "github.com" else f"https://{host}/api/v3"
-
-
-
-def fetch_all_repos_for_owner(cfg: dict, host: str, owner: str):
-    import json
-    token = (cfg.get("github_token") or "").strip()
-    if not token:
-        raise RuntimeError("Missing GitHub PAT in Configuration.")
-
-    api_base = github_api_base_from_host(host)
-    headers = {
-        "Authorization": f"Bearer {token}",
-        "Accept": "application/vnd.github+json",
-        "User-Agent": "pr-reviewer-ui",
-    }
-
-    def paged(url_base):
-        out, page, per_page = [], 1, 100
-        while True:
-            url = f"{url_base}?per_page={per_page}&page={page}"
-            r = requests.get(url, headers=headers, verify=certifi.where(), timeout=60)
-            if r.status_code == 404:
-                return None
-            if not r.ok:
-                raise RuntimeError(f"Failed to fetch repos: {r.status_code} {r.text}")
-            batch = r.json() or []
-            if not batch:
-                break
-            out.extend(batch)
-            if len(batch) < per_page:
-                break
-            page += 1
-        return out
-
-    # Define cache file path
-    cache_file = os.path.join(STORE_DIR, "repo_cache", f"{owner}_repos.json")
-
-    # Try loading from cache
-    if os.path.exists(cache_file):
-        try:
-            with open(cache_file, "r", encoding="utf-8") as f:
-                cached = json.load(f)
-            if isinstance(cached, list):
-                cached_names = sorted({r.get("name", "") for r in cached if r.get("name")}, key=str.lower)
-            else:
-                cached_names = []
-        except Exception:
-            cached_names = []
-    else:
-        cached_names = []
-
-    # Fetch fresh data
-    repos = paged(f"{api_base}/user/repos") or []
-    org_repos = paged(f"{api_base}/orgs/{owner}/repos") or []
-    repos.extend(org_repos)
-
-    if not repos:
-        if cached_names:
-            return cached_names
-        raise RuntimeError(f"Owner not found or no accessible repos for: {owner}")
-
-    # Update cache
-    try:
-        with open(cache_file, "w", encoding="utf-8") as f:
-            json.dump(repos, f, indent=2)
-    except Exception:
-        pass
-
-    return sorted({r.get("name", "") for r in repos if r.get("name")}, key=str.lower)
-
-
-
 # ---------------------- UI: Autocomplete Combobox for repos ----------------------
 class AutoCompleteCombobox(ttk.Combobox):
     def __init__(self, master=None, **kwargs):
@@ -150,6 +77,7 @@ class App(Tk):
             save_last_config_path(self.config_path)
 
         ensure_store_dir()
+        start_metrics_server(self.cfg)  # no-op unless metrics_port is set
 
         # state used across tabs
         self.last_host = "github.com"
@@ -273,6 +201,12 @@ class App(Tk):
         grid.grid_columnconfigure(0, weight=1)
         grid.grid_columnconfigure(1, weight=1)
 
+        # Optional local git mirror for diffs / file history (see git_mirror.py)
+        self.git_mirror_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(
+            settings, text="Serve diffs & file history from a local git mirror", variable=self.git_mirror_var
+        ).pack(side=LEFT, padx=6, pady=(0, 6))
+
         # Models (no default selection)
         lf = ttk.LabelFrame(self.tab_config, text="Models (run in parallel). Select 1+ to enable.")
         lf.pack(side=TOP, fill=X, padx=10, pady=(0, 6))
@@ -290,6 +224,37 @@ class App(Tk):
             inner.grid_columnconfigure(c, weight=1)
         self.parallel_var = tk.BooleanVar(value=True)
         ttk.Checkbutton(lf, text="Run selected models in parallel", variable=self.parallel_var).pack(side=LEFT, padx=8)
+        self.routing_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(lf, text="Adaptive routing by chunk size", variable=self.routing_var).pack(side=LEFT, padx=8)
+        self.synthesis_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(lf, text="Consensus synthesis (base model)", variable=self.synthesis_var).pack(side=LEFT, padx=8)
+        # html / markdown, or json = structured findings rendered to HTML (findings.py)
+        ttk.Label(lf, text="Output:").pack(side=LEFT, padx=(8, 2))
+        self.output_format_var = StringVar(value="html")
+        ttk.Combobox(lf, values=["html", "markdown", "json"], textvariable=self.output_format_var,
+                     state="readonly", width=10).pack(side=LEFT, padx=(0, 8))
+        self.publish_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(lf, text="Post review to GitHub (inline comments)", variable=self.publish_var).pack(side=LEFT, padx=8)
+        self.publish_dry_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(lf, text="Dry run (print payload)", variable=self.publish_dry_var).pack(side=LEFT, padx=8)
+
+        # Model health (circuit breaker state, persisted across runs)
+        hf = ttk.LabelFrame(self.tab_config, text="Model Health (gateway circuit breaker)")
+        hf.pack(side=TOP, fill=BOTH, expand=True, padx=10, pady=(0, 6))
+        hbtns = ttk.Frame(hf); hbtns.pack(side=TOP, fill=X, padx=6, pady=(6, 0))
+        ttk.Button(hbtns, text="Refresh", command=self.render_model_health).pack(side=LEFT)
+        ttk.Button(hbtns, text="Reset Selected", command=self.on_reset_model_health).pack(side=LEFT, padx=6)
+        hcols = ("model", "state", "calls", "error_rate", "p50", "p95", "last_error")
+        self.health_tree = ttk.Treeview(hf, columns=hcols, show="headings", height=5)
+        for c, title, width in [
+            ("model", "Model", 230), ("state", "State", 80), ("calls", "Calls", 60),
+            ("error_rate", "Error Rate", 80), ("p50", "p50 (s)", 70), ("p95", "p95 (s)", 70),
+            ("last_error", "Last Error", 420),
+        ]:
+            self.health_tree.heading(c, text=title)
+            self.health_tree.column(c, width=width, anchor="w")
+        self.health_tree.pack(fill=BOTH, expand=True, padx=6, pady=6)
+        self.render_model_health()
 
         # Save/Load
         btns = ttk.Frame(self.tab_config); btns.pack(side=TOP, fill=X, padx=10, pady=10)
@@ -310,23 +275,50 @@ class App(Tk):
         for mid, var in self.model_vars.items():
             var.set(mid in selected)
         self.parallel_var.set(bool(self.cfg.get("parallel_models", True)))
+        self.routing_var.set(bool(self.cfg.get("adaptive_routing", False)))
+        self.synthesis_var.set(bool(self.cfg.get("synthesis", False)))
+        self.output_format_var.set((self.cfg.get("output_format") or "html").lower().strip())
+        self.publish_var.set(bool(self.cfg.get("github_review_publish", False)))
+        self.publish_dry_var.set(bool(self.cfg.get("github_review_dry_run", False)))
+        self.git_mirror_var.set(bool(self.cfg.get("git_mirror", False)))
         try:
             host = self.host_var.get().strip()
             owner = self.owner_var.get().strip()
             if owner:
-                cache_file = os.path.join(STORE_DIR, 'repo_cache', f'{owner}_repos.json')
-                if os.path.exists(cache_file):
-                    with open(cache_file, 'r', encoding='utf-8') as f:
-                        cached = json.load(f)
-                    cached_names = sorted([r.get('name', '') for r in cached if r.get('name')], key=str.lower)
+                cached_names = load_cached_repo_names(owner)
+                if cached_names:
                     self.repo_combo.set_completion_list([])
                     self.repo_combo.set_completion_list(cached_names)
         except Exception as e:
             print(f'Error loading cached repos: {e}')
 
+    def render_model_health(self):
+        for iid in self.health_tree.get_children():
+            self.health_tree.delete(iid)
+        for row in HEALTH.snapshot():
+            self.health_tree.insert("", "end", values=(
+                row["model"], row["state"].replace("_", "-").upper(), row["calls"],
+                f"{row['error_rate']:.0%}", f"{row['p50']:.1f}", f"{row['p95']:.1f}", row["last_error"],
+            ))
+
+    def on_reset_model_health(self):
+        sel = self.health_tree.selection()
+        if not sel:
+            messagebox.showinfo("Model Health", "Select a model row to reset.")
+            return
+        for iid in sel:
+            vals = self.health_tree.item(iid).get("values", [])
+            if vals:
+                HEALTH.reset(str(vals[0]))
+        self.render_model_health()
+
     def _collect_selected_models(self):
         return [mid for mid, var in self.model_vars.items() if var.get()]
 
+    def _run_cfg(self, **overrides) -> dict:
+        """Saved settings plus the Configuration toggles that apply without saving (not written back)."""
+        return dict(self.cfg, git_mirror=bool(self.git_mirror_var.get()), **overrides)
+
     def save_settings(self):
         new_corr = (self.v_corr.get() or "").strip() or "default-profile"
         new_config_path = config_path_for_correlation(new_corr)
@@ -346,10 +338,15 @@ class App(Tk):
                 "Dell Technologies Root Certificate Authority 2018.pem",
                 "Dell Technologies Issuing CA 101_new.pem",
             ],
-            "output_format": "html",
+            "output_format": self.output_format_var.get() or "html",
             "model": "llama-3-3-70b-instruct",
             "selected_models": self._collect_selected_models(),
             "parallel_models": bool(self.parallel_var.get()),
+            "adaptive_routing": bool(self.routing_var.get()),
+            "synthesis": bool(self.synthesis_var.get()),
+            "github_review_publish": bool(self.publish_var.get()),
+            "github_review_dry_run": bool(self.publish_dry_var.get()),
+            "git_mirror": bool(self.git_mirror_var.get()),
             "host":self.v_host.get().strip(),
             "org":self.v_org.get().strip()
         })
@@ -457,11 +454,8 @@ class App(Tk):
             host = self.host_var.get().strip()
             owner = self.owner_var.get().strip()
             if owner:
-                cache_file = os.path.join(STORE_DIR, 'repo_cache', f'{owner}_repos.json')
-                if os.path.exists(cache_file):
-                    with open(cache_file, 'r', encoding='utf-8') as f:
-                        cached = json.load(f)
-                    cached_names = sorted([r.get('name', '') for r in cached if r.get('name')], key=str.lower)
+                cached_names = load_cached_repo_names(owner)
+                if cached_names:
                     self.repo_combo.set_completion_list([])
                     self.repo_combo.set_completion_list(cached_names)
         except Exception as e:
@@ -502,7 +496,7 @@ class App(Tk):
                 return
 
             self._busy_start("Working… Fetching repositories")
-            repos = fetch_all_repos_for_owner(self.cfg, host, owner)  # uses the function above
+            repos = get_provider(self.cfg).list_repos(host, owner)
             self.repo_combo.set_completion_list([])
             self.repo_combo.set_completion_list(repos)  # your AutoCompleteCombobox
             self._busy_stop(f"Loaded {len(repos)} repos for {owner}")
@@ -525,7 +519,7 @@ class App(Tk):
                 self._busy_stop("Error")
                 messagebox.showerror("Pull Requests", "Please provide Owner and Repo (or select from dropdown).")
                 return
-            items = fetch_all_prs(self.cfg, host, owner, repo)
+            items = get_provider(self.cfg).list_prs(host, owner, repo)
             self.closed_pr_items = items
             self.render_closed_prs(items)
             self.last_host, self.last_owner, self.last_repo = host, owner, repo
@@ -576,6 +570,10 @@ class App(Tk):
     def _build_tab_history(self):
         outer = ttk.LabelFrame(self.tab_history, text="Code Review History")
         outer.pack(side=TOP, fill=BOTH, expand=True, padx=10, pady=6)
+        # Token / cost totals per repo, summed from the index
+        self.repo_usage_var = StringVar(value="")
+        ttk.Label(outer, textvariable=self.repo_usage_var, style="Cell.TLabel", wraplength=1100,
+                  justify="left").pack(side=TOP, fill=X, padx=6, pady=(4, 2))
         container = ttk.Frame(outer); container.pack(fill=BOTH, expand=True)
         self.canvas_hist = tk.Canvas(container, borderwidth=0, highlightthickness=0)
         self.table_frame = ttk.Frame(self.canvas_hist)
@@ -585,7 +583,7 @@ class App(Tk):
         self.canvas_hist.pack(side=LEFT, fill=BOTH, expand=True)
         self.canvas_hist.create_window((0, 0), window=self.table_frame, anchor="nw")
         self.table_frame.bind("<Configure>", lambda e: self.canvas_hist.configure(scrollregion=self.canvas_hist.bbox("all")))
-        headers = ["Repo Name", "PR Number", "Review Comments", "Author", "Delete"]
+        headers = ["Repo Name", "PR Number", "Review Comments", "Author", "Tokens", "Est. cost", "Delete"]
         for c, h in enumerate(headers):
             lbl = ttk.Label(self.table_frame, text=h, style="Header.TLabel")
             lbl.grid(row=0, column=c, sticky=NSEW, padx=4, pady=6)
@@ -606,10 +604,18 @@ class App(Tk):
         self.clear_table_rows()
         idx = load_index()
         items = sorted(idx.get("items", []), key=lambda x: x.get("timestamp", ""), reverse=True)
+        per_repo = usage_by_repo(items)
+        self.repo_usage_var.set(
+            "Usage by repo: " + "; ".join(
+                f"{human_repo(*k.split('/', 1))}: {r['total_tokens']:,} tokens, est. cost {r['cost']:,.2f} "
+                f"({r['reviews']} review{'s' if r['reviews'] != 1 else ''})"
+                for k, r in sorted(per_repo.items(), key=lambda kv: -kv[1]["cost"])
+            ) if per_repo else ""
+        )
         if not items:
             lbl = ttk.Label(self.table_frame, text="No reviews yet. Use the 'Pull Requests' tab to submit a PR.",
                             style="Cell.TLabel")
-            lbl.grid(row=1, column=0, columnspan=5, sticky="w", padx=6, pady=8)
+            lbl.grid(row=1, column=0, columnspan=7, sticky="w", padx=6, pady=8)
             return
         for r, it in enumerate(items, start=1):
             pr_url = it.get("pr_url", "")
@@ -636,8 +642,15 @@ class App(Tk):
 
             auth_lbl = ttk.Label(self.table_frame, text=author, style="Cell.TLabel")
             auth_lbl.grid(row=r, column=3, sticky="w", padx=6, pady=4)
+
+            usage = it.get("usage") or {}
+            tok_lbl = ttk.Label(self.table_frame, text=f"{usage['total_tokens']:,}" if usage else "-", style="Cell.TLabel")
+            tok_lbl.grid(row=r, column=4, sticky="w", padx=6, pady=4)
+            cost_lbl = ttk.Label(self.table_frame, text=f"{usage.get('cost', 0):,.3f}" if usage else "-", style="Cell.TLabel")
+            cost_lbl.grid(row=r, column=5, sticky="w", padx=6, pady=4)
+
             del_btn = ttk.Button(self.table_frame, text="Delete", command=lambda eid=entry_id: self.delete_entry(eid, quick=True))
-            del_btn.grid(row=r, column=4, sticky="w", padx=6, pady=4)
+            del_btn.grid(row=r, column=6, sticky="w", padx=6, pady=4)
 
     # ---------------------- Status Bar ----------------------
     def _build_status(self):
@@ -707,306 +720,36 @@ class App(Tk):
         self.set_status("Entry deleted")
 
     # ---------------------- HTML Normalization & Report ----------------------
+    # Report building lives in report.py (headless, shared with benchmarks); these keep the App API.
     def _sanitize_model_anchor(self, model_name: str) -> str:
-        return "m-" + "".join(ch.lower() if ch.isalnum() else "-" for ch in model_name).strip("-")
+        return sanitize_model_anchor(model_name)
 
     def _now_stamp(self) -> str:
         return datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
 
     def _safe_base_filename(self, owner: str, repo: str, number: int | str, title: str) -> str:
-        raw = f"{owner}-{repo}-PR{number}-{title or ''}"
-        clean = "".join((c if c.isalnum() or c in ("-", "_") else "_") for c in raw)
-        return clean[:180]
+        return safe_base_filename(owner, repo, number, title)
 
     def _strip_code_fences(self, text: str) -> str:
-        if not text:
-            return ""
-        text = re.sub(r"^```[a-zA-Z0-9_-]*\s*", "", text.strip())
-        text = re.sub(r"\s*```$", "", text.strip())
-        return text.strip()
+        return strip_code_fences(text)
 
     def _markdown_to_html_light(self, text: str) -> str:
-        if not text:
-            return ""
-        if "<html" in text.lower() or "<div" in text.lower() or "<table" in text.lower() or "<section" in text.lower():
-            return text
-        text = self._strip_code_fences(text)
-
-        import html as _html
-        import re as _re
-        esc = _html.escape
-        lines = text.splitlines()
-        html_lines = []
-        in_ul = in_ol = in_pre = False
-
-        def close_lists():
-            nonlocal in_ul, in_ol
-            if in_ul:
-                html_lines.append("</ul>"); in_ul = False
-            if in_ol:
-                html_lines.append("</ol>"); in_ol = False
-
-        for raw in lines:
-            line = raw.rstrip("\n")
-
-            m = _re.match(r"^\s{0,3}(#{1,6})\s+(.*)$", line)
-            if m:
-                close_lists()
-                level = len(m.group(1))
-                content = m.group(2).strip()
-                html_lines.append(f"<h{level}>{esc(content)}</h{level}>")
-                continue
-
-            if _re.match(r"^\s*[-*]\s+.+$", line):
-                if not in_ul:
-                    close_lists()
-                    in_ul = True
-                    html_lines.append("<ul>")
-                html_lines.append(f"<li>{esc(line.lstrip(' -*'))}</li>")
-                continue
-
-            if _re.match(r"^\s*\d+\.\s+.+$", line):
-                if not in_ol:
-                    close_lists()
-                    in_ol = True
-                    html_lines.append("<ol>")
-                cleaned_line = esc(_re.sub(r'^\s*\d+\.\s+', '', line))
-                html_lines.append(f"<li>{cleaned_line}</li>")
-
-                continue
-
-            if _re.match(r"^\s{4,}.*$", line):
-                if not in_pre:
-                    close_lists()
-                    in_pre = True
-                    html_lines.append("<pre><code>")
-                html_lines.append(esc(line[4:]))
-                continue
-            else:
-                if in_pre and line.strip() == "":
-                    html_lines.append("")
-                    continue
-                elif in_pre:
-                    html_lines.append("</code></pre>")
-                    in_pre = False
-
-            if line.strip():
-                close_lists()
-                html_lines.append(f"<p>{esc(line.strip())}</p>")
-            else:
-                close_lists()
-                html_lines.append("")
-
-        close_lists()
-        if in_pre:
-            html_lines.append("</code></pre>")
-
-        out = "\n".join(l for l in html_lines if l is not None)
-        return out.strip()
+        return markdown_to_html_light(text)
 
     def _force_headings_blue(self, html_fragment: str) -> str:
-        if not html_fragment:
-            return ""
-        import re as _re
-
-        # Added "Suggested Test Cases" and "Overall Verdict"
-        targets = [
-            "Change Requirement",
-            "Key Points",
-            "Change Summary by File",
-            "Review Table",
-            "Suggested Test Cases",
-            "Overall Verdict",
-        ]
-
-        def repl_heading(m):
-            tag = m.group(1);
-            inner = m.group(2)
-            for t in targets:
-                if inner.strip().lower() == t.lower():
-                    return f"<{tag} style=\"color:#0B63C5;\">{t}</{tag}>"
-            return m.group(0)
-
-        # Color <h1>..</h1> .. <h6>..</h6>
-        html_fragment = _re.sub(
-            r"<(h[1-6])>([^<]+)</\1>",
-            repl_heading,
-            html_fragment,
-            flags=_re.IGNORECASE,
-        )
-
-        # Color <p><strong>...</strong></p> and <p><b>...</b></p> variants
-        for t in targets:
-            html_fragment = html_fragment.replace(
-                f"<p><strong>{t}</strong></p>",
-                f"<p><strong style=\"color:#0B63C5;\">{t}</strong></p>"
-            ).replace(
-                f"<p><b>{t}</b></p>",
-                f"<p><b style=\"color:#0B63C5;\">{t}</b></p>"
-            )
-
-        return html_fragment
+        return force_headings_blue(html_fragment)
 
     def _ensure_bordered_tables(self, html_fragment: str) -> str:
-        if not html_fragment:
-            return ""
-        import re as _re
-
-        def add_table_style(m):
-            tag = m.group(0)
-            if "style=" in tag:
-                return tag
-            return '<table style="border-collapse:collapse;width:100%;border:1px solid #cbd5e1;">'
-
-        html_fragment = _re.sub(r"<table(\s*)>", add_table_style, html_fragment, flags=_re.IGNORECASE)
-        html_fragment = html_fragment.replace("<th", "<th style=\"border:1px solid #cbd5e1;padding:8px;\"")
-        html_fragment = html_fragment.replace("<td", "<td style=\"border:1px solid #cbd5e1;padding:8px;\"")
-        return html_fragment
+        return ensure_bordered_tables(html_fragment)
 
     def _normalize_model_html(self, raw_text: str) -> str:
-        if not raw_text:
-            return ""
-        s = raw_text.strip()
-        s = self._strip_code_fences(s)
-        s = self._markdown_to_html_light(s)
-        s = self._force_headings_blue(s)
-        s = self._ensure_bordered_tables(s)
-        return s
+        return normalize_model_html(raw_text)
 
     def _save_error_log(self, model_errors: dict) -> str | None:
-        if not model_errors:
-            return None
-        import html as _html
-        errdir = os.path.join(STORE_DIR, "errorlog")
-        os.makedirs(errdir, exist_ok=True)
-        ts = self._now_stamp()
-        path = os.path.join(errdir, f"errors-{ts}.html")
-        parts = [
-            "<!doctype html><html><head><meta charset='utf-8'>",
-            "<title>Model Errors</title>",
-            "<style>body{font-family:Inter,Segoe UI,Arial,sans-serif;padding:16px;} h1{color:#b91c1c;} ",
-            "table{border-collapse:collapse;width:100%;} td,th{border:1px solid #ddd;padding:8px;text-align:left;} ",
-            "th{background:#f8f8f8;}</style></head><body>",
-            "<h1>Model Errors</h1>",
-            "<table><thead><tr><th>Model</th><th>Error</th></tr></thead><tbody>",
-        ]
-        for m, e in model_errors.items():
-            parts.append(
-                f"<tr><td>{_html.escape(m)}</td><td><pre style='white-space:pre-wrap;'>{_html.escape(e)}</pre></td></tr>"
-            )
-        parts.append("</tbody></table></body></html>")
-        with open(path, "w", encoding="utf-8") as f:
-            f.write("".join(parts))
-        return path
-
-    def _wrap_full_report(self, title: str, pr_url: str, owner: str, repo: str, number: int | str,
-                          sections: list[tuple[str, str]], failed: dict, error_log_link: str | None) -> str:
-        import html as _html
-        esc = _html.escape
-        css = """
-        :root{--blue:#0B63C5;--red:#b91c1c;--border:#cbd5e1;--muted:#6b7280;}
-        *{box-sizing:border-box;}
-        html,body{max-width:100%;overflow-x:hidden;}
-        body{font-family:Inter,Segoe UI,Arial,sans-serif;margin:0;padding:0;background:#fff;}
-
-        /* Slightly narrower and centered to avoid horizontal scroll on most displays */
-        .container{width:min(92vw,1320px);max-width:none;margin:0;padding:24px;}
-
-        h1{margin:0 0 10px 0;font-size:24px;}
-        h2{margin:20px 0 8px 0;}
-        h3{margin:14px 0 6px 0;}
-        a{color:#0B63C5;text-decoration:none;}
-        a:hover{text-decoration:underline;}
-        .header{border-bottom:1px solid var(--border);padding-bottom:12px;margin-bottom:16px;}
-        .meta{color:var(--muted);font-size:14px;overflow-wrap:anywhere;word-break:break-word;}
-
-        /* Index table */
-        .index-table{width:100%;max-width:100%;border-collapse:collapse;margin:10px 0 20px 0;table-layout:fixed;}
-        .index-table th,.index-table td{
-            border:1px solid var(--border);padding:8px;text-align:left;
-            overflow-wrap:anywhere;word-break:break-word;white-space:normal;
-        }
-        .index-table th{background:#f8f8f8;}
-
-        .model-title{color:var(--red);margin:0;}
-        .back{font-size:13px;margin:2px 0 12px 0;}
-        hr.sep{border:none;border-top:2px solid var(--border);margin:22px 0;}
-
-        /* Any tables inside model sections (e.g., Review Table, Suggested Test Cases) */
-        .model-section table{border-collapse:collapse;width:100%;max-width:100%;table-layout:fixed;}
-        .model-section th,.model-section td{
-            border:1px solid var(--border);padding:8px;text-align:left;
-            overflow-wrap:anywhere;word-break:break-word;white-space:normal;
-        }
-
-        /* Images and pre/code wrap to avoid overflow */
-        img{max-width:100%;height:auto;}
-        pre, code{white-space:pre-wrap;word-wrap:break-word;overflow-wrap:anywhere;}
-        """
-
-        # Build index rows
-        rows = []
-        for model_name, fragment in sections:
-            ok = (fragment.strip() != "")
-            status = "OK" if ok else "Failed"
-            rows.append(
-                f"<tr><td><a href='#{self._sanitize_model_anchor(model_name)}'>{esc(model_name)}</a></td>"
-                f"<td>{status}</td></tr>"
-            )
+        return save_error_log(model_errors)
 
-        parts = []
-        parts.append("<!doctype html><html><head><meta charset='utf-8'>")
-        parts.append(f"<title>{esc(title)}</title>")
-        parts.append(f"<style>{css}</style></head><body>")
-        parts.append("<div class='container'>")
-
-        # Header
-        parts.append("<div class='header'>")
-        parts.append(f"<h1>{esc(title)}</h1>")
-        if pr_url:
-            parts.append(
-                f"<div class='meta'>PR:&nbsp;<a href='{esc(pr_url)}' target='_blank'>{esc(pr_url)}</a></div>"
-            )
-        parts.append(
-            f"<div class='meta'>Repo: {esc(owner)}/{esc(repo)} &nbsp;&nbsp; PR #{esc(str(number))}</div>"
-        )
-        if error_log_link:
-            parts.append(
-                f"<div class='meta'>Errors:&nbsp;<a href='{esc(error_log_link)}' target='_blank'>Open Error Log</a></div>"
-            )
-        parts.append("</div>")
-
-        # Index
-        parts.append("<a id='index'></a>")
-        parts.append("<h2>Index</h2>")
-        parts.append("<table class='index-table'><thead><tr><th>Model</th><th>Status</th></tr></thead><tbody>")
-        parts.extend(rows)
-        parts.append("</tbody></table>")
-
-        # Sections
-        for model_name, fragment in sections:
-            anchor = self._sanitize_model_anchor(model_name)
-            parts.append("<hr class='sep'>")
-            parts.append(f"<div class='model-section'><a id='{anchor}'></a>")
-            parts.append(f"<h2 class='model-title'>{esc(model_name)}</h2>")
-            parts.append("<div class='back'><a href='#index'>Back to Index</a></div>")
-            if fragment.strip():
-                parts.append(fragment)
-            else:
-                parts.append("<p><em>No output (model failed or returned empty).</em></p>")
-            parts.append("</div>")
-
-        # Failed models list
-        if failed:
-            parts.append("<hr class='sep'>")
-            parts.append("<h2>Failed Models</h2>")
-            parts.append("<ul>")
-            for m, err in failed.items():
-                parts.append(f"<li><strong>{esc(m)}</strong> — <span class='meta'>{esc(err)[:400]}</span></li>")
-            parts.append("</ul>")
-
-        parts.append("</div></body></html>")
-        return "".join(parts)
+    def _wrap_full_report(self, *args, **kwargs) -> str:
+        return wrap_full_report(*args, **kwargs)
 
     # ---------------------- Review Action ----------------------
     def on_review(self):
@@ -1023,32 +766,19 @@ class App(Tk):
 
             patch_certifi_with_pki_zip(self.cfg)
 
-            # 1) Diff
+            # 1-6) Diff, meta, models, report, index (pipeline.py)
             self._busy_start("Working… Fetching PR diff")
-            res = fetch_pr_diff_filtered(self.cfg, pr_url)
-            diff, skipped_files = None, []
-            if isinstance(res, tuple):
-                if len(res) >= 1:
-                    diff = res[0]
-                if len(res) >= 2 and isinstance(res[1], (list, tuple)):
-                    skipped_files = list(res[1])
-            else:
-                diff = res
-            if not (diff or "").strip():
-                self._busy_stop("Error")
-                raise RuntimeError(
-                    "No reviewable changes after excluding generated files. "
-                    "Disable 'skip_generated' in Configuration to include them."
-                )
-            if skipped_files:
-                self.set_status(f"Excluded {len(skipped_files)} generated file(s)")
-
-            # 2) PR meta
-            self._busy_step("Working… Fetching PR metadata")
-            meta = fetch_pr_meta(self.cfg, pr_url) or {}
-            pr_title = (meta.get("title") or "").strip() or "Pull Request"
-            author = (((meta.get("user") or {}).get("login", "") or "").strip())
-            host, owner, repo, number = parse_pr_url(pr_url)
+            cfg = self._run_cfg(github_review_publish=bool(self.publish_var.get()),
+                                github_review_dry_run=bool(self.publish_dry_var.get()),
+                                output_format=self.output_format_var.get() or "html",
+                                synthesis=bool(self.synthesis_var.get()))
+            out = run_review(
+                cfg, pr_url, selected_models,
+                parallel=bool(self.parallel_var.get()),
+                routing=bool(self.routing_var.get()),
+                progress=self._busy_step,
+            )
+            host, owner, repo = out["host"], out["owner"], out["repo"]
             self.last_host, self.last_owner, self.last_repo = host, owner, repo
             if not self.owner_var.get():
                 self.owner_var.set(owner)
@@ -1057,92 +787,26 @@ class App(Tk):
             if not self.host_var.get():
                 self.host_var.set(host)
 
-            # 3) Run models
-            self._busy_step("Working… Running selected models")
-            results: dict[str, str] = {}
-            errors: dict[str, str] = {}
-
-            from concurrent.futures import ThreadPoolExecutor, as_completed
-
-            def run_one(mname):
-                try:
-                    out = single_model_review(self.cfg, mname, diff, meta)
-                    return mname, out
-                except Exception as e:
-                    return mname, e
-
-            if bool(self.parallel_var.get()):
-                with ThreadPoolExecutor(max_workers=min(len(selected_models), 8)) as ex:
-                    futs = [ex.submit(run_one, m) for m in selected_models]
-                    for f in as_completed(futs):
-                        mname, res2 = f.result()
-                        if isinstance(res2, Exception):
-                            errors[mname] = str(res2); results[mname] = ""
-                        else:
-                            results[mname] = res2 or ""
-                        self._busy_step()
-            else:
-                for m in selected_models:
-                    mname, res2 = run_one(m)
-                    if isinstance(res2, Exception):
-                        errors[mname] = str(res2); results[mname] = ""
-                    else:
-                        results[mname] = res2 or ""
-                    self._busy_step()
-
-            # 4) Build report (no synthesis)
-            self._busy_step("Working… Building HTML report")
-            sections = []
-            for m in selected_models:
-                raw = results.get(m, "")
-                normalized = self._normalize_model_html(raw)
-                sections.append((m, normalized))
-
-            err_link = self._save_error_log(errors) if errors else None
-            title = f"PR Review — {owner}/{repo} — #{number}: {pr_title}"
-
-            full_html = self._wrap_full_report(
-                title=title,
-                pr_url=pr_url,
-                owner=owner, repo=repo, number=number,
-                sections=sections,
-                failed=errors,
-                error_log_link=err_link,
-            )
-
-            # 5) Save
-            base = self._safe_base_filename(owner, repo, number, pr_title)
-            ts = self._now_stamp()
-            filename = f"{base}-{ts}.html"
-            path = os.path.join(STORE_DIR, filename)
-            with open(path, "w", encoding="utf-8") as f:
-                f.write(full_html)
-
-            # 6) Persist to index
-            idx = load_index()
-            idx["items"].append({
-                "id": str(uuid.uuid4()),
-                "pr_url": pr_url,
-                "html_path": path,
-                "title": pr_title,
-                "author": author,
-                "owner": owner,
-                "repo": repo,
-                "number": number,
-                "timestamp": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            })
-            save_index(idx)
-
             self.render_history()
+            self.render_model_health()
 
             # 7) Notify failures
+            errors = out["errors"]
             if errors:
                 lines = ["Some models failed:"]
                 for m, msg in errors.items():
                     lines.append(f"- {m}: {msg}")
                 messagebox.showwarning("Model Failures", "\n".join(lines))
-
-            self._busy_stop(f"Saved review → {path}")
+            if out["publish_error"]:
+                messagebox.showwarning("GitHub Review", f"Report saved, but the review was not posted:\n{out['publish_error']}")
+
+            posted = out["published"]
+            if posted and posted["dry_run"]:
+                self._busy_stop(f"Saved review → {out['path']} (GitHub review dry run: {posted['comments']} inline comment(s) printed)")
+            elif posted:
+                self._busy_stop(f"Saved review → {out['path']}; posted to GitHub → {posted['html_url']}")
+            else:
+                self._busy_stop(f"Saved review → {out['path']}")
 
         except Exception as e:
             self._busy_stop("Error")
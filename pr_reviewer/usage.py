@@ -0,0 +1,154 @@
+# usage.py
+"""
+Token and cost accounting. Every gateway call made inside track_usage() is added to that
+review's UsageLedger, labelled with the model and the part of the pipeline that made it
+("chunk 3", "consolidate", "synthesize", "packed", ...):
+
+    with track_usage() as ledger:
+        ... single_model_review(...) ...
+    item["usage"] = ledger.summary(cfg)     # stored with the review index entry
+
+The ledger lives in a contextvar, so it follows work submitted through TRACER.bind(fn) to
+worker threads. Calls outside a tracked review (file history, benchmarks) are not recorded.
+
+Cost: cfg["token_prices"] = {model: {"input": x, "output": y}} per 1K tokens; models without a
+price fall back to the registry's relative cost (base synthesizer = 1.0 per 1K tokens).
+"""
+import threading
+import contextvars
+from contextlib import contextmanager
+
+from .model_registry import model_profile
+
+_ledger: contextvars.ContextVar = contextvars.ContextVar("pr_reviewer_usage", default=None)
+_part: contextvars.ContextVar = contextvars.ContextVar("pr_reviewer_usage_part", default="call")
+
+_COUNTERS = ("calls", "prompt_tokens", "completion_tokens", "estimated_calls")
+
+
+def _zero() -> dict:
+    return {k: 0 for k in _COUNTERS}
+
+
+def token_cost(cfg: dict, model: str, prompt_tokens: float, completion_tokens: float) -> float:
+    price = (cfg.get("token_prices") or {}).get(model)
+    if price:
+        return (prompt_tokens * float(price.get("input", 0)) + completion_tokens * float(price.get("output", 0))) / 1000
+    return (prompt_tokens + completion_tokens) * float(model_profile(model)["cost"]) / 1000
+
+
+class UsageLedger:
+    """Per-review counters keyed by (model, part)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rows: dict[tuple[str, str], dict] = {}
+
+    def record(self, model: str, prompt_tokens: float, completion_tokens: float, part: str = "call",
+               estimated: bool = False, share: float = 1.0):
+        """`share` < 1 books a fraction of a call shared with other reviews (micro-batched prompts)."""
+        with self._lock:
+            row = self._rows.setdefault((model, part), _zero())
+            row["calls"] += share
+            row["prompt_tokens"] += prompt_tokens * share
+            row["completion_tokens"] += completion_tokens * share
+            row["estimated_calls"] += share if estimated else 0
+
+    def summary(self, cfg: dict) -> dict:
+        """
+        JSON-ready totals: {"calls", "prompt_tokens", "completion_tokens", "total_tokens", "cost",
+        "estimated_calls", "by_model": {model: {same keys..., "parts": {part: {...}}}}}.
+        """
+        with self._lock:
+            rows = {k: dict(v) for k, v in self._rows.items()}
+        by_model: dict[str, dict] = {}
+        for (model, part), row in sorted(rows.items()):
+            m = by_model.setdefault(model, {**_zero(), "parts": {}})
+            m["parts"][part] = _finish(cfg, model, row)
+            for k in _COUNTERS:
+                m[k] += row[k]
+        total = _zero()
+        for model, m in by_model.items():
+            m.update(_finish(cfg, model, {k: m[k] for k in _COUNTERS}))
+            for k in _COUNTERS:
+                total[k] += m[k]
+        return {
+            **{k: _round(total[k]) for k in _COUNTERS},
+            "total_tokens": _round(total["prompt_tokens"] + total["completion_tokens"]),
+            "cost": round(sum(m["cost"] for m in by_model.values()), 4),
+            "by_model": by_model,
+        }
+
+
+def _round(v: float):
+    return int(v) if v == int(v) else round(v, 2)
+
+
+def _finish(cfg: dict, model: str, row: dict) -> dict:
+    out = {k: _round(row[k]) for k in _COUNTERS}
+    out["total_tokens"] = _round(row["prompt_tokens"] + row["completion_tokens"])
+    out["cost"] = round(token_cost(cfg, model, row["prompt_tokens"], row["completion_tokens"]), 4)
+    return out
+
+
+# ---------------------------- Context ----------------------------
+@contextmanager
+def track_usage():
+    """Starts a ledger for one review; gateway calls in this context (and bound threads) land in it."""
+    ledger = UsageLedger()
+    token = _ledger.set(ledger)
+    try:
+        yield ledger
+    finally:
+        _ledger.reset(token)
+
+
+@contextmanager
+def use_ledger(ledger: UsageLedger | None):
+    """Re-enters a review's ledger on a thread that did not inherit it (micro-batch flushes)."""
+    token = _ledger.set(ledger)
+    try:
+        yield ledger
+    finally:
+        _ledger.reset(token)
+
+
+@contextmanager
+def usage_part(label: str):
+    token = _part.set(label)
+    try:
+        yield
+    finally:
+        _part.reset(token)
+
+
+def current_ledger() -> UsageLedger | None:
+    return _ledger.get()
+
+
+def record_usage(model: str, prompt_tokens: float, completion_tokens: float, estimated: bool = False):
+    """Books one call into the current review's ledger, under the current part label; no-op outside a review."""
+    ledger = _ledger.get()
+    if ledger is not None:
+        ledger.record(model, prompt_tokens, completion_tokens, _part.get(), estimated)
+
+
+# ---------------------------- Aggregation ----------------------------
+def usage_by_repo(items: list[dict]) -> dict[str, dict]:
+    """Sums the "usage" of review index items per owner/repo: {repo: {reviews, total_tokens, cost, by_model}}."""
+    out: dict[str, dict] = {}
+    for it in items:
+        u = it.get("usage") or {}
+        if not u:
+            continue
+        key = f"{it.get('owner', '')}/{it.get('repo', '')}"
+        r = out.setdefault(key, {"reviews": 0, "prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0,
+                                 "cost": 0.0, "by_model": {}})
+        r["reviews"] += 1
+        for k in ("prompt_tokens", "completion_tokens", "total_tokens", "cost"):
+            r[k] += u.get(k, 0)
+        for model, m in (u.get("by_model") or {}).items():
+            bm = r["by_model"].setdefault(model, {"total_tokens": 0, "cost": 0.0})
+            bm["total_tokens"] += m.get("total_tokens", 0)
+            bm["cost"] += m.get("cost", 0)
+    return out
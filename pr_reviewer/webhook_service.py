@@ -0,0 +1,407 @@
+# webhook_service.py
+"""
+Auto-review service: receives GitHub `pull_request` webhooks and runs the review pipeline
+(pipeline.run_review) for opened / synchronized PRs, without the desktop app.
+
+    python -m pr_reviewer.webhook_service [--config config_X.yaml] [--host 127.0.0.1] [--port 8787]
+    python -m pr_reviewer.webhook_service replay delivery1.json ... --url http://127.0.0.1:8787/webhook
+
+Point the repository/org webhook at http://<host>:<port>/webhook (content type application/json,
+event "Pull requests") with the same secret as cfg["webhook_secret"] or $GITHUB_WEBHOOK_SECRET.
+
+  - X-Hub-Signature-256 is verified (HMAC-SHA256); unsigned deliveries are rejected unless
+    started with --allow-unsigned (local testing only)
+  - one review per (repo, PR, head SHA): redeliveries and repeated events are acknowledged and dropped,
+    and a newer push to a PR still waiting in the queue replaces the older SHA instead of queueing twice
+  - each review is pinned to the event's head SHA; if the PR has moved on by the time a worker
+    picks it up, it is skipped as superseded (the newer push has its own event)
+  - bounded queue (webhook_queue_size) drained by webhook_workers threads. GitHub does not redeliver
+    failed deliveries by itself, so overflow is accepted into an on-disk spool (webhook_spool_size)
+    and fed to the queue as workers free up; queued jobs are spooled on shutdown. Only a full spool
+    answers 503 with Retry-After
+  - GET /healthz reports queue depth and in-flight reviews; metrics go to the metrics endpoint
+
+For offline tests, `replay` signs and posts saved payloads (GitHub "Recent Deliveries" bodies, or
+{"event": ..., "payload": ...} files); combine with scm_provider: replay and the mock gateway.
+"""
+import os
+import hmac
+import json
+import time
+import queue
+import hashlib
+import argparse
+import threading
+import urllib.error
+import urllib.request
+from collections import OrderedDict
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from .config import DEFAULT_CONFIG, load_config, load_last_config_path
+from .storage import STORE_DIR, ensure_store_dir
+from .tls import patch_certifi_with_pki_zip
+from .metrics import METRICS, start_metrics_server
+from .pipeline import run_review, SupersededError
+
+SEEN_PATH = os.path.join(STORE_DIR, "webhook_seen.json")
+SPOOL_PATH = os.path.join(STORE_DIR, "webhook_spool.json")
+MAX_SEEN = 5000
+
+
+def verify_signature(secret: str, body: bytes, header: str | None) -> bool:
+    if not header or not header.startswith("sha256="):
+        return False
+    expected = "sha256=" + hmac.new(secret.encode("utf-8"), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, header.strip())
+
+
+def sign(secret: str, body: bytes) -> str:
+    return "sha256=" + hmac.new(secret.encode("utf-8"), body, hashlib.sha256).hexdigest()
+
+
+class ReviewQueue:
+    """
+    Bounded, de-duplicating queue of PR reviews keyed by (repo, PR number).
+    submit() returns one of: "queued", "coalesced" (newer SHA for a PR already waiting),
+    "spooled" (queue full; kept on disk until a worker is free), "duplicate" (SHA already reviewed
+    or in flight) or "busy" (queue and spool full).
+    review_fn(cfg, pr_url, head_sha=...) runs one review (pipeline.run_review).
+    """
+
+    def __init__(self, cfg: dict, review_fn=run_review, workers: int = 2, max_pending: int = 20,
+                 seen_path: str | None = SEEN_PATH, max_spool: int = 1000, spool_path: str | None = SPOOL_PATH):
+        self.cfg = cfg
+        self.review_fn = review_fn
+        self.seen_path = seen_path
+        self.spool_path = spool_path
+        self.max_spool = max(0, max_spool)
+        self._lock = threading.Lock()
+        self._queue: queue.Queue = queue.Queue(maxsize=max(1, max_pending))
+        self._pending: dict[tuple, dict] = {}  # (repo, number) -> latest job waiting in the queue
+        self._inflight: dict[tuple, str] = {}  # (repo, number) -> head sha being reviewed
+        self._seen: OrderedDict[str, float] = self._load_seen()
+        self._spool: OrderedDict[tuple, dict] = self._load_spool()  # overflow, oldest first
+        self._stop = threading.Event()
+        self.completed = 0
+        self.failed = 0
+        self.superseded = 0
+        with self._lock:
+            self._refill()
+        self._threads = [
+            threading.Thread(target=self._worker, daemon=True, name=f"webhook-review-{i}")
+            for i in range(max(1, workers))
+        ]
+        for t in self._threads:
+            t.start()
+        METRICS.register_collector(lambda: [("pr_reviewer_queue_depth", {"queue": "webhook"}, self._queue.qsize()),
+                                            ("pr_reviewer_queue_depth", {"queue": "webhook_spool"}, len(self._spool))])
+
+    # ----- seen SHAs (persisted so restarts do not re-review) -----
+    def _load_seen(self) -> OrderedDict:
+        try:
+            with open(self.seen_path, "r", encoding="utf-8") as f:
+                return OrderedDict((k, v) for k, v in (json.load(f) or {}).items())
+        except Exception:
+            return OrderedDict()
+
+    @staticmethod
+    def _write_json(path: str, obj):
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(obj, f)
+            os.replace(tmp, path)
+        except Exception as e:
+            print(f"[WARN] Could not save webhook state: {e}")
+
+    def _save_seen(self):
+        if self.seen_path:
+            self._write_json(self.seen_path, self._seen)
+
+    @staticmethod
+    def _seen_key(key: tuple, sha: str) -> str:
+        return f"{key[0]}#{key[1]}@{sha}"
+
+    # ----- overflow spool (persisted so accepted events survive restarts) -----
+    def _load_spool(self) -> OrderedDict:
+        spool = OrderedDict()
+        try:
+            with open(self.spool_path, "r", encoding="utf-8") as f:
+                for job in json.load(f) or []:
+                    key = (job["key"][0], int(job["key"][1]))
+                    spool[key] = {"key": key, "sha": job["sha"], "pr_url": job["pr_url"]}
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"[WARN] Could not load webhook spool: {e}")
+        return spool
+
+    def _save_spool(self):
+        if self.spool_path:
+            self._write_json(self.spool_path, [{**job, "key": list(job["key"])} for job in self._spool.values()])
+
+    def _refill(self):
+        """Moves spooled jobs into the queue while it has room (caller holds the lock)."""
+        moved = False
+        while self._spool and not self._queue.full():
+            key, job = self._spool.popitem(last=False)
+            self._queue.put_nowait(job)
+            self._pending[key] = job
+            moved = True
+        if moved:
+            self._save_spool()
+
+    # ----- producer -----
+    def submit(self, repo: str, number: int, head_sha: str, pr_url: str) -> str:
+        key = (repo.lower(), int(number))
+        with self._lock:
+            if self._seen_key(key, head_sha) in self._seen or self._inflight.get(key) == head_sha:
+                return "duplicate"
+            job = self._pending.get(key) or self._spool.get(key)
+            if job is not None:
+                if job["sha"] == head_sha:
+                    return "duplicate"
+                job.update(sha=head_sha, pr_url=pr_url)  # the waiting slot reviews the newest head
+                if key in self._spool:
+                    self._save_spool()
+                return "coalesced"
+            job = {"key": key, "sha": head_sha, "pr_url": pr_url}
+            if not self._spool:  # nothing may overtake spooled jobs
+                try:
+                    self._queue.put_nowait(job)
+                except queue.Full:
+                    pass
+                else:
+                    self._pending[key] = job
+                    return "queued"
+            if len(self._spool) >= self.max_spool:
+                return "busy"
+            self._spool[key] = job
+            self._save_spool()
+            return "spooled"
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"queued": self._queue.qsize(), "spooled": len(self._spool), "inflight": len(self._inflight),
+                    "completed": self.completed, "failed": self.failed, "superseded": self.superseded,
+                    "workers": len(self._threads)}
+
+    def stop(self):
+        """Stops the workers after their current review; jobs still queued go to the spool for the next start."""
+        self._stop.set()
+        with self._lock:
+            waiting = OrderedDict()
+            while True:
+                try:
+                    job = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                self._queue.task_done()
+                self._pending.pop(job["key"], None)
+                waiting[job["key"]] = job
+            if waiting:
+                waiting.update(self._spool)
+                self._spool = waiting
+                self._save_spool()
+
+    # ----- consumers -----
+    def _worker(self):
+        while not self._stop.is_set():
+            try:
+                job = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            with self._lock:
+                self._pending.pop(job["key"], None)
+                key, sha, pr_url = job["key"], job["sha"], job["pr_url"]
+                self._inflight[key] = sha
+                self._refill()
+            try:
+                self.review_fn(self.cfg, pr_url, head_sha=sha)
+            except SupersededError as e:
+                print(f"[INFO] Skipped {pr_url} @ {sha[:7]}: {e}")
+                with self._lock:
+                    self.superseded += 1
+                    self._mark_seen(key, sha)  # never retried: the newer head has its own event
+            except Exception as e:
+                # Not marked as seen: a redelivery or the next push retries it
+                print(f"[WARN] Auto-review failed for {pr_url} @ {sha[:7]}: {e}")
+                with self._lock:
+                    self.failed += 1
+            else:
+                with self._lock:
+                    self.completed += 1
+                    self._mark_seen(key, sha)
+            finally:
+                with self._lock:
+                    if self._inflight.get(key) == sha:
+                        self._inflight.pop(key, None)
+                self._queue.task_done()
+
+    def _mark_seen(self, key: tuple, sha: str):
+        self._seen[self._seen_key(key, sha)] = time.time()
+        while len(self._seen) > MAX_SEEN:
+            self._seen.popitem(last=False)
+        self._save_seen()
+
+
+def handle_event(cfg: dict, reviews: ReviewQueue, event: str, payload: dict) -> tuple[int, str]:
+    """Maps one webhook delivery to (HTTP status, result)."""
+    if event == "ping":
+        return 200, "pong"
+    if event != "pull_request":
+        return 200, "ignored: event"
+    action = payload.get("action") or ""
+    if action not in (cfg.get("webhook_actions") or []):
+        return 200, f"ignored: action {action}"
+    pr = payload.get("pull_request") or {}
+    repo = ((payload.get("repository") or {}).get("full_name") or "").strip()
+    allowed = [r.lower() for r in (cfg.get("webhook_repos") or [])]
+    if allowed and repo.lower() not in allowed:
+        return 200, "ignored: repository"
+    if pr.get("draft") and cfg.get("webhook_skip_drafts", True):
+        return 200, "ignored: draft"
+    if (pr.get("state") or "open") != "open":
+        return 200, "ignored: closed"
+    head_sha = ((pr.get("head") or {}).get("sha") or "").strip()
+    pr_url = (pr.get("html_url") or "").strip()
+    if not (repo and head_sha and pr_url and pr.get("number")):
+        return 400, "malformed pull_request payload"
+    result = reviews.submit(repo, pr["number"], head_sha, pr_url)
+    return (503 if result == "busy" else 202 if result in ("queued", "coalesced", "spooled") else 200), result
+
+
+# ---------------------------- HTTP ----------------------------
+class _Handler(BaseHTTPRequestHandler):
+    cfg: dict = None
+    reviews: ReviewQueue = None
+    secret: str = ""
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def _reply(self, status: int, obj: dict, headers: dict | None = None):
+        body = json.dumps(obj).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "/healthz":
+            self._reply(200, {"ok": True, **self.reviews.stats()})
+        else:
+            self._reply(404, {"error": "not found"})
+
+    def do_POST(self):
+        # Read the body first, even for requests that are refused: unread bytes would be parsed as
+        # the next request on this keep-alive connection
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if self.path.split("?")[0].rstrip("/") != (self.cfg.get("webhook_path") or "/webhook").rstrip("/"):
+            self._reply(404, {"error": "not found"})
+            return
+        event = self.headers.get("X-GitHub-Event") or ""
+        if self.secret and not verify_signature(self.secret, body, self.headers.get("X-Hub-Signature-256")):
+            METRICS.inc("pr_reviewer_webhook_events_total", event=event, result="bad_signature")
+            self._reply(401, {"error": "invalid signature"})
+            return
+        try:
+            payload = json.loads(body or b"{}")
+        except ValueError:
+            self._reply(400, {"error": "invalid JSON"})
+            return
+        status, result = handle_event(self.cfg, self.reviews, event, payload)
+        METRICS.inc("pr_reviewer_webhook_events_total", event=event, result=result.split(":")[0])
+        retry = {"Retry-After": str(int(self.cfg.get("webhook_retry_after_s") or 60))} if status == 503 else None
+        self._reply(status, {"result": result, "delivery": self.headers.get("X-GitHub-Delivery", "")}, retry)
+
+
+def start_webhook_service(cfg: dict, review_fn=run_review, allow_unsigned: bool = False, port: int | None = None):
+    """Starts the HTTP listener and review workers; returns (server, reviews, base_url)."""
+    secret = (cfg.get("webhook_secret") or os.environ.get("GITHUB_WEBHOOK_SECRET") or "").strip()
+    if not secret and not allow_unsigned:
+        raise RuntimeError("Set webhook_secret (or GITHUB_WEBHOOK_SECRET); unsigned webhooks are refused.")
+    if not cfg.get("selected_models"):
+        raise RuntimeError("No models selected in the config (selected_models).")
+    reviews = ReviewQueue(cfg, review_fn, workers=int(cfg.get("webhook_workers") or 2),
+                          max_pending=int(cfg.get("webhook_queue_size") or 20),
+                          max_spool=int(cfg.get("webhook_spool_size", 1000)))
+    handler = type("WebhookHandler", (_Handler,), {"cfg": cfg, "reviews": reviews, "secret": secret})
+    host = (cfg.get("webhook_host") or "127.0.0.1").strip()
+    server = ThreadingHTTPServer((host, int(cfg.get("webhook_port") or 8787) if port is None else port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True, name="webhook").start()
+    return server, reviews, f"http://{host}:{server.server_address[1]}"
+
+
+# ---------------------------- Replay ----------------------------
+def replay_deliveries(url: str, paths: list[str], secret: str = "", event: str = "pull_request") -> list[tuple]:
+    """
+    Posts saved webhook payloads (signed when `secret` is set) and returns [(path, status, body)].
+    A file may hold the raw payload or {"event": ..., "payload": ...}.
+    """
+    out = []
+    for p in paths:
+        with open(p, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        ev, payload = (data.get("event"), data.get("payload")) if "payload" in data else (event, data)
+        body = json.dumps(payload).encode("utf-8")
+        headers = {"Content-Type": "application/json", "X-GitHub-Event": ev or event,
+                   "X-GitHub-Delivery": f"replay-{os.path.basename(p)}"}
+        if secret:
+            headers["X-Hub-Signature-256"] = sign(secret, body)
+        req = urllib.request.Request(url, data=body, headers=headers, method="POST")
+        try:
+            with urllib.request.urlopen(req, timeout=30) as r:
+                out.append((p, r.status, r.read().decode("utf-8", "replace")))
+        except urllib.error.HTTPError as e:
+            out.append((p, e.code, e.read().decode("utf-8", "replace")))
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser(description="GitHub webhook → automatic PR review")
+    sub = ap.add_subparsers(dest="cmd")
+    rp = sub.add_parser("replay", help="post saved webhook payloads to a running service")
+    rp.add_argument("files", nargs="+")
+    rp.add_argument("--url", default="http://127.0.0.1:8787/webhook")
+    rp.add_argument("--secret", default=os.environ.get("GITHUB_WEBHOOK_SECRET", ""))
+    rp.add_argument("--event", default="pull_request")
+    ap.add_argument("--config", help="config YAML (default: the desktop app's last profile)")
+    ap.add_argument("--host")
+    ap.add_argument("--port", type=int)
+    ap.add_argument("--allow-unsigned", action="store_true", help="accept unsigned deliveries (local testing)")
+    args = ap.parse_args()
+
+    if args.cmd == "replay":
+        for path, status, body in replay_deliveries(args.url, args.files, args.secret, args.event):
+            print(f"{status} {path}: {body}")
+        return
+
+    cfg_path = args.config or load_last_config_path()
+    cfg = load_config(cfg_path) if cfg_path else DEFAULT_CONFIG.copy()
+    if args.host:
+        cfg["webhook_host"] = args.host
+    if args.port:
+        cfg["webhook_port"] = args.port
+    ensure_store_dir()
+    patch_certifi_with_pki_zip(cfg)
+    start_metrics_server(cfg)
+    server, reviews, base = start_webhook_service(cfg, allow_unsigned=args.allow_unsigned)
+    print(f"Webhook service on {base}{cfg.get('webhook_path') or '/webhook'} "
+          f"({reviews.stats()['workers']} worker(s), queue {cfg.get('webhook_queue_size')}); Ctrl+C to stop")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        reviews.stop()
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+import time
+
+import httpx
+import pytest
+from openai import APITimeoutError
+
+from pr_reviewer import model_client
+from pr_reviewer.model_client import create_chat_completion, ModelTimeoutError
+from pr_reviewer.model_health import ModelHealth, OPEN, HALF_OPEN
+
+
+class _TimingOutClient:
+    """Stands in for the OpenAI client: every completion times out."""
+
+    def __init__(self):
+        self.chat = self
+        self.completions = self
+
+    def create(self, **kwargs):
+        raise APITimeoutError(request=httpx.Request("POST", "http://gateway/chat/completions"))
+
+
+def test_deadline_capped_probe_frees_the_half_open_slot(tmp_path, monkeypatch):
+    health = ModelHealth(path=str(tmp_path / "model_health.json"))
+    monkeypatch.setattr(model_client, "HEALTH", health)
+    cfg = {"circuit_breaker": True, "breaker_cooldown_s": 300, "model_call_timeout_s": 60, "hedge_requests": False}
+    entry = health._entry("m")
+    entry["state"], entry["opened_at"] = OPEN, time.time() - 3600  # cooled down: next call is the probe
+
+    with pytest.raises(ModelTimeoutError) as exc:
+        create_chat_completion(cfg, _TimingOutClient(), "m", [{"role": "user", "content": "hi"}],
+                               deadline=time.monotonic() + 5)  # shorter than model_call_timeout_s
+
+    assert exc.value.deadline_capped
+    assert "m" not in health._probing
+    assert health._models["m"]["state"] == HALF_OPEN  # no outcome recorded either way
+    assert health.allow("m", cfg)  # the next caller gets the probe